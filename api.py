@@ -1,23 +1,349 @@
-from flask import Flask, request
-import json
+from flask import Flask, Response, g, request
+from werkzeug.exceptions import BadRequest
 import os
-import io
-import random
-from datetime import datetime as dt
-
-from recognition.objectRec import ObjectInference
-from recognition.expiryRec import ExpiryInference
+import json
+import time
+import functools
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from detectors.textDetect import MAX_BATCH_SIZE
+from recognition.analysisContext import AnalysisContext, InvalidImage
+from recognition.objectRec import MODEL_FILES, DICTIONARY_FILE, TIERS, DEFAULT_TIER, ObjectInference, TierUnavailable
+from serving import metrics, tracing
+from serving.admission import AdmissionController, Overloaded
+from serving.deadline import Deadline
+from serving.modelRegistry import ModelRegistry
+from serving.resultCache import ResultCache
+from serving.metrics import StageTimer, CACHE_REQUESTS, ERRORS, REQUESTS, REQUEST_LATENCY
+from serving.singleFlight import SingleFlight
+from serving.tracing import Trace, TraceWriter
 
 
 app = Flask(__name__)
 
+# Models are loaded once per worker process and shared between requests
+registry = ModelRegistry().load()
+
+# Runs the per-image jobs of batch requests
+BATCH_WORKERS = 8
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+
+# Results are cached by image content, and dropped when the model files change.
+# Set CACHE_DB to a file path to keep results in SQLite across restarts
+CACHE_ENTRIES = 256
+CACHE_TTL = 24 * 60 * 60
+CACHE_DB = None
+cache = ResultCache(MODEL_FILES + [DICTIONARY_FILE], CACHE_ENTRIES, CACHE_TTL, CACHE_DB)
+
+# Identical requests in flight at the same time share one analysis
+flights = SingleFlight()
+
+# Set TRACE_FILE to a file path to append the span tree of every request to it as JSONL
+TRACE_FILE = None
+trace_writer = TraceWriter(TRACE_FILE) if TRACE_FILE else None
+
+# Requests processed at once, requests allowed to queue and the longest
+# time (in seconds) a request may queue for, per endpoint
+ADMISSION = {
+    'object-detection': (2, 8, 10),
+    'expiry-detection': (4, 16, 10),
+    'detection': (2, 8, 10),
+    'detection-batch': (1, 2, 30)
+}
+admission = {endpoint: AdmissionController(*limits) for endpoint, limits in ADMISSION.items()}
+
+# Longest time (in seconds) a request may take from its arrival, per endpoint.
+# OCR still outstanding when it runs out is abandoned and the image analysed
+# without its text. Clients may ask for less with an X-Request-Timeout header
+DEADLINES = {
+    'object-detection': 10,
+    'expiry-detection': 10,
+    'detection': 10,
+    'detection-batch': 60
+}
+
+
+def admitted(endpoint):
+    """
+    Decorator applying an endpoint's admission control to a view
+
+    Args:
+        endpoint (str): Name of the endpoint in ADMISSION
+
+    Returns:
+        function: The decorator
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with admission[endpoint].admit():
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@app.before_request
+def start_timer():
+    """
+    Records the time each request starts, for the request latency histogram,
+    and starts collecting the request's trace spans
+    """
+    g.request_start = time.perf_counter()
+    g.trace = Trace(request.path)
+
+
+@app.after_request
+def record_request(response):
+    """
+    Records the latency and status of each request, and adds the trace
+    collected so far to the response as a Server-Timing header
+
+    Args:
+        response (Response): The response being sent
+
+    Returns:
+        Response: The response with a Server-Timing header
+    """
+    REQUEST_LATENCY.observe(time.perf_counter() - g.request_start, get_route())
+    REQUESTS.inc(get_route(), str(response.status_code))
+
+    trace = g.trace
+    response.headers['Server-Timing'] = trace.server_timing()
+
+    # Streamed responses are still being produced, so the trace is only
+    # complete once the response is closed
+    def finish_trace():
+        trace.root.finish()
+        if trace_writer:
+            trace_writer.write(trace)
+
+    response.call_on_close(finish_trace)
+    return response
+
+
+@app.teardown_request
+def record_error(error):
+    """
+    Counts requests that failed with an unhandled exception, and stops
+    collecting trace spans in the request's thread
+
+    Args:
+        error (Exception): The exception raised, or None if the request succeeded
+    """
+    if error is not None:
+        ERRORS.inc(get_route())
+
+    if 'trace' in g:
+        g.trace.detach()
+
+
+def get_route():
+    """
+    Gets the route of the request, used to label its metrics. Requests for
+    paths without a route share one label, so scanning for paths cannot
+    create new series
+
+    Returns:
+        str: The matched route, e.g. /detection, or 'unmatched'
+    """
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+@app.errorhandler(Overloaded)
+def overloaded(error):
+    """
+    Turns a rejected request into a fast 429/503 response
+
+    Args:
+        error (Overloaded): The admission control rejection
+
+    Returns:
+        Response: A JSON error response with a Retry-After header
+    """
+    response = app.make_response((json.dumps({"error": error.reason}), error.status))
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@app.errorhandler(TierUnavailable)
+def tier_unavailable(error):
+    """
+    Turns a request for a model tier this server cannot load into a 503 response
+
+    Args:
+        error (TierUnavailable): The tier and the reason it is unavailable
+
+    Returns:
+        Response: A JSON error response
+    """
+    return app.make_response((json.dumps({"error": str(error)}), 503))
+
+
+@app.errorhandler(InvalidImage)
+def invalid_image(error):
+    """
+    Turns an upload that cannot be decoded into a 400 response
+
+    Args:
+        error (InvalidImage): The decoding failure
+
+    Returns:
+        Response: A JSON error response
+    """
+    return app.make_response((json.dumps({"error": str(error)}), 400))
+
+
+def get_tier():
+    """
+    Gets the model tier chosen by the request's tier parameter
+
+    Returns:
+        str: Name of the tier, DEFAULT_TIER if none was given
+
+    Raises:
+        BadRequest: If the tier is unknown
+        TierUnavailable: If the tier's model file is missing
+    """
+    tier = request.values.get('tier', DEFAULT_TIER)
+
+    if tier not in TIERS:
+        raise BadRequest(f"Unknown model tier '{tier}', expected one of: {', '.join(TIERS)}")
+
+    # Checked up front, so a batch request is rejected before its response starts streaming
+    if not ObjectInference.is_available(tier):
+        raise TierUnavailable(tier, f"its model file {ObjectInference.get_model_path(tier)} is missing")
+    return tier
+
+
+def get_deadline(endpoint):
+    """
+    Gets the deadline of the request, the endpoint's budget or the shorter
+    timeout asked for in the X-Request-Timeout header, counted from the
+    request's arrival
+
+    Args:
+        endpoint (str): Name of the endpoint in DEADLINES
+
+    Returns:
+        Deadline: The deadline of the request
+    """
+    budget = DEADLINES[endpoint]
+    requested = request.headers.get('X-Request-Timeout')
+
+    if requested is not None:
+        try:
+            requested = float(requested)
+        except ValueError:
+            raise BadRequest(f"Invalid X-Request-Timeout '{requested}', expected a number of seconds")
+
+        if not requested > 0:
+            raise BadRequest("X-Request-Timeout must be a positive number of seconds")
+        budget = min(budget, requested)
+
+    return Deadline(budget, g.request_start)
+
+
+def analyse(endpoint, context, analyser, params=""):
+    """
+    Runs an analysis on the request image, reusing the cached result if
+    the same image has already been analysed by the endpoint
+
+    Args:
+        endpoint (str): Name of the endpoint, used in the cache key
+        context (AnalysisContext): The context holding the request image
+        analyser (function): Function producing the result from the context
+        params (str): Request options that change the result, used in the cache key
+
+    Returns:
+        tuple: The JSON serialisable result and the cache status ('HIT', 'MISS' or 'COALESCED')
+    """
+    key = cache.make_key(context.image_bytes, endpoint, params)
+    result = cache.get(key)
+
+    if result is not None:
+        CACHE_REQUESTS.inc('hit')
+        return result, 'HIT'
+
+    return analyse_uncached(key, context, analyser)
+
+
+def analyse_uncached(key, context, analyser):
+    """
+    Runs an analysis and caches its result. Identical requests arriving while
+    the analysis is running wait for it rather than starting their own. Results
+    made without the image's text, as OCR missed the deadline or failed, are
+    not cached, so a retry gets another chance at reading it
+
+    Args:
+        key (str): The cache key of the request
+        context (AnalysisContext): The context holding the request image
+        analyser (function): Function producing the result from the context
+
+    Returns:
+        tuple: The JSON serialisable result and the cache status ('MISS' or 'COALESCED')
+    """
+    def run():
+        result = analyser(context)
+        if context.ocr_failure is None:
+            cache.set(key, result)
+        return result, context.ocr_failure
+
+    (result, ocr_failure), shared = flights.do(key, run)
+    context.ocr_failure = ocr_failure
+    CACHE_REQUESTS.inc('coalesced' if shared else 'miss')
+    return result, 'COALESCED' if shared else 'MISS'
+
+
+def respond(endpoint, analyser, params=""):
+    """
+    Analyses the image uploaded with the request and builds the response
+
+    Args:
+        endpoint (str): Name of the endpoint, used in the cache key
+        analyser (function): Function producing the result from the context
+        params (str): Request options that change the result, used in the cache key
+
+    Returns:
+        Response: A flask response holding the JSON result, with an X-Cache header
+                  (HIT, MISS or COALESCED), an X-Stage-Timings header giving the
+                  duration of each stage in milliseconds as a JSON object, if the
+                  image was sent for OCR, an X-OCR-Input header giving the bytes
+                  uploaded and sent and, if the result was made without the text,
+                  an X-OCR-Status header of 'timeout' if OCR missed the deadline
+                  or 'unavailable' if every OCR attempt failed
+    """
+    with StageTimer('upload_read'):
+        image_bytes = request.files['image'].read()
+    context = AnalysisContext(image_bytes, registry.text_detector, get_deadline(endpoint))
+
+    result, cache_status = analyse(endpoint, context, analyser, params)
+
+    with StageTimer('serialisation', context.timings):
+        body = json.dumps(result)
+
+    response = app.make_response(body)
+    timings = {stage: round(seconds * 1000, 2) for stage, seconds in context.timings.items()}
+    response.headers['X-Stage-Timings'] = json.dumps(timings)
+    response.headers['X-Cache'] = cache_status
+
+    ocr_stats = context.get_ocr_stats()
+    if ocr_stats is not None:
+        response.headers['X-OCR-Input'] = json.dumps(ocr_stats)
+
+    if context.ocr_failure is not None:
+        response.headers['X-OCR-Status'] = context.ocr_failure
+    return response
+
 
 @app.route('/object-detection', methods=['POST'])
+@admitted('object-detection')
 def object_detection():
     """
     POST ENDPOINT: Runs the object recognition algorithm
     on a given image. Can output predictions for one or
-    more objects per image.
+    more objects per image. The optional tier parameter
+    chooses the model used
 
     Returns:
         json: A structure containing analysis of the image
@@ -25,27 +351,12 @@ def object_detection():
     assert request.path == '/object-detection'
     assert request.method == 'POST'
 
-    objectInference = ObjectInference()
-
-    file = request.files['image']
-    timestamp = dt.now().strftime("%d%m%Y%H%M%S")
-    rand = str(random.randint(1, 10000))
-
-    path = os.path.join('./temp', timestamp + rand)
-    file.save(path)
-
-    image_file = io.open(path, 'rb')
-    image_bytes = image_file.read()
-
-    predictions = objectInference.run_inference(image_bytes)
-    os.remove(path)
-
-    predictions = objectInference.final_predictions(predictions)
-
-    return json.dumps(objectInference.final_predictions(predictions))
+    tier = get_tier()
+    return respond('object-detection', functools.partial(run_object_detection, tier=tier), tier)
 
 
 @app.route('/expiry-detection', methods=['POST'])
+@admitted('expiry-detection')
 def expiry_detection():
     """
     POST ENDPOINT: Runs the expiry date detection algorithm
@@ -56,37 +367,18 @@ def expiry_detection():
     """
     assert request.path == '/expiry-detection'
     assert request.method == 'POST'
-    prediction = {}
-
-    file = request.files['image']
-    timestamp = dt.now().strftime("%d%m%Y%H%M%S")
-    rand = str(random.randint(1, 10000))
 
-    path = os.path.join('./temp', timestamp + rand)
-    file.save(path)
-
-    image_file = io.open(path, 'rb')
-    image_bytes = image_file.read()
-
-    expiryInference = ExpiryInference()
-    datetime = expiryInference.run_inference(path, image_bytes, None)
-    os.remove(path)
-
-    datetime = str(datetime)
-    if datetime:
-        prediction['expiryDate'] = datetime
-    else:
-        prediction['expiryDate'] = None
-
-    return json.dumps(prediction)
+    return respond('expiry-detection', run_expiry_detection)
 
 
 @app.route('/detection', methods=['POST'])
+@admitted('detection')
 def detection():
     """
     POST ENDPOINT: Runs the object recognition & expiry date detection
     algorithms on a single given image. Largest detected bounding box
-    chosen for expiry detection due to single object limitation
+    chosen for expiry detection due to single object limitation. The
+    optional tier parameter chooses the model used
 
     Returns:
         json: A structure containing analysis of the image
@@ -94,31 +386,190 @@ def detection():
     assert request.path == '/detection'
     assert request.method == 'POST'
 
-    inference = ObjectInference()
-    expiryInference = ExpiryInference()
+    tier = get_tier()
+    return respond('detection', functools.partial(run_detection, tier=tier), tier)
+
+
+@app.route('/detection/batch', methods=['POST'])
+def detection_batch():
+    """
+    POST ENDPOINT: Runs the object recognition & expiry date detection
+    algorithms on several images, e.g. the photos from a stock take.
+    The images are detected and sent for OCR in batches, and a result
+    is streamed back as a line of NDJSON as soon as each image finishes.
+    The optional tier parameter chooses the model used
+
+    Returns:
+        ndjson: One structure per image containing its index, filename and
+                analysis, or an error message if the analysis failed
+    """
+    assert request.path == '/detection/batch'
+    assert request.method == 'POST'
+
+    tier = get_tier()
+
+    # The slot is held until the streamed response has been fully sent
+    admitted_at = admission['detection-batch'].acquire()
+    try:
+        response = Response(stream_detection_batch(tier), mimetype='application/x-ndjson')
+    except BaseException:
+        admission['detection-batch'].release(admitted_at)
+        raise
+
+    response.call_on_close(lambda: admission['detection-batch'].release(admitted_at))
+    return response
+
+
+def stream_detection_batch(tier):
+    """
+    Analyses the images uploaded with a batch request
+
+    Args:
+        tier (str): Name of the model tier to detect objects with
+
+    Returns:
+        generator: Yields a line of NDJSON for each image as it finishes
+    """
+    files = request.files.getlist('images')
+    deadline = get_deadline('detection-batch')
+    with StageTimer('upload_read'):
+        contexts = [AnalysisContext(file.read(), registry.text_detector, deadline) for file in files]
+    filenames = [file.filename for file in files]
+
+    # Previously analysed images are answered straight from the cache
+    keys = [cache.make_key(context.image_bytes, 'detection', tier) for context in contexts]
+    cached = {}
+    pending = []
+    for index, context in enumerate(contexts):
+        result = cache.get(keys[index])
+
+        if result is not None:
+            CACHE_REQUESTS.inc('hit')
+            cached[index] = result
+        else:
+            pending.append(index)
+
+    # Send the remaining images for OCR in batches rather than one request per image.
+    # Repeats of an image within the request share the OCR result of the first
+    unique = sorted({keys[index]: index for index in reversed(pending)}.values())
+    texts_futures = {}
+    for start in range(0, len(unique), MAX_BATCH_SIZE):
+        chunk = unique[start:start + MAX_BATCH_SIZE]
+        texts_future = batch_executor.submit(contextvars.copy_context().run, _detect_texts,
+                                             [contexts[index] for index in chunk], deadline)
+
+        # Words are mapped back from the reduced images sent for OCR
+        for offset, index in enumerate(chunk):
+            texts_futures[keys[index]] = _item_future(texts_future, offset,
+                                                      lambda texts, context=contexts[index]:
+                                                      context.ocr_input.map_back(texts))
+
+    for index in pending:
+        contexts[index].use_texts_from(texts_futures[keys[index]])
+
+    # Detector calls from the concurrent jobs are grouped by the batch scheduler
+    analyser = functools.partial(run_detection, tier=tier)
+    futures = {batch_executor.submit(contextvars.copy_context().run, analyse_uncached,
+                                     keys[index], contexts[index], analyser): index
+               for index in pending}
+
+    def generate():
+        for index, prediction in cached.items():
+            yield json.dumps({"index": index, "filename": filenames[index], "prediction": prediction}) + '\n'
+
+        for future in as_completed(futures):
+            index = futures[future]
+            result = {"index": index, "filename": filenames[index]}
+
+            try:
+                result["prediction"] = future.result()[0]
+            except Exception as e:
+                ERRORS.inc('/detection/batch')
+                result["error"] = str(e)
+
+            if contexts[index].ocr_failure is not None:
+                result["ocr_status"] = contexts[index].ocr_failure
+
+            with StageTimer('serialisation'):
+                line = json.dumps(result) + '\n'
+            yield line
+
+    return generate()
+
+
+def run_object_detection(context, tier=DEFAULT_TIER):
+    """
+    Runs the object recognition algorithm on a single image
+
+    Args:
+        context (AnalysisContext): The context holding the request image
+        tier (str): Name of the model tier to detect objects with
+
+    Returns:
+        list: The final predictions for each detected object
+    """
+    objectInference = registry.get_object_inference()
+
+    predictions = objectInference.run_inference(context.image_bytes, context, tier)
+
+    predictions = objectInference.final_predictions(predictions)
+
+    return objectInference.final_predictions(predictions)
+
 
-    file = request.files['image']
-    timestamp = dt.now().strftime("%d%m%Y%H%M%S")
-    rand = str(random.randint(1, 10000))
+def run_expiry_detection(context):
+    """
+    Runs the expiry date detection algorithm on a single image
 
-    path = os.path.join('./temp', timestamp + rand)
-    file.save(path)
+    Args:
+        context (AnalysisContext): The context holding the request image
 
-    image_file = io.open(path, 'rb')
-    image_bytes = image_file.read()
+    Returns:
+        dict: The expiry date prediction
+    """
+    prediction = {}
 
-    predictions = inference.run_inference(image_bytes)
-    predictions = inference.final_predictions(predictions)
+    expiryInference = registry.get_expiry_inference()
+    datetime = expiryInference.run_inference(context.image_bytes, None, context)
+
+    datetime = str(datetime)
+    if datetime:
+        prediction['expiryDate'] = datetime
+    else:
+        prediction['expiryDate'] = None
+
+    return prediction
+
+
+def run_detection(context, tier=DEFAULT_TIER):
+    """
+    Runs the object recognition & expiry date detection algorithms on a
+    single image, using the largest detected object for expiry detection
+
+    Args:
+        context (AnalysisContext): The context holding the request image
+        tier (str): Name of the model tier to detect objects with
+
+    Returns:
+        dict: The analysis of the largest detected object and its expiry date
+    """
+    inference = registry.get_object_inference()
+    expiryInference = registry.get_expiry_inference()
+
+    with tracing.span('object_inference'):
+        predictions = inference.run_inference(context.image_bytes, context, tier)
+        predictions = inference.final_predictions(predictions)
 
     prediction = inference.get_largest_item(predictions)
 
     if prediction:
         predicted_class = prediction['predicted_class']
     else:
+        prediction = {}
         predicted_class = None
 
-    datetime = expiryInference.run_inference(path, image_bytes, predicted_class)
-    os.remove(path)
+    with tracing.span('expiry_inference'):
+        datetime = expiryInference.run_inference(context.image_bytes, predicted_class, context)
 
     datetime = str(datetime)
     if datetime:
@@ -126,7 +577,103 @@ def detection():
     else:
         prediction['expiry_date'] = None
 
-    return json.dumps(prediction)
+    return prediction
+
+
+def _detect_texts(contexts, deadline=None):
+    """
+    Sends the images of several requests for OCR in one batch
+
+    Args:
+        contexts (list): The contexts holding the request images
+        deadline (Deadline): Optional deadline of the request
+
+    Returns:
+        list: The OCR result of each image, in the coordinates of the reduced
+              images sent, see AnalysisContext.ocr_input, or the error raised
+              for that image
+    """
+    # Images that cannot be decoded are left out of the OCR call
+    results = {}
+    contents = {}
+    for index, context in enumerate(contexts):
+        try:
+            contents[index] = context.ocr_input.content
+        except InvalidImage as e:
+            results[index] = e
+
+    results.update(zip(contents, registry.text_detector.get_texts(list(contents.values()), deadline)))
+    return [results[index] for index in range(len(contexts))]
+
+
+def _item_future(batch_future, index, transform=None):
+    """
+    Creates a future resolving to a single item of a batched result
+
+    Args:
+        batch_future (Future): Resolves to a list of results, which may hold
+                               the error raised for a single item
+        index (int): The index of the wanted result
+        transform (function): Optional function applied to the result
+
+    Returns:
+        Future: Resolves to the result at the given index, or raises its error
+    """
+    future = Future()
+
+    def resolve(done):
+        try:
+            result = done.result()[index]
+            if isinstance(result, Exception):
+                raise result
+            future.set_result(transform(result) if transform else result)
+        except Exception as e:
+            future.set_exception(e)
+
+    batch_future.add_done_callback(resolve)
+    return future
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    GET ENDPOINT: Exposes request and per-stage latency histograms and
+    error, cache and OCR counters for this worker. Each value carries a
+    worker label, as a scrape reaches only one of the pre-forked workers
+
+    Returns:
+        text: The metrics in Prometheus text exposition format
+    """
+    assert request.path == '/metrics'
+    assert request.method == 'GET'
+
+    return Response(metrics.render({"worker": str(os.getpid())}), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/status', methods=['GET'])
+def status():
+    """
+    GET ENDPOINT: Reports the load time and memory footprint
+    of the models held by this worker, the state of the batch
+    scheduler of each loaded model tier and of the OCR batching,
+    the result cache counters and the number of coalesced requests
+    and the admission control queue depths and rejections
+
+    Returns:
+        json: A structure containing the model registry statistics
+    """
+    assert request.path == '/status'
+    assert request.method == 'GET'
+
+    return json.dumps({
+        "models": registry.get_stats(),
+        "scheduler": {tier: batch_scheduler.get_stats()
+                      for tier, (_, batch_scheduler) in registry.get_object_inference().get_tiers().items()},
+        "ocr": registry.text_detector.get_stats(),
+        "cache": cache.get_stats(),
+        "coalescing": flights.get_stats(),
+        "admission": {endpoint: controller.get_stats() for endpoint, controller in admission.items()}
+    })
 
 
 if __name__ == '__main__':
@@ -168,7 +715,7 @@ if __name__ == '__main__':
     #     else:
     #         predicted_class = None
     #
-    #     date = expiryInference.run_inference(predicted_class, image_bytes)
+    #     date = expiryInference.run_inference(image_bytes, predicted_class)
     #     print(date)
     #
     #     t_finish = time.perf_counter()
@@ -0,0 +1,193 @@
+import time
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+from serving import tracing
+
+
+class BatchScheduler:
+    # Names of the trace spans added to each caller's request
+    QUEUE_SPAN = "batch_queue_wait"
+    BATCH_SPAN = "batch_forward"
+
+    def __init__(self, object_detector, max_batch_size=4, max_wait=0.01):
+        """
+        Constructor for BatchScheduler class. Queues images sent by concurrent
+        callers and runs them through the object detector in batches, so that
+        several requests share a single forward pass.
+
+        Args:
+            object_detector (ObjectDetector): Detector providing get_pred_lists
+            max_batch_size (int): The largest number of images run in one forward pass
+            max_wait (float): The longest time (in seconds) the first queued image
+                              waits for others to join its batch
+        """
+        self.object_detector = object_detector
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.batch_sizes = Counter()
+        self.total_requests = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def get_pred_list(self, image):
+        """
+        Gets predicted classes for an image, blocking until its batch has run
+
+        Args:
+            image (np.array): an image of shape (H, W, C) (in BGR order).
+
+        Returns:
+            output (list): Predictions in the format [{class: class1, bbox: x1, y1, x2, y2}]
+        """
+        return self.run(image)
+
+    def run(self, item):
+        """
+        Queues an item and blocks until its batch has run
+
+        Args:
+            item: The item to add to a batch, e.g. an image
+
+        Returns:
+            The result for the item
+        """
+        future = self.submit(item)
+        result = future.result()
+
+        # The batch ran in the scheduler's thread, so add its timings to the caller's trace
+        for name, start, end in future.spans:
+            tracing.record_span(name, start, end)
+        return result
+
+    def get_pred_lists(self, images):
+        """
+        Gets predicted classes for several images, which may be split over
+        more than one batch
+
+        Args:
+            images (list): A list of images of shape (H, W, C) (in BGR order).
+
+        Returns:
+            output (list): A list holding the get_pred_list output of each image
+        """
+        futures = [self.submit(image) for image in images]
+        return [future.result() for future in futures]
+
+    def submit(self, image):
+        """
+        Adds an image to the queue
+
+        Args:
+            image (np.array): an image of shape (H, W, C) (in BGR order).
+
+        Returns:
+            Future: Resolves to the predictions for the image
+        """
+        # The worker is started on first use rather than in the constructor,
+        # so the scheduler can be created before a process forks
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+                self._thread.start()
+
+        future = Future()
+        self.queue.put((image, future, time.perf_counter()))
+        return future
+
+    def get_stats(self):
+        """
+        Summarises the queue and the batches run so far
+
+        Returns:
+            dict: Queue depth, batch size distribution and queue wait times (in seconds)
+        """
+        batches = sum(self.batch_sizes.values())
+
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait": self.max_wait,
+            "batches": batches,
+            "requests": self.total_requests,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "mean_batch_size": self.total_requests / batches if batches else 0,
+            "mean_wait": self.total_wait / self.total_requests if self.total_requests else 0,
+            "max_wait_seen": self.max_wait_seen
+        }
+
+    def _collect_batch(self):
+        """
+        Blocks until an image is queued, then gathers further images until the
+        batch is full or the first image has waited for max_wait seconds
+
+        Returns:
+            list: A list of (image, future, enqueue time) tuples
+        """
+        batch = [self.queue.get()]
+        deadline = batch[0][2] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """
+        Worker loop running queued images through the detector batch by batch
+        """
+        while True:
+            batch = self._collect_batch()
+            t_start = time.perf_counter()
+
+            # Skip callers that have already given up on their result
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            waits = [t_start - item[2] for item in batch]
+            self.batch_sizes[len(batch)] += 1
+            self.total_requests += len(batch)
+            self.total_wait += sum(waits)
+            self.max_wait_seen = max(self.max_wait_seen, max(waits))
+
+            try:
+                results = self._run_batch([item[0] for item in batch])
+            except Exception as e:
+                for item in batch:
+                    item[1].set_exception(e)
+                continue
+
+            # An error returned for a single item only fails its own caller
+            t_finish = time.perf_counter()
+            for item, result in zip(batch, results):
+                item[1].spans = [(self.QUEUE_SPAN, item[2], t_start),
+                                 (self.BATCH_SPAN, t_start, t_finish)]
+                if isinstance(result, Exception):
+                    item[1].set_exception(result)
+                else:
+                    item[1].set_result(result)
+
+    def _run_batch(self, items):
+        """
+        Args:
+            items (list): The queued images of a batch
+
+        Returns:
+            list: The result of each image, or the error raised for that image
+                  alone, in the same order
+        """
+        return self.object_detector.get_pred_lists(items)
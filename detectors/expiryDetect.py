@@ -1,3 +1,4 @@
+import io
 import re
 import calendar
 import exifread
@@ -27,7 +28,7 @@ class ExpiryDetector:
         Further splits strings containing matching month names
 
         Args:
-            texts (dict): A dictionary containing detection & bbox {detected_word1: bbox1, detected_word2: bbox2}
+            texts (iterable): The detected words in reading order, e.g. an OcrResult
 
         Returns
             list: The resulting list of words post split
@@ -377,24 +378,23 @@ class ExpiryDetector:
         return False
 
     @staticmethod
-    def get_capture_date(path):
+    def get_capture_date(image_bytes):
         """
         Gets an image's capture datetime from its EXIF tag data
 
         Args:
-            path (str): The path to the image
+            image_bytes (bytes): An image stored as a bytes object
 
         Returns:
             datetime: The datetime object representing the image capture datetime
         """
         try:
-            with open(path, 'rb') as fh:
-                tags = exifread.process_file(fh, stop_tag="EXIF DateTimeOriginal")
-                capture_date = str(tags["EXIF DateTimeOriginal"])
+            tags = exifread.process_file(io.BytesIO(image_bytes), stop_tag="EXIF DateTimeOriginal")
+            capture_date = str(tags["EXIF DateTimeOriginal"])
 
-                capture_date_split = capture_date.split(' ')[0]
-                capture_date_delim = capture_date_split.replace(':', '/')
-                ret = dateparser.parse(capture_date_delim)
+            capture_date_split = capture_date.split(' ')[0]
+            capture_date_delim = capture_date_split.replace(':', '/')
+            ret = dateparser.parse(capture_date_delim)
         except KeyError:
             ret = None
         return ret
@@ -1,4 +1,5 @@
 import cv2
+import torch
 import numpy as np
 
 from detectron2.data import MetadataCatalog
@@ -6,6 +7,8 @@ from detectron2.engine import DefaultPredictor
 from detectron2.utils.visualizer import Visualizer, ColorMode, GenericMask
 from detectron2.utils.logger import setup_logger
 
+from serving.metrics import StageTimer
+
 
 class ObjectDetector:
     def __init__(self, cfg, logging=True):
@@ -22,13 +25,38 @@ class ObjectDetector:
 
         self.cpu_device = "cpu"
         self.instance_mode = ColorMode.IMAGE
-        self.predictor = DefaultPredictor(cfg)
+        self.backend = cfg.QST.BACKEND if "QST" in cfg else "torch"
+        self.precision = cfg.QST.PRECISION if "QST" in cfg else "fp32"
+        self.mask_on = cfg.MODEL.MASK_ON
+        self.predictor = self._build_predictor(cfg)
         self.logging = logging
         self.classes = None
         self.metadata = None
         self.predictions = None
         self.image = None
 
+    def _build_predictor(self, cfg):
+        """
+        Creates the predictor for the configured inference backend
+
+        Args:
+            cfg (CfgNode): Detectron2 config file
+
+        Returns:
+            DefaultPredictor or OnnxPredictor: A callable predictor with a model attribute
+        """
+        if self.backend == "onnx":
+            # onnxruntime is only needed, and so only imported, when the backend is used
+            from detectors.onnxPredictor import OnnxPredictor
+            return OnnxPredictor(cfg)
+        elif self.backend == "torch" and self.precision == "int8":
+            from detectors.quantisation import build_int8_predictor
+            return build_int8_predictor(cfg)
+        elif self.backend == "torch":
+            return DefaultPredictor(cfg)
+        else:
+            raise ValueError(f"Unknown inference backend: {self.backend}")
+
     def register_metadata(self, classes, name="custom_train"):
         """
         Saves an annotations file to the metadata catalog and assigns a list of classes
@@ -63,11 +91,15 @@ class ObjectDetector:
         classes = self.predictions['instances'].pred_classes.cpu().numpy().tolist()
         scores = self.predictions['instances'].scores.cpu().numpy().tolist()
 
-        masks = np.asarray(self.predictions['instances'].pred_masks)
         height = image.shape[0]
         width = image.shape[1]
 
-        masks = self._bitmask_to_polygons(masks, width, height)
+        # Models run without the mask head only predict boxes
+        if self.predictions['instances'].has('pred_masks'):
+            masks = np.asarray(self.predictions['instances'].pred_masks)
+            masks = self._bitmask_to_polygons(masks, width, height)
+        else:
+            masks = [None] * len(classes)
 
         for index, cls in enumerate(classes):
             # Retrieve textual label
@@ -99,24 +131,97 @@ class ObjectDetector:
         Returns:
             output (list): Predictions in the format [{class: class1, bbox: x1, y1, x2, y2}]
         """
-        ret = []
         assert self.metadata, "No metadata found, please run register_metadata."
         self.image = image
 
         # Get predictions for the image
-        self.predictions = self.predictor(image)
+        with StageTimer('detectron2_forward'):
+            self.predictions = self.predictor(image)
+
+        return self._decompose_predictions(self.predictions, image)
+
+    def get_pred_lists(self, images):
+        """
+        Gets predicted classes for a batch of images using a single forward pass
+        through the model. Unlike get_pred_list, the predictions are not kept for
+        visualisation.
+
+        Args:
+            images (list): A list of images of shape (H, W, C) (in BGR order).
+
+        Returns:
+            output (list): A list holding the get_pred_list output of each image,
+                           or the error raised while preparing that image
+        """
+        assert self.metadata, "No metadata found, please run register_metadata."
+
+        # Apply the same pre-processing as the DefaultPredictor to each image.
+        # An image that cannot be prepared only fails its own request
+        inputs = {}
+        results = [None] * len(images)
+        for index, original_image in enumerate(images):
+            try:
+                inputs[index] = self._prepare_input(original_image)
+            except Exception as e:
+                results[index] = e
+
+        if inputs:
+            with torch.no_grad(), StageTimer('detectron2_forward'):
+                batch_predictions = self.predictor.model(list(inputs.values()))
+
+            for index, predictions in zip(inputs, batch_predictions):
+                results[index] = self._decompose_predictions(predictions, images[index])
+        return results
+
+    def _prepare_input(self, original_image):
+        """
+        Args:
+            original_image (np.array): an image of shape (H, W, C) (in BGR order).
+
+        Returns:
+            dict: The resized image as a (C, H, W) tensor, with its original height and width
+        """
+        if original_image is None:
+            raise ValueError("No image to detect objects in")
+
+        if self.predictor.input_format == "RGB":
+            original_image = original_image[:, :, ::-1]
+
+        height, width = original_image.shape[:2]
+        image = self._get_resize().get_transform(original_image).apply_image(original_image)
+        image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
+        return {"image": image, "height": height, "width": width}
+
+    def _decompose_predictions(self, predictions, image):
+        """
+        Converts the raw model output for a single image into a list of predictions
+
+        Args:
+            predictions (dict): Model output for an image, containing an 'instances' field
+            image (np.array): The image the predictions were made for
+
+        Returns:
+            output (list): Predictions in the format [{class: class1, bbox: x1, y1, x2, y2}]
+        """
+        ret = []
 
         # Decompose prediction object
-        boxes = self.predictions['instances'].pred_boxes.tensor.cpu().numpy().tolist()
-        classes = self.predictions['instances'].pred_classes.cpu().numpy().tolist()
-        scores = self.predictions['instances'].scores.cpu().numpy().tolist()
-        masks = np.asarray(self.predictions['instances'].pred_masks)
+        boxes = predictions['instances'].pred_boxes.tensor.cpu().numpy().tolist()
+        classes = predictions['instances'].pred_classes.cpu().numpy().tolist()
+        scores = predictions['instances'].scores.cpu().numpy().tolist()
 
         height = image.shape[0]
         width = image.shape[1]
 
-        # Convert the masks to polygon masks
-        masks = self._bitmask_to_polygons(masks, width, height)
+        # Convert the masks to polygon masks. Models run without the mask head
+        # only predict boxes, so their detections have no mask
+        if predictions['instances'].has('pred_masks'):
+            masks = np.asarray(predictions['instances'].pred_masks.cpu())
+
+            with StageTimer('mask_polygonisation'):
+                masks = self._bitmask_to_polygons(masks, width, height)
+        else:
+            masks = [None] * len(classes)
 
         for index, cls in enumerate(classes):
             # Retrieve textual label
@@ -134,6 +239,19 @@ class ObjectDetector:
             ret.append(pack)
         return ret
 
+    def _get_resize(self):
+        """
+        Gets the resize augmentation used by the DefaultPredictor, which was
+        renamed from transform_gen to aug in later detectron2 releases
+
+        Returns:
+            ResizeShortestEdge: The test-time resize augmentation
+        """
+        try:
+            return self.predictor.aug
+        except AttributeError:
+            return self.predictor.transform_gen
+
     def display_result(self):
         """
         Used to visualise the predicted classes and masks on the image
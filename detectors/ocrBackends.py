@@ -0,0 +1,428 @@
+import os
+import json
+import hashlib
+import threading
+
+import cv2
+import numpy as np
+
+from detectors.ocrResult import OcrResult
+
+# Page segmentation mode 11 finds as much sparse text as possible in no
+# particular order, which suits product labels better than page layouts
+TESSERACT_CONFIG = "--oem 1 --psm 11"
+TESSERACT_MIN_CONFIDENCE = 30
+FIXTURES_FOLDER = "resources/ocr_fixtures"
+
+# Number of Google Vision API clients, each with its own gRPC channel, shared
+# by every TextDetector in a process
+VISION_CLIENT_POOL_SIZE = 2
+
+# gRPC status codes of Vision API errors that may succeed when retried:
+# RESOURCE_EXHAUSTED, INTERNAL, UNAVAILABLE and DEADLINE_EXCEEDED
+VISION_TRANSIENT_CODES = {8, 13, 14, 4}
+
+
+class OcrError(Exception):
+    def __init__(self, message, transient=False):
+        """
+        Raised when an OCR engine fails to read an image
+
+        Args:
+            message (str): Description of the failure
+            transient (bool): Whether the same image may succeed if sent again
+        """
+        super().__init__(message)
+        self.transient = transient
+
+
+class ClientPool:
+    def __init__(self, factory, size=1):
+        """
+        Constructor for ClientPool class, a process-wide set of API clients
+        handed out in turn, so channels are set up once per process rather
+        than once per caller. Clients cannot be shared across a fork, so a
+        forked process creates its own on first use
+
+        Args:
+            factory (function): Creates a client
+            size (int): Number of clients
+        """
+        self.factory = factory
+        self.size = size
+        self.clients = []
+        self.pid = None
+        self.created = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns:
+            The next client of the pool, creating the clients if this is the
+            first call in this process
+        """
+        with self._lock:
+            if self.pid != os.getpid():
+                self.clients = [self.factory() for _ in range(self.size)]
+                self.pid = os.getpid()
+                self.created += self.size
+
+            client = self.clients[self._next % self.size]
+            self._next += 1
+        return client
+
+
+def _create_vision_client():
+    """
+    Returns:
+        ImageAnnotatorClient: A new Google Vision API client
+    """
+    from google.cloud import vision
+
+    return vision.ImageAnnotatorClient()
+
+
+VISION_CLIENTS = ClientPool(_create_vision_client, VISION_CLIENT_POOL_SIZE)
+
+
+class OcrBackend:
+    """
+    Interface of the OCR engines behind TextDetector. Each backend converts
+    its engine's output into an OcrResult, with lower case text and the four
+    (x, y) corners of each word, in reading order.
+    """
+
+    # Whether sending several images in one annotate_batch call is cheaper than
+    # sending them one at a time, in which case TextDetector batches callers
+    batches_requests = False
+
+    def connect(self):
+        """
+        Creates any client or connection the engine needs. Also used to replace
+        them in a forked process
+        """
+
+    def annotate(self, content, timeout=None):
+        """
+        Detects the text in an image
+
+        Args:
+            content (bytes): An image stored as a bytes object
+            timeout (float): Optional time (in seconds) after which the engine
+                             gives up on the image
+
+        Returns:
+            OcrResult: The detected words
+        """
+        raise NotImplementedError
+
+    def annotate_batch(self, contents, timeout=None):
+        """
+        Detects the text in several images. Engines that accept several images
+        in one call override this, the rest annotate the images one at a time
+
+        Args:
+            contents (list): A list of images stored as bytes objects
+            timeout (float): Optional time (in seconds) after which the engine
+                             gives up on each image
+
+        Returns:
+            list: The annotate output of each image, or the error raised for
+                  that image, in the same order
+        """
+        results = []
+
+        for content in contents:
+            try:
+                results.append(self.annotate(content, timeout))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def is_transient(self, error):
+        """
+        Args:
+            error (Exception): An error raised by annotate or annotate_batch
+
+        Returns:
+            bool: Whether sending the same images again may succeed
+        """
+        if isinstance(error, OcrError):
+            return error.transient
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class GoogleVisionBackend(OcrBackend):
+    batches_requests = True
+
+    def __init__(self, clients=VISION_CLIENTS):
+        """
+        Constructor for GoogleVisionBackend class, sending images to the Google
+        Vision API
+
+        Args:
+            clients (ClientPool): The pool of API clients to send requests with
+        """
+        self.clients = clients
+        self.connect()
+
+    @property
+    def client(self):
+        """
+        Returns:
+            ImageAnnotatorClient: A client from the process's pool
+        """
+        return self.clients.get()
+
+    def connect(self):
+        """
+        Makes sure the process has its Google Vision API clients. gRPC channels
+        cannot be shared across a fork, so each worker creates its own
+        """
+        self.clients.get()
+
+    def annotate(self, content, timeout=None):
+        """
+        Args:
+            content (bytes): An image stored as a bytes object
+            timeout (float): Optional time (in seconds) after which the request
+                             is abandoned
+
+        Returns:
+            OcrResult: The detected words
+        """
+        from google.cloud import vision
+
+        image = vision.types.Image(content=content)
+        response = self.client.text_detection(image=image, timeout=timeout)
+        return self._parse_response(response)
+
+    def annotate_batch(self, contents, timeout=None):
+        """
+        Sends several images in a single batch request
+
+        Args:
+            contents (list): A list of images stored as bytes objects
+            timeout (float): Optional time (in seconds) after which the request
+                             is abandoned
+
+        Returns:
+            list: The annotate output of each image, or the OcrError of an image
+                  the API could not read, in the same order
+        """
+        from google.cloud import vision
+
+        feature = vision.types.Feature(type=vision.enums.Feature.Type.TEXT_DETECTION)
+        requests = [vision.types.AnnotateImageRequest(image=vision.types.Image(content=content), features=[feature])
+                    for content in contents]
+
+        # Retries are left to the caller, which knows how long the request has left
+        response = self.client.batch_annotate_images(requests, retry=None, timeout=timeout)
+
+        # One bad image must not fail the others sent with it
+        results = []
+        for item in response.responses:
+            try:
+                results.append(self._parse_response(item))
+            except OcrError as e:
+                results.append(e)
+        return results
+
+    def is_transient(self, error):
+        """
+        Args:
+            error (Exception): An error raised by annotate or annotate_batch
+
+        Returns:
+            bool: Whether sending the same images again may succeed, e.g. after
+                  the service was briefly unavailable or overloaded
+        """
+        from google.api_core import exceptions
+
+        if isinstance(error, (exceptions.ServiceUnavailable, exceptions.DeadlineExceeded,
+                              exceptions.InternalServerError, exceptions.TooManyRequests)):
+            return True
+        return super().is_transient(error)
+
+    @classmethod
+    def _parse_response(cls, response):
+        """
+        Converts a text detection response into an OcrResult. Words are read
+        from the full text annotation, which also gives their confidence, block
+        and line, falling back to the flat list of word annotations
+
+        Args:
+            response (AnnotateImageResponse): The API response for a single image
+
+        Returns:
+            OcrResult: The detected words
+        """
+        from google.cloud import vision
+
+        if response.error.message:
+            raise OcrError('Error encounterd when calling Google Vision API: {}'.format(response.error.message),
+                           transient=response.error.code in VISION_TRANSIENT_CODES)
+
+        line_breaks = {vision.enums.TextAnnotation.DetectedBreak.BreakType.EOL_SURE_SPACE,
+                       vision.enums.TextAnnotation.DetectedBreak.BreakType.LINE_BREAK}
+        tokens, boxes, confidences, lines, blocks = [], [], [], [], []
+        line = block_index = 0
+
+        for page in response.full_text_annotation.pages:
+            for block in page.blocks:
+                for paragraph in block.paragraphs:
+                    for word in paragraph.words:
+                        tokens.append(''.join(symbol.text for symbol in word.symbols).lower())
+                        boxes.append(cls._get_box(word.bounding_box.vertices))
+                        confidences.append(word.confidence)
+                        lines.append(line)
+                        blocks.append(block_index)
+
+                        # A line ends with the break after its last symbol
+                        if word.symbols and word.symbols[-1].property.detected_break.type in line_breaks:
+                            line += 1
+
+                    # Paragraphs always start a new line
+                    if lines and lines[-1] == line:
+                        line += 1
+                block_index += 1
+
+        if not tokens:
+            # The first annotation is the full text of the image, followed by each word
+            words = [(text.description.lower(), cls._get_box(text.bounding_poly.vertices))
+                     for text in response.text_annotations[1:]]
+            return OcrResult.from_words(words)
+
+        return OcrResult(tokens, boxes, confidences, lines, blocks)
+
+    @staticmethod
+    def _get_box(vertices):
+        """
+        Args:
+            vertices (list): The corners of a word
+
+        Returns:
+            list: The four (x, y) corners of the word, NaN if the API did not
+                  give four corners
+        """
+        points = [(point.x, point.y) for point in vertices]
+        return points if len(points) == 4 else [(np.nan, np.nan)] * 4
+
+
+class TesseractBackend(OcrBackend):
+    def __init__(self, config=TESSERACT_CONFIG, min_confidence=TESSERACT_MIN_CONFIDENCE):
+        """
+        Constructor for TesseractBackend class, running the Tesseract engine
+        locally on the CPU, so OCR works without a network connection
+
+        Args:
+            config (str): Tesseract command line options
+            min_confidence (float): Words below this confidence (0-100) are dropped
+        """
+        import pytesseract
+
+        self.tesseract = pytesseract
+        self.config = config
+        self.min_confidence = min_confidence
+
+    def annotate(self, content, timeout=None):
+        """
+        Args:
+            content (bytes): An image stored as a bytes object
+            timeout (float): Optional time (in seconds) after which the
+                             Tesseract process is stopped
+
+        Returns:
+            OcrResult: The detected words
+        """
+        image = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode the image")
+
+        try:
+            data = self.tesseract.image_to_data(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), config=self.config,
+                                                output_type=self.tesseract.Output.DICT, timeout=timeout or 0)
+        except RuntimeError as e:
+            # pytesseract reports a stopped process as a RuntimeError
+            if 'timeout' in str(e).lower():
+                raise TimeoutError(f"Tesseract did not finish within {timeout}s") from e
+            raise
+        # Rows are pages, blocks, paragraphs and lines as well as words, only
+        # words have text and a confidence
+        texts = [text.strip().lower() for text in data['text']]
+        confidences = np.asarray(data['conf'], dtype=float)
+        keep = np.flatnonzero((np.asarray([len(text) for text in texts]) > 0) & (confidences >= self.min_confidence))
+
+        x, y = np.asarray(data['left'])[keep], np.asarray(data['top'])[keep]
+        x2, y2 = x + np.asarray(data['width'])[keep], y + np.asarray(data['height'])[keep]
+        boxes = np.stack([np.stack([x, y], axis=1), np.stack([x2, y], axis=1),
+                          np.stack([x2, y2], axis=1), np.stack([x, y2], axis=1)], axis=1)
+
+        # Lines are numbered within their paragraph, and paragraphs within their block
+        line_keys = [(data['block_num'][index], data['par_num'][index], data['line_num'][index]) for index in keep]
+        line_ids = {key: line for line, key in enumerate(dict.fromkeys(line_keys))}
+
+        return OcrResult([texts[index] for index in keep], boxes, confidences[keep] / 100,
+                         [line_ids[key] for key in line_keys], np.asarray(data['block_num'])[keep])
+
+
+class ReplayBackend(OcrBackend):
+    def __init__(self, folder=FIXTURES_FOLDER):
+        """
+        Constructor for ReplayBackend class, returning OCR results recorded
+        earlier for each image. Results are deterministic and need neither a
+        network connection nor an OCR engine, for tests and benchmarks
+
+        Args:
+            folder (str): Folder of recorded results, one JSON file per image
+                          named by the SHA-256 hash of the image bytes
+        """
+        self.folder = folder
+
+    def annotate(self, content, timeout=None):
+        """
+        Args:
+            content (bytes): An image stored as a bytes object
+            timeout (float): Unused, recorded results are read straight away
+
+        Returns:
+            OcrResult: The detected words
+        """
+        path = self.get_path(content)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No recorded OCR result for the image at {path}")
+
+        with open(path) as file:
+            return OcrResult.from_columns(json.load(file))
+
+    def record(self, content, texts):
+        """
+        Saves the OCR result of an image, to be replayed later
+
+        Args:
+            content (bytes): An image stored as a bytes object
+            texts (OcrResult): The detected words
+        """
+        os.makedirs(self.folder, exist_ok=True)
+
+        with open(self.get_path(content), 'w') as file:
+            json.dump(texts.to_columns(), file)
+
+    def get_path(self, content):
+        """
+        Args:
+            content (bytes): An image stored as a bytes object
+
+        Returns:
+            str: Path of the recorded result of the image
+        """
+        return os.path.join(self.folder, hashlib.sha256(content).hexdigest() + '.json')
+
+
+# OCR engines that can be chosen with TextDetector's backend
+OCR_BACKENDS = {
+    "google": GoogleVisionBackend,
+    "tesseract": TesseractBackend,
+    "replay": ReplayBackend
+}
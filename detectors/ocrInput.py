@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+
+from detectors.ocrResult import OcrResult
+
+# Longest side of the image sent for OCR, larger images are downscaled
+OCR_MAX_SIDE = 1600
+OCR_JPEG_QUALITY = 85
+
+# Space kept around the detected objects when cropping, as a fraction of the
+# longest side of the crop, so words on the edge of an object are not cut
+OCR_CROP_MARGIN = 0.05
+
+
+class OcrInput:
+    def __init__(self, content, original_size, offset=(0, 0), scale=1.0):
+        """
+        Constructor for OcrInput class, the image sent for OCR and how it
+        relates to the uploaded image
+
+        Args:
+            content (bytes): The encoded image sent for OCR
+            original_size (int): Size of the uploaded image in bytes
+            offset (tuple): The x, y position of the crop in the uploaded image
+            scale (float): The scale of the sent image relative to the crop
+        """
+        self.content = content
+        self.original_size = original_size
+        self.offset = offset
+        self.scale = scale
+
+    @classmethod
+    def reduce(cls, image, image_bytes, boxes=None, max_side=OCR_MAX_SIDE, quality=OCR_JPEG_QUALITY,
+               margin=OCR_CROP_MARGIN):
+        """
+        Prepares an image for OCR, cropping it to the region holding the given
+        boxes, downscaling it to the maximum side and re-encoding it as a JPEG.
+        The uploaded bytes are sent unchanged if none of these makes them smaller
+
+        Args:
+            image (np.array): The decoded image of shape (H, W, C)
+            image_bytes (bytes): The uploaded image
+            boxes (list): Optional boxes (x1, y1, x2, y2) of the objects to crop to
+            max_side (int): Longest side of the sent image
+            quality (int): JPEG quality (0-100) of the sent image
+            margin (float): Space kept around the boxes, as a fraction of the
+                            longest side of the crop
+
+        Returns:
+            OcrInput: The image to send
+        """
+        if image is None:
+            return cls(image_bytes, len(image_bytes))
+
+        height, width = image.shape[:2]
+        x1, y1, x2, y2 = 0, 0, width, height
+
+        if boxes is not None and len(boxes):
+            boxes = np.asarray(boxes, dtype=float)
+            x1, y1 = boxes[:, :2].min(axis=0)
+            x2, y2 = boxes[:, 2:].max(axis=0)
+
+            pad = margin * max(x2 - x1, y2 - y1)
+            x1, y1 = int(max(x1 - pad, 0)), int(max(y1 - pad, 0))
+            x2, y2 = int(min(np.ceil(x2 + pad), width)), int(min(np.ceil(y2 + pad), height))
+
+            # Boxes off the image leave nothing to crop to
+            if x2 <= x1 or y2 <= y1:
+                x1, y1, x2, y2 = 0, 0, width, height
+
+        cropped = (x1, y1, x2, y2) != (0, 0, width, height)
+        scale = min(max_side / max(x2 - x1, y2 - y1), 1.0)
+
+        if not cropped and scale == 1:
+            return cls(image_bytes, len(image_bytes))
+
+        region = image[y1:y2, x1:x2]
+        if scale < 1:
+            size = (max(round((x2 - x1) * scale), 1), max(round((y2 - y1) * scale), 1))
+            region = cv2.resize(region, size, interpolation=cv2.INTER_AREA)
+
+            # The rounded size sets the actual scale
+            scale = size[0] / (x2 - x1)
+
+        content = cv2.imencode('.jpg', region, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+        # A crop always has to be sent, as its coordinates are mapped back
+        if not cropped and len(content) >= len(image_bytes):
+            return cls(image_bytes, len(image_bytes))
+        return cls(content, len(image_bytes), (x1, y1), scale)
+
+    def map_back(self, texts):
+        """
+        Maps the word boxes detected in the sent image to the uploaded image
+
+        Args:
+            texts (OcrResult): The words detected in the sent image
+
+        Returns:
+            OcrResult: The words with boxes in uploaded image coordinates
+        """
+        if self.offset == (0, 0) and self.scale == 1:
+            return texts
+
+        boxes = texts.boxes / self.scale + np.asarray(self.offset, dtype=np.float32)
+        return OcrResult(texts.tokens, boxes, texts.confidences, texts.lines, texts.blocks)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: The size of the uploaded and sent images in bytes, the bytes
+                  saved, and the crop position and scale
+        """
+        return {
+            "original_bytes": self.original_size,
+            "sent_bytes": len(self.content),
+            "saved_bytes": self.original_size - len(self.content),
+            "offset": [int(value) for value in self.offset],
+            "scale": round(self.scale, 4)
+        }
@@ -0,0 +1,114 @@
+import numpy as np
+
+
+class OcrResult:
+    def __init__(self, tokens=(), boxes=None, confidences=None, lines=None, blocks=None):
+        """
+        Constructor for OcrResult class, the words detected in an image held as
+        columns rather than one object per word. Words are kept in reading
+        order, including repeated words, so the same word printed twice keeps
+        both of its boxes.
+
+        Args:
+            tokens (list): The lower case text of each word
+            boxes (array): The four (x, y) corners of each word, of shape (N, 4, 2)
+            confidences (array): The confidence of each word (0-1), NaN if the
+                                 engine does not give one
+            lines (array): The line each word belongs to, -1 if unknown
+            blocks (array): The block (e.g. paragraph) each word belongs to, -1 if unknown
+        """
+        self.tokens = list(tokens)
+        count = len(self.tokens)
+
+        self.boxes = np.zeros((count, 4, 2), dtype=np.float32) if boxes is None else \
+            np.asarray(boxes, dtype=np.float32).reshape(count, 4, 2)
+        self.confidences = np.full(count, np.nan, dtype=np.float32) if confidences is None else \
+            np.asarray(confidences, dtype=np.float32)
+        self.lines = np.full(count, -1, dtype=np.int32) if lines is None else np.asarray(lines, dtype=np.int32)
+        self.blocks = np.full(count, -1, dtype=np.int32) if blocks is None else np.asarray(blocks, dtype=np.int32)
+
+    @classmethod
+    def from_words(cls, words):
+        """
+        Creates a result from (text, bbox) pairs, e.g. the items of the
+        {text: [bbox]} dictionaries used before
+
+        Args:
+            words (iterable): Pairs of a word and its four (x, y) corners
+
+        Returns:
+            OcrResult: The words as columns
+        """
+        words = list(words)
+        return cls([text for text, _ in words], [bbox for _, bbox in words])
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Args:
+            columns (dict): The output of to_columns
+
+        Returns:
+            OcrResult: The restored result
+        """
+        return cls(columns["tokens"], columns["boxes"], columns.get("confidences"),
+                   columns.get("lines"), columns.get("blocks"))
+
+    def to_columns(self):
+        """
+        Returns:
+            dict: The columns as lists, which can be stored as JSON. Missing
+                  confidences are stored as None
+        """
+        return {
+            "tokens": self.tokens,
+            "boxes": self.boxes.tolist(),
+            "confidences": [None if np.isnan(value) else value for value in self.confidences.tolist()],
+            "lines": self.lines.tolist(),
+            "blocks": self.blocks.tolist()
+        }
+
+    def select(self, keep):
+        """
+        Args:
+            keep (array): A boolean mask or the indices of the words to keep
+
+        Returns:
+            OcrResult: The kept words, in the same order
+        """
+        indices = np.arange(len(self))[keep]
+        return OcrResult([self.tokens[index] for index in indices], self.boxes[indices],
+                         self.confidences[indices], self.lines[indices], self.blocks[indices])
+
+    def get_centres(self):
+        """
+        Returns:
+            np.ndarray: The centre of each word's box, of shape (N, 2)
+        """
+        return self.boxes.mean(axis=1)
+
+    def get_heights(self):
+        """
+        Returns:
+            np.ndarray: The height of each word's box, the mean length of its
+                        left and right edges so rotated words are measured along
+                        their own axis
+        """
+        left = np.linalg.norm(self.boxes[:, 3] - self.boxes[:, 0], axis=1)
+        right = np.linalg.norm(self.boxes[:, 2] - self.boxes[:, 1], axis=1)
+        return (left + right) / 2
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    def __eq__(self, other):
+        return isinstance(other, OcrResult) and self.tokens == other.tokens and \
+            np.array_equal(self.boxes, other.boxes) and \
+            np.array_equal(self.confidences, other.confidences, equal_nan=True) and \
+            np.array_equal(self.lines, other.lines) and np.array_equal(self.blocks, other.blocks)
+
+    def __repr__(self):
+        return f"OcrResult({self.tokens})"
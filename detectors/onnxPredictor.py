@@ -0,0 +1,124 @@
+import os
+import threading
+
+import torch
+import numpy as np
+import onnxruntime
+
+from detectron2.data import transforms as T
+from detectron2.modeling.postprocessing import detector_postprocess
+from detectron2.structures import Boxes, Instances
+
+
+class OnnxModel:
+    def __init__(self, path):
+        """
+        Constructor for OnnxModel class, running a Mask R-CNN graph exported by
+        export.py through ONNX Runtime. Called like the detectron2 model, with a
+        list of pre-processed inputs, and returns the same list of outputs.
+
+        Args:
+            path (str): Path of the exported .onnx file
+        """
+        self.path = path
+        self._session = None
+        self._output_names = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __call__(self, inputs):
+        """
+        Args:
+            inputs (list): A list of dictionaries holding a resized (C, H, W) image
+                           tensor and the original image height and width
+
+        Returns:
+            list: A dictionary per input containing an 'instances' field, scaled
+                  to the original image size
+        """
+        session = self._get_session()
+        ret = []
+
+        # The graph was exported for a single image, so run a batch one image at a time
+        for item in inputs:
+            image = item["image"]
+            feed = {"image": np.ascontiguousarray(image.numpy(), dtype=np.float32)}
+            outputs = dict(zip(self._output_names, session.run(self._output_names, feed)))
+
+            instances = Instances(tuple(image.shape[1:]))
+            instances.pred_boxes = Boxes(torch.from_numpy(outputs["boxes"]))
+            instances.scores = torch.from_numpy(outputs["scores"])
+            instances.pred_classes = torch.from_numpy(outputs["classes"])
+
+            # Models exported without the mask head have no masks output
+            if "masks" in outputs:
+                instances.pred_masks = torch.from_numpy(outputs["masks"])
+
+            # Rescale the boxes and paste the mask probabilities into full size bitmasks
+            ret.append({"instances": detector_postprocess(instances, item["height"], item["width"])})
+        return ret
+
+    def _get_session(self):
+        """
+        Gets the inference session of the current process. The session is created
+        on first use, since ONNX Runtime's thread pool does not survive a fork
+
+        Returns:
+            InferenceSession: The ONNX Runtime session
+        """
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                options = onnxruntime.SessionOptions()
+                options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+                options.intra_op_num_threads = torch.get_num_threads()
+
+                self._session = onnxruntime.InferenceSession(self.path, options,
+                                                             providers=["CPUExecutionProvider"])
+                self._output_names = [output.name for output in self._session.get_outputs()]
+                self._pid = os.getpid()
+            return self._session
+
+
+class OnnxPredictor:
+    def __init__(self, cfg):
+        """
+        Constructor for OnnxPredictor class, a drop-in replacement for the
+        detectron2 DefaultPredictor which runs the exported model through
+        ONNX Runtime
+
+        Args:
+            cfg (CfgNode): Detectron2 config file, with the path of the exported
+                           model in cfg.QST.ONNX_MODEL
+        """
+        self.cfg = cfg.clone()
+        self.input_format = cfg.INPUT.FORMAT
+        self.aug = self.get_resize(cfg)
+        self.model = OnnxModel(cfg.QST.ONNX_MODEL)
+
+    @staticmethod
+    def get_resize(cfg):
+        """
+        Args:
+            cfg (CfgNode): Detectron2 config file
+
+        Returns:
+            ResizeShortestEdge: The test-time resize used by the DefaultPredictor
+        """
+        return T.ResizeShortestEdge([cfg.INPUT.MIN_SIZE_TEST, cfg.INPUT.MIN_SIZE_TEST], cfg.INPUT.MAX_SIZE_TEST)
+
+    def __call__(self, original_image):
+        """
+        Args:
+            original_image (np.array): an image of shape (H, W, C) (in BGR order).
+
+        Returns:
+            dict: The predictions for the image, in an 'instances' field
+        """
+        if self.input_format == "RGB":
+            original_image = original_image[:, :, ::-1]
+
+        height, width = original_image.shape[:2]
+        image = self.aug.get_transform(original_image).apply_image(original_image)
+        image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
+
+        return self.model([{"image": image, "height": height, "width": width}])[0]
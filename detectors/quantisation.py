@@ -0,0 +1,47 @@
+import torch
+
+from detectron2.engine import DefaultPredictor
+
+
+# Layers replaced by int8 versions. Dynamic quantisation only supports fully
+# connected layers on CPU, i.e. the box head, so the convolutions are only
+# quantised by the static ONNX Runtime path
+QUANTISED_MODULES = {torch.nn.Linear}
+
+
+def quantise_dynamic(model):
+    """
+    Converts the weights of the model's fully connected layers to int8. The
+    activations are quantised on the fly, so no calibration is needed
+
+    Args:
+        model (GeneralizedRCNN): A detectron2 model, converted in place
+
+    Returns:
+        GeneralizedRCNN: The quantised model
+    """
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, QUANTISED_MODULES, dtype=torch.qint8, inplace=True)
+
+
+def build_int8_predictor(cfg):
+    """
+    Creates a DefaultPredictor holding the int8 model saved by quantise.py
+
+    Args:
+        cfg (CfgNode): Detectron2 config file, with the path of the quantised
+                       weights in cfg.QST.INT8_WEIGHTS
+
+    Returns:
+        DefaultPredictor: A predictor running the quantised model
+    """
+    # Build the model without loading the FP32 weights, which are replaced anyway
+    fp32_cfg = cfg.clone()
+    fp32_cfg.defrost()
+    fp32_cfg.MODEL.WEIGHTS = ""
+    fp32_cfg.freeze()
+
+    predictor = DefaultPredictor(fp32_cfg)
+    predictor.model = quantise_dynamic(predictor.model)
+    predictor.model.load_state_dict(torch.load(cfg.QST.INT8_WEIGHTS, map_location="cpu"))
+    return predictor
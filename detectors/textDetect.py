@@ -1,45 +1,269 @@
 import io
-from google.cloud import vision
+import time
+import functools
+
+from detectors.batchScheduler import BatchScheduler
+from detectors.ocrBackends import OCR_BACKENDS, OcrBackend
+from serving.deadline import DeadlineExceeded
+from serving.hedging import HedgedCaller
+from serving.metrics import StageTimer, OCR_CALLS, OCR_IMAGES
+
+# OCR engine used to detect text, one of OCR_BACKENDS. "tesseract" runs
+# locally without a network connection, "replay" returns recorded results
+OCR_BACKEND = "google"
+
+# Largest number of images the API accepts in one batch request
+MAX_BATCH_SIZE = 16
+
+# Longest time (in seconds) an image waits for images from other requests to
+# join its OCR request. Only used by backends that batch requests, 0 turns
+# batching off
+OCR_BATCH_WAIT = 0.02
+
+# Longest time (in seconds) a single OCR call may take, so a stalled call does
+# not hold a thread even when the request has no deadline
+OCR_CALL_TIMEOUT = 15
+
+# A call still outstanding after this percentile of recent OCR latencies is
+# sent again, as is a call that failed with a transient error, up to
+# OCR_MAX_ATTEMPTS in all. OCR_HEDGE_DELAY (in seconds) is used until
+# OCR_HEDGE_MIN_SAMPLES latencies have been seen
+OCR_MAX_ATTEMPTS = 2
+OCR_HEDGE_PERCENTILE = 95
+OCR_HEDGE_DELAY = 2.0
+OCR_HEDGE_MIN_SAMPLES = 20
+
+
+class OcrUnavailable(Exception):
+    """
+    Raised when every attempt at detecting the text in an image failed with an
+    error that may pass, e.g. the OCR service being unavailable or timing out
+    """
+
+
+class OcrBatchScheduler(BatchScheduler):
+    QUEUE_SPAN = "ocr_queue_wait"
+    BATCH_SPAN = "ocr_call"
+
+    def __init__(self, backend, max_batch_size=MAX_BATCH_SIZE, max_wait=OCR_BATCH_WAIT, call_timeout=OCR_CALL_TIMEOUT):
+        """
+        Constructor for OcrBatchScheduler class. Queues images sent for OCR by
+        concurrent callers and sends them in batch requests, routing each
+        result back to its caller
+
+        Args:
+            backend (OcrBackend): OCR backend providing annotate_batch
+            max_batch_size (int): The largest number of images sent in one request
+            max_wait (float): The longest time (in seconds) the first queued image
+                              waits for others to join its request
+            call_timeout (float): The longest time (in seconds) a request may take
+        """
+        super().__init__(None, max_batch_size, max_wait)
+        self.backend = backend
+        self.call_timeout = call_timeout
+
+    def _run_batch(self, items):
+        """
+        Args:
+            items (list): The queued images as (bytes, expiry) tuples, where the
+                          expiry is the perf_counter time the caller gives up
+                          on the image at, or None
+
+        Returns:
+            list: The OCR result of each image, or the error raised for that
+                  image alone, in the same order
+        """
+        # The request is abandoned once the caller waiting longest has given up
+        expiries = [expires_at for _, expires_at in items if expires_at is not None]
+        timeout = self.call_timeout
+        if expiries:
+            timeout = min(max(max(expiries) - time.perf_counter(), 0.001), timeout)
+
+        OCR_CALLS.inc()
+        OCR_IMAGES.inc(amount=len(items))
+        with StageTimer('ocr_call'):
+            return self.backend.annotate_batch([content for content, _ in items], timeout)
 
 
 class TextDetector:
-    def __init__(self):
+    def __init__(self, backend=OCR_BACKEND, batch_wait=OCR_BATCH_WAIT, max_attempts=OCR_MAX_ATTEMPTS, **kwargs):
         """
         Constructor for TextDetector class.
+
+        Args:
+            backend (str): Name of the OCR engine, one of OCR_BACKENDS, or an
+                           OcrBackend instance
+            batch_wait (float): The longest time (in seconds) an image waits for
+                                others to share its OCR request, 0 to send each
+                                image on its own
+            max_attempts (int): The most times an image is sent, when hedging a
+                                slow call or retrying a failed one
+            kwargs: Options passed on to the engine's backend, e.g. the
+                    fixtures folder of the replay backend
+        """
+        if isinstance(backend, OcrBackend):
+            self.backend_name = type(backend).__name__
+            self.backend = backend
+        elif backend in OCR_BACKENDS:
+            self.backend_name = backend
+            self.backend = OCR_BACKENDS[backend](**kwargs)
+        else:
+            raise ValueError(f"Unknown OCR backend '{backend}', expected one of {', '.join(OCR_BACKENDS)}")
+
+        # Images from concurrent requests are sent together when the backend
+        # accepts several images per call
+        self.batch_scheduler = None
+        if batch_wait and self.backend.batches_requests:
+            self.batch_scheduler = OcrBatchScheduler(self.backend, MAX_BATCH_SIZE, batch_wait)
+
+        # Single images and batches have their own latencies to hedge after
+        self.hedgers = {name: HedgedCaller(max_attempts, OCR_HEDGE_PERCENTILE, OCR_HEDGE_DELAY,
+                                           min_samples=OCR_HEDGE_MIN_SAMPLES, is_retryable=self.backend.is_transient)
+                        for name in ("image", "batch")}
+
+    def connect(self):
         """
-        self.client = vision.ImageAnnotatorClient()
+        Creates the OCR backend's client. Also used to replace the client
+        in a forked process, as gRPC channels cannot be shared across a fork
+        """
+        self.backend.connect()
 
-    def get_text(self, content):
+    def get_text(self, content, deadline=None):
         """
-        Sends an image to the Google Vision API for OCR
+        Detects the text in an image using the OCR backend
 
         Args:
             content (bytes): An image stored as a bytes object
+            deadline (Deadline): Optional deadline of the request
 
         Returns:
-            list (dict): Returns detected words in a list of
-            dictionaries formatted as {text: [bbox]}
+            OcrResult: The detected words, in reading order
+
+        Raises:
+            DeadlineExceeded: If the deadline passed before the text was detected
+            OcrUnavailable: If every attempt failed with a transient error
         """
-        image = vision.types.Image(content=content)
-        response = self.client.text_detection(image=image)
-        texts = response.text_annotations
-        results = {}
+        return self._call("image", functools.partial(self._annotate, content), deadline)
 
-        if response.error.message:
-            raise Exception('Error encounterd when calling Google Vision API'
-                            .format(response.error.message))
+    def get_stats(self):
+        """
+        Returns:
+            dict: The OCR backend, the state of the batch scheduler, or None if
+                  images are not batched, and the hedging of single images and
+                  of batches
+        """
+        return {
+            "backend": self.backend_name,
+            "scheduler": self.batch_scheduler.get_stats() if self.batch_scheduler is not None else None,
+            "hedging": {name: hedger.get_stats() for name, hedger in self.hedgers.items()}
+        }
 
-        # Convert the results object into dictionary format
-        for index, text in enumerate(texts):
-            if index == 0:
-                continue
+    def get_texts(self, contents, deadline=None):
+        """
+        Detects the text in several images, using as few requests as the
+        batch size limit allows
 
-            bbox = []
-            for point in text.bounding_poly.vertices:
-                bbox.append((point.x, point.y))
+        Args:
+            contents (list): A list of images stored as bytes objects
+            deadline (Deadline): Optional deadline of the request
+
+        Returns:
+            list: The get_text output of each image, or the error raised for that
+                  image alone, in the same order
+
+        Raises:
+            DeadlineExceeded: If the deadline passed before the text was detected
+            OcrUnavailable: If every attempt at a batch failed with a transient error
+        """
+        results = []
 
-            results[text.description.lower()] = bbox
-        return results
+        for index in range(0, len(contents), MAX_BATCH_SIZE):
+            batch = contents[index:index + MAX_BATCH_SIZE]
+            results.extend(self._call("batch", functools.partial(self._annotate_batch, batch), deadline))
+
+        # The batch was only sent once, so a transient error for an image had a single attempt
+        return [self._get_error(result, 1) if isinstance(result, Exception) else result for result in results]
+
+    def _call(self, hedger, attempt, deadline):
+        """
+        Makes a hedged OCR call
+
+        Args:
+            hedger (str): Name of the hedger to call through, image or batch
+            attempt (function): Makes one attempt, taking the time left before the deadline
+            deadline (Deadline): Optional deadline of the request
+
+        Returns:
+            The result of the first attempt to succeed
+        """
+        try:
+            return self.hedgers[hedger].call(attempt, deadline)
+        except Exception as e:
+            raise self._get_error(e, self.hedgers[hedger].max_attempts)
+
+    def _get_error(self, error, attempts):
+        """
+        Args:
+            error (Exception): The error of the last attempt at an image
+            attempts (int): The number of attempts made
+
+        Returns:
+            Exception: OcrUnavailable if the error may pass, the error itself
+                       otherwise, or if the deadline passed
+        """
+        if isinstance(error, DeadlineExceeded) or not self.backend.is_transient(error):
+            return error
+
+        unavailable = OcrUnavailable(f"OCR failed after {attempts} attempt(s): {error}")
+        unavailable.__cause__ = error
+        return unavailable
+
+    def _annotate(self, content, timeout):
+        """
+        Makes one attempt at detecting the text in an image
+
+        Args:
+            content (bytes): An image stored as a bytes object
+            timeout (float): The time (in seconds) left before the deadline, or None
+
+        Returns:
+            OcrResult: The detected words
+        """
+        if self.batch_scheduler is not None:
+            expires_at = time.perf_counter() + timeout if timeout is not None else None
+            return self.batch_scheduler.run((content, expires_at))
+
+        OCR_CALLS.inc()
+        OCR_IMAGES.inc()
+        with StageTimer('ocr_call'):
+            return self.backend.annotate(content, self._get_timeout(timeout))
+
+    def _annotate_batch(self, contents, timeout):
+        """
+        Makes one attempt at detecting the text in a batch of images
+
+        Args:
+            contents (list): A list of images stored as bytes objects
+            timeout (float): The time (in seconds) left before the deadline, or None
+
+        Returns:
+            list: The detected words of each image, or the error raised for it
+        """
+        OCR_CALLS.inc()
+        OCR_IMAGES.inc(amount=len(contents))
+        with StageTimer('ocr_call'):
+            return self.backend.annotate_batch(contents, self._get_timeout(timeout))
+
+    @staticmethod
+    def _get_timeout(remaining):
+        """
+        Args:
+            remaining (float): The time (in seconds) left before the deadline, or None
+
+        Returns:
+            float: The time (in seconds) the backend may take over a call
+        """
+        return OCR_CALL_TIMEOUT if remaining is None else min(remaining, OCR_CALL_TIMEOUT)
 
 
 if __name__ == '__main__':
@@ -50,5 +274,4 @@ if __name__ == '__main__':
     with io.open(path, 'rb') as image_file:
         image = image_file.read()
 
-    print(textDetector.get_text(image).keys())
-
+    print(textDetector.get_text(image).tokens)
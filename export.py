@@ -0,0 +1,228 @@
+import sys
+import glob
+import os.path
+import argparse
+
+import cv2
+import torch
+import numpy as np
+
+from detectron2.checkpoint import DetectionCheckpointer
+from detectron2.engine import DefaultPredictor
+from detectron2.modeling import build_model
+
+from detectors.onnxPredictor import OnnxPredictor
+from recognition.objectRec import ObjectInference, TIERS, DEFAULT_TIER
+
+
+# Highest opset the pinned torch (1.6) can export, RoiAlign needs at least 10
+OPSET_VERSION = 11
+SAMPLE_IMAGE = "images/readme_example.jpg"
+BOX_TOLERANCE = 2.0
+SCORE_TOLERANCE = 0.02
+MASK_IOU_THRESHOLD = 0.95
+
+# Fraction of the width kept when cropping each checked image, so the parity
+# check also runs the graph at an input size other than the one it was traced at
+CHECK_CROP = 0.75
+
+
+def run_inference(model, inputs):
+    """
+    Runs the model up to, but not including, scaling to the original image
+    size, which is left to the OnnxPredictor
+
+    Args:
+        model (GeneralizedRCNN): The trained detectron2 model
+        inputs (list): A list holding a single {"image": (C, H, W) tensor} dict
+
+    Returns:
+        tuple: The boxes (N, 4), scores (N), classes (N) and, unless the mask
+               head is turned off, mask probabilities (N, 1, M, M) of the detections
+    """
+    instances = model.inference(inputs, do_postprocess=False)[0]
+    outputs = (instances.pred_boxes.tensor, instances.scores, instances.pred_classes)
+
+    if instances.has("pred_masks"):
+        outputs += (instances.pred_masks,)
+    return outputs
+
+
+def export(cfg, path, sample_path):
+    """
+    Traces the model on a sample image and saves it in ONNX format. The model
+    is traced through detectron2's TracingAdapter, which flattens its inputs
+    and outputs into tensors and patches the shape computations that would
+    otherwise be recorded as constants, so the graph accepts any input size
+
+    Args:
+        cfg (CfgNode): Detectron2 config file
+        path (str): Path to save the .onnx file to
+        sample_path (str): Path of an image to trace the model with
+    """
+    from detectron2.export import TracingAdapter
+
+    model = build_model(cfg)
+    DetectionCheckpointer(model).load(cfg.MODEL.WEIGHTS)
+    model.eval()
+
+    # Pre-process the sample the same way as the predictors
+    image = preprocess(cfg, cv2.imread(sample_path))
+    adapter = TracingAdapter(model, [{"image": image}], run_inference)
+
+    output_names = ["boxes", "scores", "classes"]
+    if cfg.MODEL.MASK_ON:
+        output_names.append("masks")
+
+    dynamic_axes = {name: {0: "detections"} for name in output_names}
+    dynamic_axes["image"] = {1: "height", 2: "width"}
+
+    with torch.no_grad():
+        torch.onnx.export(adapter, adapter.flattened_inputs, path,
+                          opset_version=OPSET_VERSION,
+                          input_names=["image"],
+                          output_names=output_names,
+                          dynamic_axes=dynamic_axes)
+
+
+def check_parity(torch_cfg, onnx_cfg, image_paths, trace_size):
+    """
+    Compares the predictions of the PyTorch and ONNX Runtime backends. Each
+    image is also checked cropped to CHECK_CROP of its width, and the check
+    fails unless the graph was run at an input size other than the traced one
+
+    Args:
+        torch_cfg (CfgNode): Config for the PyTorch backend
+        onnx_cfg (CfgNode): Config for the ONNX Runtime backend
+        image_paths (list): Paths of the images to compare on
+        trace_size (tuple): The (H, W) of the resized image the model was traced with
+
+    Returns:
+        bool: Whether every image gave the same detections, within tolerance,
+              including at input sizes other than the traced one
+    """
+    torch_predictor = DefaultPredictor(torch_cfg)
+    onnx_predictor = OnnxPredictor(onnx_cfg)
+    passed = True
+    other_sizes = set()
+
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+
+        width = image.shape[1]
+        for name, variant in ((path, image), (f"{path} (cropped)", image[:, :int(width * CHECK_CROP)])):
+            size = tuple(preprocess(torch_cfg, variant).shape[1:])
+            if size != tuple(trace_size):
+                other_sizes.add(size)
+
+            expected = torch_predictor(variant)["instances"].to("cpu")
+            actual = onnx_predictor(variant)["instances"].to("cpu")
+
+            result = compare_instances(expected, actual)
+            passed = passed and result["passed"]
+            print(f"{'PASS' if result['passed'] else 'FAIL'} {name} at {size[1]}x{size[0]}: "
+                  f"{result['detections']} detections, classes match {result['classes_match']}, "
+                  f"max box error {result['box_error']:.2f}px, max score error {result['score_error']:.4f}, "
+                  f"min mask IoU {result['mask_iou']:.4f}")
+
+    if not other_sizes:
+        print(f"FAIL no image was checked at a size other than the traced {trace_size[1]}x{trace_size[0]}")
+        return False
+    return passed
+
+
+def compare_instances(expected, actual):
+    """
+    Compares two sets of detections made on the same image, which are matched
+    up by their order (descending score)
+
+    Args:
+        expected (Instances): Detections made by the reference backend
+        actual (Instances): Detections made by the backend under test
+
+    Returns:
+        dict: The largest box and score differences, the smallest mask IoU and
+              whether they are within tolerance
+    """
+    ret = {"detections": len(expected), "classes_match": False,
+           "box_error": float("inf"), "score_error": float("inf"), "mask_iou": 0.0, "passed": False}
+
+    if len(expected) != len(actual):
+        return ret
+
+    ret["classes_match"] = torch.equal(expected.pred_classes, actual.pred_classes)
+
+    if len(expected) == 0:
+        ret.update(box_error=0.0, score_error=0.0, mask_iou=1.0, passed=ret["classes_match"])
+        return ret
+
+    ret["box_error"] = (expected.pred_boxes.tensor - actual.pred_boxes.tensor).abs().max().item()
+    ret["score_error"] = (expected.scores - actual.scores).abs().max().item()
+
+    if not expected.has("pred_masks"):
+        ret["mask_iou"] = 1.0
+        ret["passed"] = (ret["classes_match"] and ret["box_error"] <= BOX_TOLERANCE
+                         and ret["score_error"] <= SCORE_TOLERANCE)
+        return ret
+
+    expected_masks = expected.pred_masks.flatten(1).bool()
+    actual_masks = actual.pred_masks.flatten(1).bool()
+    intersection = (expected_masks & actual_masks).sum(1).float()
+    union = (expected_masks | actual_masks).sum(1).float().clamp(min=1)
+    ret["mask_iou"] = (intersection / union).min().item()
+
+    ret["passed"] = (ret["classes_match"] and ret["box_error"] <= BOX_TOLERANCE
+                     and ret["score_error"] <= SCORE_TOLERANCE and ret["mask_iou"] >= MASK_IOU_THRESHOLD)
+    return ret
+
+
+def preprocess(cfg, original_image):
+    """
+    Applies the test-time resize of the DefaultPredictor to an image
+
+    Args:
+        cfg (CfgNode): Detectron2 config file
+        original_image (np.array): an image of shape (H, W, C) (in BGR order).
+
+    Returns:
+        torch.Tensor: The resized image of shape (C, H, W)
+    """
+    if cfg.INPUT.FORMAT == "RGB":
+        original_image = original_image[:, :, ::-1]
+
+    resize = OnnxPredictor.get_resize(cfg)
+    image = resize.get_transform(original_image).apply_image(original_image)
+    return torch.as_tensor(np.ascontiguousarray(image.astype("float32").transpose(2, 0, 1)))
+
+
+def main():
+    """
+    Exports the trained model for the onnx inference backend, then checks the
+    exported model gives the same detections as the PyTorch model
+    """
+    parser = argparse.ArgumentParser(description="Export the object detector to ONNX")
+    parser.add_argument('--tier', choices=list(TIERS), default=DEFAULT_TIER)
+    parser.add_argument('--sample', default=SAMPLE_IMAGE, help="Image used to trace the model")
+    parser.add_argument('--check', metavar='FOLDER', help="Folder of images to run the parity check on")
+    parser.add_argument('--skip-export', action='store_true', help="Only run the parity check")
+    args = parser.parse_args()
+
+    torch_cfg = ObjectInference.get_config(args.tier, "torch", "fp32")
+    onnx_cfg = ObjectInference.get_config(args.tier, "onnx", "fp32")
+
+    if not args.skip_export:
+        export(torch_cfg, onnx_cfg.QST.ONNX_MODEL, args.sample)
+        print(f"Exported {torch_cfg.MODEL.WEIGHTS} to {onnx_cfg.QST.ONNX_MODEL} "
+              f"({os.path.getsize(onnx_cfg.QST.ONNX_MODEL) / 2 ** 20:.1f}MB)")
+
+    if args.check:
+        image_paths = sorted(glob.glob(os.path.join(args.check, "*")))
+        trace_size = preprocess(torch_cfg, cv2.imread(args.sample)).shape[1:]
+        if not check_parity(torch_cfg, onnx_cfg, image_paths, trace_size):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import os
+import glob
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import torch
+import numpy as np
+
+from detectron2.data import build_detection_test_loader
+from detectron2.data.datasets import register_coco_instances
+from detectron2.engine import DefaultPredictor
+from detectron2.evaluation import COCOEvaluator, inference_on_dataset
+
+from detectors.objectDetect import ObjectDetector
+from detectors.quantisation import quantise_dynamic
+from export import preprocess
+from recognition.objectRec import ObjectInference, TIERS, DEFAULT_TIER
+from serving.modelRegistry import ModelRegistry
+
+
+CALIBRATION_IMAGES = 100
+BENCHMARK_IMAGES = 20
+EVAL_DATASET = "qst_quantisation_eval"
+
+
+class CalibrationReader:
+    def __init__(self, cfg, image_paths):
+        """
+        Constructor for CalibrationReader class, implementing ONNX Runtime's
+        CalibrationDataReader interface to feed it pre-processed sample images
+        when calibrating the activation ranges
+
+        Args:
+            cfg (CfgNode): Detectron2 config file
+            image_paths (list): Paths of the calibration images
+        """
+        self.cfg = cfg
+        self.image_paths = iter(image_paths)
+
+    def get_next(self):
+        """
+        Returns:
+            dict: The next model input, or None once every image has been read
+        """
+        for path in self.image_paths:
+            image = cv2.imread(path)
+            if image is not None:
+                return {"image": preprocess(self.cfg, image).numpy()}
+        return None
+
+
+def quantise_torch(cfg, path):
+    """
+    Quantises the fully connected layers of the PyTorch model and saves its weights
+
+    Args:
+        cfg (CfgNode): Config of the FP32 model
+        path (str): Path to save the int8 weights to
+    """
+    model = quantise_dynamic(DefaultPredictor(cfg).model)
+    torch.save(model.state_dict(), path)
+
+
+def quantise_onnx(cfg, input_path, output_path, image_paths):
+    """
+    Statically quantises the convolutions and matrix multiplications of the
+    exported ONNX model, calibrating the activation ranges on sample images
+
+    Args:
+        cfg (CfgNode): Config of the FP32 model
+        input_path (str): Path of the FP32 .onnx file, created by export.py
+        output_path (str): Path to save the int8 .onnx file to
+        image_paths (list): Paths of the calibration images
+    """
+    # onnxruntime is only needed, and so only imported, when quantising for its backend
+    from onnxruntime import quantization
+
+    # The quantised operators are written as QLinearConv and QLinearMatMul, whose
+    # kernels in the pinned ONNX Runtime take uint8 weights. Gemm is not quantised
+    # by this version, so the fully connected layers of the box head stay FP32
+    quantization.quantize_static(input_path, output_path, CalibrationReader(cfg, image_paths),
+                                 op_types_to_quantize=["Conv", "MatMul"],
+                                 per_channel=True,
+                                 activation_type=quantization.QuantType.QUInt8,
+                                 weight_type=quantization.QuantType.QUInt8)
+
+
+def benchmark(cfg, image_paths, evaluate):
+    """
+    Loads a model and measures its memory usage, latency and accuracy. Run in a
+    fresh process, so memory freed by a previously loaded model is not reused
+
+    Args:
+        cfg (CfgNode): Config of the model
+        image_paths (list): Paths of the images to time the model on
+        evaluate (bool): Whether to measure the mAP on the evaluation dataset
+
+    Returns:
+        dict: Memory (in bytes), mean latency (in seconds) and box and mask mAP
+    """
+    images = [image for image in (cv2.imread(path) for path in image_paths) if image is not None]
+    latencies = []
+
+    with torch.no_grad():
+        # The ONNX Runtime session is only created on the first call, so memory
+        # is read after it. The call's one-off set up costs are left out of the timings
+        rss_before = ModelRegistry._get_rss()
+        predictor = ObjectDetector(cfg, logging=False).predictor
+        predictor(images[0])
+        rss_after = ModelRegistry._get_rss()
+
+        for image in images:
+            t_start = time.perf_counter()
+            predictor(image)
+            latencies.append(time.perf_counter() - t_start)
+
+    ret = {
+        "memory": rss_after - rss_before,
+        "latency": float(np.mean(latencies)),
+        "bbox_ap": None,
+        "segm_ap": None
+    }
+
+    if evaluate:
+        evaluator = COCOEvaluator(EVAL_DATASET, output_dir=None)
+        loader = build_detection_test_loader(cfg, EVAL_DATASET)
+        results = inference_on_dataset(predictor.model, loader, evaluator)
+        ret["bbox_ap"] = results["bbox"]["AP"]
+        ret["segm_ap"] = results["segm"]["AP"]
+    return ret
+
+
+def report(backend, fp32, int8, fp32_file, int8_file):
+    """
+    Prints the change between the FP32 and int8 models
+
+    Args:
+        backend (str): The inference backend the models were run with
+        fp32 (dict): Benchmark of the FP32 model
+        int8 (dict): Benchmark of the int8 model
+        fp32_file (str): Path of the FP32 model
+        int8_file (str): Path of the int8 model
+    """
+    fp32_file = os.path.getsize(fp32_file)
+    int8_file = os.path.getsize(int8_file)
+
+    print(f"Backend: {backend}")
+    print(f"Latency: {fp32['latency'] * 1000:.1f}ms -> {int8['latency'] * 1000:.1f}ms "
+          f"({fp32['latency'] / int8['latency']:.2f}x speedup)")
+    print(f"Memory:  {fp32['memory'] / 2 ** 20:.1f}MB -> {int8['memory'] / 2 ** 20:.1f}MB "
+          f"({(fp32['memory'] - int8['memory']) / 2 ** 20:.1f}MB saved)")
+    print(f"File:    {fp32_file / 2 ** 20:.1f}MB -> {int8_file / 2 ** 20:.1f}MB")
+
+    for metric in ("bbox_ap", "segm_ap"):
+        if fp32[metric] is not None:
+            print(f"{metric}: {fp32[metric]:.2f} -> {int8[metric]:.2f} ({int8[metric] - fp32[metric]:+.2f})")
+
+
+def main():
+    """
+    Produces an int8 version of the object detector for the chosen backend,
+    then compares it to the FP32 model
+    """
+    parser = argparse.ArgumentParser(description="Quantise the object detector to int8")
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='onnx')
+    parser.add_argument('--tier', choices=list(TIERS), default=DEFAULT_TIER)
+    parser.add_argument('--calibration', metavar='FOLDER', required=True,
+                        help="Folder of sample images, used for calibration and timing")
+    parser.add_argument('--annotations', help="COCO annotations file of an evaluation set, to measure mAP")
+    parser.add_argument('--images', metavar='FOLDER', help="Image folder of the evaluation set")
+    args = parser.parse_args()
+
+    image_paths = sorted(glob.glob(os.path.join(args.calibration, "*")))
+    fp32_cfg = ObjectInference.get_config(args.tier, args.backend, "fp32")
+    int8_cfg = ObjectInference.get_config(args.tier, args.backend, "int8")
+
+    if args.backend == "torch":
+        # Dynamic quantisation needs no calibration, so the sample images are only used for timing
+        fp32_file, int8_file = fp32_cfg.MODEL.WEIGHTS, int8_cfg.QST.INT8_WEIGHTS
+        quantise_torch(fp32_cfg, int8_file)
+    else:
+        fp32_file, int8_file = fp32_cfg.QST.ONNX_MODEL, int8_cfg.QST.ONNX_MODEL
+        quantise_onnx(fp32_cfg, fp32_file, int8_file, image_paths[:CALIBRATION_IMAGES])
+
+    evaluate = bool(args.annotations and args.images)
+    if evaluate:
+        register_coco_instances(EVAL_DATASET, {}, args.annotations, args.images)
+
+    # Each model is loaded in its own process so their memory usage can be compared
+    context = multiprocessing.get_context("fork")
+    results = []
+    for cfg in (fp32_cfg, int8_cfg):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(benchmark, cfg, image_paths[:BENCHMARK_IMAGES], evaluate).result())
+
+    report(args.backend, *results, fp32_file, int8_file)
+
+
+if __name__ == '__main__':
+    main()
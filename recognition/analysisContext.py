@@ -0,0 +1,206 @@
+import cv2
+import time
+import threading
+import numpy as np
+from concurrent import futures
+
+from detectors.expiryDetect import ExpiryDetector
+from detectors.ocrInput import OcrInput
+from detectors.ocrResult import OcrResult
+from detectors.textDetect import OcrUnavailable
+from serving.metrics import StageTimer, OCR_BYTES, OCR_FALLBACKS
+
+# Time (in seconds) kept back from the request deadline for the analysis that
+# follows the OCR call, so a late OCR result still leaves time to respond
+OCR_DEADLINE_RESERVE = 0.5
+
+
+class InvalidImage(ValueError):
+    """
+    Raised when the uploaded bytes cannot be decoded as an image
+    """
+
+
+class AnalysisContext:
+    def __init__(self, image_bytes, text_detector, deadline=None):
+        """
+        Constructor for AnalysisContext class. Holds the per-request state shared
+        between the inference stages, so that the image is only decoded, sent for
+        OCR and searched for EXIF data once regardless of how many stages use it.
+
+        Args:
+            image_bytes (bytes): An input image
+            text_detector (TextDetector): OCR client used to detect text in the image
+            deadline (Deadline): Optional deadline of the request. If the OCR result
+                                 is not ready in time, or OCR keeps failing, the
+                                 image is analysed as if it held no text
+        """
+        self.image_bytes = image_bytes
+        self.text_detector = text_detector
+        self.deadline = deadline
+        self.ocr_calls = 0
+        self.ocr_failure = None
+        self.timings = {}
+        self.texts_future = None
+        self.ocr_boxes = None
+
+        self._values = {}
+        self._locks = {
+            "image": threading.Lock(),
+            "ocr_input": threading.Lock(),
+            "texts": threading.Lock(),
+            "capture_date": threading.Lock()
+        }
+
+    @property
+    def image(self):
+        """
+        Returns:
+            np.array: The decoded image of shape (H, W, C) (in BGR order)
+        """
+        return self._get("image", self._decode_image)
+
+    @property
+    def texts(self):
+        """
+        Returns:
+            OcrResult: The detected words, in reading order
+        """
+        return self._get("texts", self._detect_text)
+
+    @property
+    def ocr_input(self):
+        """
+        Returns:
+            OcrInput: The reduced image sent for OCR, cropped to the boxes given
+                      to crop_ocr_to if called before the OCR call
+        """
+        return self._get("ocr_input", self._reduce_ocr_input)
+
+    @property
+    def capture_date(self):
+        """
+        Returns:
+            datetime: The image capture datetime from its EXIF data, or None
+        """
+        return self._get("capture_date", self._read_capture_date)
+
+    def use_texts_from(self, texts_future):
+        """
+        Supplies the OCR result from a call made elsewhere, e.g. a batched
+        request covering several images, instead of calling the OCR client
+
+        Args:
+            texts_future (Future): Resolves to the OCR result for this image, in
+                                   the coordinates of the uploaded image
+        """
+        self.texts_future = texts_future
+
+    def crop_ocr_to(self, boxes):
+        """
+        Limits the image sent for OCR to the region holding the given boxes,
+        e.g. the detected objects. Has no effect once the OCR input is prepared
+
+        Args:
+            boxes (list): Boxes (x1, y1, x2, y2) of the regions holding the text
+        """
+        self.ocr_boxes = boxes
+
+    def get_ocr_stats(self):
+        """
+        Returns:
+            dict: The bytes uploaded and sent for OCR, see OcrInput.get_stats,
+                  or None if no image was sent for OCR
+        """
+        if "ocr_input" not in self._values:
+            return None
+        return self._values["ocr_input"].get_stats()
+
+    def _get(self, name, loader):
+        """
+        Computes a value on first access and caches it for subsequent stages.
+        Each value has its own lock so independent values can load concurrently.
+
+        Args:
+            name (str): Name of the cached value
+            loader (function): Function used to compute the value
+
+        Returns:
+            The cached value
+        """
+        if name in self._values:
+            return self._values[name]
+
+        with self._locks[name]:
+            if name not in self._values:
+                self._values[name] = loader()
+        return self._values[name]
+
+    def _decode_image(self):
+        """
+        Returns:
+            np.array: The image bytes decoded into a BGR array
+
+        Raises:
+            InvalidImage: If the bytes are not an image OpenCV can decode, so the
+                          request fails before its image joins a shared batch
+        """
+        with StageTimer('image_decode', self.timings):
+            np_arr = np.frombuffer(self.image_bytes, np.uint8)
+            image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR) if np_arr.size else None
+
+        if image is None:
+            raise InvalidImage("The uploaded file could not be decoded as an image")
+        return image
+
+    def _reduce_ocr_input(self):
+        """
+        Returns:
+            OcrInput: The image cropped, downscaled and re-encoded for OCR
+        """
+        image = self.image
+        with StageTimer('ocr_reduce', self.timings):
+            ocr_input = OcrInput.reduce(image, self.image_bytes, self.ocr_boxes)
+
+        OCR_BYTES.inc('original', amount=ocr_input.original_size)
+        OCR_BYTES.inc('sent', amount=len(ocr_input.content))
+        return ocr_input
+
+    def _detect_text(self):
+        """
+        Returns:
+            OcrResult: The OCR result for the image, in the coordinates of the
+                       uploaded image, or no words if the deadline passed first
+                       or every attempt failed, recorded in ocr_failure as
+                       'timeout' or 'unavailable'
+        """
+        self.ocr_calls += 1
+        ocr_input = self.ocr_input if self.texts_future is None else None
+        deadline = self.deadline.reserve(OCR_DEADLINE_RESERVE) if self.deadline is not None else None
+
+        t_start = time.perf_counter()
+        try:
+            if ocr_input is None:
+                texts = self.texts_future.result(timeout=deadline.remaining() if deadline is not None else None)
+            else:
+                texts = ocr_input.map_back(self.text_detector.get_text(ocr_input.content, deadline))
+
+        # Also raised as DeadlineExceeded by the text detector. Futures raise their
+        # own TimeoutError before Python 3.11, where it is not the builtin
+        except (TimeoutError, futures.TimeoutError):
+            self.ocr_failure = 'timeout'
+        except OcrUnavailable:
+            self.ocr_failure = 'unavailable'
+
+        if self.ocr_failure is not None:
+            OCR_FALLBACKS.inc(self.ocr_failure)
+            texts = OcrResult()
+        self.timings['ocr'] = time.perf_counter() - t_start
+        return texts
+
+    def _read_capture_date(self):
+        """
+        Returns:
+            datetime: The EXIF capture datetime, or None
+        """
+        return ExpiryDetector.get_capture_date(self.image_bytes)
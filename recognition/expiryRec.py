@@ -6,6 +6,9 @@ from glob import glob
 
 from detectors.textDetect import TextDetector
 from detectors.expiryDetect import ExpiryDetector
+from recognition.analysisContext import AnalysisContext
+from serving import tracing
+from serving.metrics import StageTimer
 
 years = 256
 months = 31
@@ -24,14 +27,18 @@ expiry_days = {
 
 
 class ExpiryInference:
-    def __init__(self):
+    def __init__(self, text_detector=None):
         """
         Constructor for ExpiryDetector class
+
+        Args:
+            text_detector (TextDetector): Optional OCR client to share with other
+                                          inference objects, created if not given
         """
         self.expiryDetector = ExpiryDetector(30, 30)
-        self.textDetector = TextDetector()
+        self.textDetector = text_detector or TextDetector()
 
-    def run_inference(self, path, image_bytes, predicted_class=None):
+    def run_inference(self, image_bytes, predicted_class=None, context=None):
         """
         Top level inference returning expiry detection prediction
 
@@ -39,27 +46,58 @@ class ExpiryInference:
             image_bytes (bytes): An input image
             predicted_class (string): Optional class to narrow down predictions
                                       valid predictions
+            context (AnalysisContext): Optional per-request context shared with
+                                       other stages, created if not given
 
         Returns:
             datetime: An expiration date prediction
         """
-        exif_capture = self.expiryDetector.get_capture_date(path)
+        if context is None:
+            context = AnalysisContext(image_bytes, self.textDetector)
+
+        t_start = time.perf_counter()
+        exif_capture = context.capture_date
+
+        # Run textual recognition
+        texts = context.texts
+
+        with StageTimer('expiry_parsing', context.timings):
+            prediction = self.predict_from_texts(texts, exif_capture, predicted_class)
+        context.timings['expiry_inference'] = time.perf_counter() - t_start
+
+        return prediction
+
+    def predict_from_texts(self, texts, exif_capture=None, predicted_class=None):
+        """
+        Searches the text detected in an image for expiry dates
+
+        Args:
+            texts (OcrResult): The detected words, in reading order
+            exif_capture (datetime): Optional image capture date
+            predicted_class (string): Optional class to narrow down predictions
+                                      valid predictions
 
-        # Run textual recognition and split any pre-process strings in list
-        texts = self.textDetector.get_text(image_bytes)
-        texts = self.expiryDetector.decompose_texts_list(texts)
+        Returns:
+            datetime: An expiration date prediction
+        """
+        # Split any pre-process strings in list
+        with tracing.span('decompose_texts_list'):
+            texts = self.expiryDetector.decompose_texts_list(texts)
 
         # Search list of words for month keyword matches and return indexes
-        detected_months = self.expiryDetector.find_month(texts)
+        with tracing.span('find_month'):
+            detected_months = self.expiryDetector.find_month(texts)
 
         # Month name/s were detected, attempt to decode each into a date
         if detected_months:
-            month_first_proposals = self.expiryDetector.month_first_search(texts, detected_months)
+            with tracing.span('month_first_search'):
+                month_first_proposals = self.expiryDetector.month_first_search(texts, detected_months)
         else:
             month_first_proposals = None
 
         # Get date proposals using a year first search
-        year_first_proposals = self.expiryDetector.year_first_search(texts)
+        with tracing.span('year_first_search'):
+            year_first_proposals = self.expiryDetector.year_first_search(texts)
 
         dates = self.reduce_candidates(month_first_proposals, year_first_proposals)
 
@@ -160,7 +198,7 @@ if __name__ == "__main__":
 
         t_start = time.perf_counter()
 
-        date = expiryInference.run_inference(cat, image_bytes)
+        date = expiryInference.run_inference(image_bytes, cat)
         print(date)
 
         t_finish = time.perf_counter()
@@ -0,0 +1,100 @@
+from collections import defaultdict
+from Levenshtein import distance
+
+
+class KeywordIndex:
+    def __init__(self, keywords, max_distance=1):
+        """
+        Constructor for KeywordIndex class, a deletion neighbourhood index
+        (as used by SymSpell) answering which keywords are within an edit
+        distance of 1 of a word. Every keyword is stored under itself and
+        each string made by deleting one of its characters. Two strings
+        within one edit of each other always share one of these keys, so a
+        lookup only checks the keywords stored under the word's own keys,
+        however large the dictionary grows. Multi-word keywords are left to
+        PhraseMatcher.
+
+        Args:
+            keywords (dict): Keyword dictionary in the format {"class": ["word1", "word2"]}
+            max_distance (int): The largest edit distance matched, at most 1
+        """
+        assert max_distance <= 1, "The deletion index only supports an edit distance of up to 1"
+
+        self.keywords = keywords
+        self.max_distance = max_distance
+
+        # Every occurrence of each keyword as (category position, item position,
+        # category). A keyword may appear more than once, even in one category
+        self.entries = defaultdict(list)
+        for category_position, (category, items) in enumerate(keywords.items()):
+            for item_position, item in enumerate(items):
+                if ' ' not in item:
+                    self.entries[item].append((category_position, item_position, category))
+
+        self.index = defaultdict(set)
+        for keyword in self.entries:
+            for key in self._get_keys(keyword):
+                self.index[key].add(keyword)
+
+    def lookup(self, word):
+        """
+        Finds the keywords within the maximum edit distance of a word
+
+        Args:
+            word (str): A cleaned word
+
+        Returns:
+            list: The matching keywords
+        """
+        candidates = set()
+        for key in self._get_keys(word):
+            candidates.update(self.index.get(key, ()))
+
+        # Keys only narrow down the candidates, e.g. "ab" and "ba" share the key "a"
+        return [keyword for keyword in candidates if distance(keyword, word) <= self.max_distance]
+
+    def match(self, words):
+        """
+        Searches for word matches in the keyword dictionary. Each word adds every
+        occurrence of its matching keywords, in the order of the dictionary
+
+        Args:
+            words (list): A list of textual items found inside a detection mask
+
+        Returns:
+            dict: The matched keywords of each category, in the format {category: [keyword1, keyword2]}
+        """
+        matches = {}
+
+        for word in words:
+            occurrences = sorted((entry + (keyword,) for keyword in self.lookup(word)
+                                  for entry in self.entries[keyword]))
+
+            for _, _, category, keyword in occurrences:
+                matches.setdefault(category, []).append(keyword)
+
+        return matches
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: The number of keywords and index keys
+        """
+        return {
+            "keywords": len(self.entries),
+            "keys": len(self.index)
+        }
+
+    def _get_keys(self, word):
+        """
+        Args:
+            word (str): A word or keyword
+
+        Returns:
+            set: The word and, when matching with an edit distance of 1, every
+                 string made by deleting one of its characters
+        """
+        keys = {word}
+        if self.max_distance:
+            keys.update(word[:index] + word[index + 1:] for index in range(len(word)))
+        return keys
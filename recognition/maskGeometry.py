@@ -0,0 +1,240 @@
+import cv2
+import numpy as np
+from shapely.geometry.polygon import Polygon
+from shapely.errors import TopologicalError
+
+
+# Longest side (in px) of the label image used to locate points inside outlines
+LABEL_IMAGE_SIZE = 1024
+
+
+def get_bounds(outlines):
+    """
+    Args:
+        outlines (list): A list of outlines, each a list of x, y coordinates
+
+    Returns:
+        np.ndarray: The bounding box of each outline, of shape (N, 4) as x1, y1, x2, y2
+    """
+    bounds = np.zeros((len(outlines), 4))
+
+    for index, outline in enumerate(outlines):
+        points = np.asarray(outline, dtype=float)
+        bounds[index, :2] = points.min(axis=0)
+        bounds[index, 2:] = points.max(axis=0)
+    return bounds
+
+
+def get_areas(outlines):
+    """
+    Computes the area of each outline with the shoelace formula, as shapely does
+
+    Args:
+        outlines (list): A list of outlines, each a list of x, y coordinates
+
+    Returns:
+        np.ndarray: The area of each outline, of shape (N)
+    """
+    areas = np.zeros(len(outlines))
+
+    for index, outline in enumerate(outlines):
+        x, y = np.asarray(outline, dtype=float).T
+        areas[index] = abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+    return areas
+
+
+def get_box_intersections(bounds):
+    """
+    Args:
+        bounds (np.ndarray): Bounding boxes of shape (N, 4) as x1, y1, x2, y2
+
+    Returns:
+        np.ndarray: The intersection area of every pair of boxes, of shape (N, N)
+    """
+    x1 = np.maximum(bounds[:, None, 0], bounds[None, :, 0])
+    y1 = np.maximum(bounds[:, None, 1], bounds[None, :, 1])
+    x2 = np.minimum(bounds[:, None, 2], bounds[None, :, 2])
+    y2 = np.minimum(bounds[:, None, 3], bounds[None, :, 3])
+    return np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+
+def get_overlaps(outlines, is_box, threshold):
+    """
+    Computes the overlap of every pair of outlines, i.e. their intersection
+    area divided by the smaller of their areas. The intersection of two
+    outlines is at most the intersection of their bounding boxes, so pairs
+    whose boxes overlap by no more than the threshold are ruled out without
+    any polygon geometry. Pairs of boxes are measured exactly from their
+    bounds, leaving only near duplicate polygons for shapely.
+
+    Args:
+        outlines (list): A list of outlines, each a list of x, y coordinates
+        is_box (np.ndarray): Whether each outline is an axis aligned box
+        threshold (float): Overlaps at or below this value are not computed exactly
+
+    Returns:
+        np.ndarray: Upper triangular matrix of shape (N, N) holding the overlap of
+                    each pair above the threshold, and zero for all other pairs
+    """
+    count = len(outlines)
+    areas = get_areas(outlines)
+    smallest = np.minimum(areas[:, None], areas[None, :])
+
+    # Upper bound on each overlap, exact for pairs of boxes
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overlaps = get_box_intersections(get_bounds(outlines)) / smallest
+    overlaps = np.triu(np.nan_to_num(overlaps, nan=0.0, posinf=0.0), k=1)
+
+    # Polygon pairs which may overlap are measured exactly
+    both_boxes = is_box[:, None] & is_box[None, :]
+    candidates = np.argwhere((overlaps > threshold) & ~both_boxes)
+    polygons = [None] * count
+
+    for index_a, index_b in candidates:
+        for index in (index_a, index_b):
+            if polygons[index] is None:
+                polygons[index] = Polygon(outlines[index])
+
+        try:
+            intersection = polygons[index_a].intersection(polygons[index_b]).area
+        except TopologicalError:
+            overlaps[index_a, index_b] = 0
+            continue
+
+        overlaps[index_a, index_b] = intersection / smallest[index_a, index_b]
+    return overlaps
+
+
+def suppress_overlaps(outlines, scores, threshold=0.8, is_box=None):
+    """
+    Finds the detections to keep when removing duplicate detections of the same
+    object. For every pair overlapping by more than the threshold, the lower
+    scoring detection is dropped (the first of the pair when the scores tie),
+    regardless of whether either has already been dropped by another pair.
+
+    Args:
+        outlines (list): A list of outlines, each a list of x, y coordinates
+        scores (list): The confidence score of each detection
+        threshold (float): The overlap above which two detections are duplicates
+        is_box (list): Optional flag per outline marking it as an axis aligned box
+
+    Returns:
+        np.ndarray: Boolean array marking the detections to keep
+    """
+    count = len(outlines)
+    if count < 2:
+        return np.ones(count, dtype=bool)
+
+    is_box = np.zeros(count, dtype=bool) if is_box is None else np.asarray(is_box, dtype=bool)
+    scores = np.asarray(scores, dtype=float)
+
+    duplicates = get_overlaps(outlines, is_box, threshold) > threshold
+    first_higher = scores[:, None] > scores[None, :]
+
+    # Drop the second of a pair if the first scores higher, otherwise the first
+    drop_second = (duplicates & first_higher).any(axis=0)
+    drop_first = (duplicates & ~first_higher).any(axis=1)
+    return ~(drop_first | drop_second)
+
+
+class LabelImage:
+    def __init__(self, outlines, max_size=LABEL_IMAGE_SIZE):
+        """
+        Constructor for LabelImage class, rasterising a set of (possibly
+        overlapping) outlines into one image, where bit i of a pixel is set if
+        the pixel is inside outline i. Once built, finding the outlines that
+        contain any number of points is a single array lookup.
+
+        Args:
+            outlines (list): A list of outlines, each a list of x, y coordinates
+            max_size (int): Longest side of the label image. Larger outlines are
+                            downscaled, so points within a few pixels of an edge
+                            may be placed on either side of it
+        """
+        self.count = len(outlines)
+        self.planes = max(1, -(-self.count // 64))
+
+        if not self.count:
+            self.origin, self.scale = np.zeros(2), 1.0
+            self.labels = np.zeros((1, 1, self.planes), dtype=np.uint64)
+            return
+
+        bounds = get_bounds(outlines)
+        self.origin = bounds[:, :2].min(axis=0)
+        extent = bounds[:, 2:].max(axis=0) - self.origin
+        self.scale = min(1.0, max_size / max(extent.max(), 1))
+
+        width, height = (np.ceil(extent * self.scale) + 1).astype(int)
+        self.labels = np.zeros((height, width, self.planes), dtype=np.uint64)
+
+        for index, outline in enumerate(outlines):
+            points = np.round((np.asarray(outline, dtype=float) - self.origin) * self.scale).astype(np.int32)
+
+            # Only the part of the image covered by the outline is drawn on
+            x1, y1 = points.min(axis=0)
+            x2, y2 = points.max(axis=0) + 1
+            patch = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            cv2.fillPoly(patch, [(points - (x1, y1)).astype(np.int32)], 1)
+
+            region = self.labels[y1:y2, x1:x2, index // 64]
+            region |= patch.astype(np.uint64) << np.uint64(index % 64)
+
+    def locate(self, points, groups):
+        """
+        Finds the outlines containing every point of each group of points,
+        e.g. the corners and centre of each OCR word
+
+        Args:
+            points (np.ndarray): Points of shape (N, 2) as x, y, sorted by group
+            groups (np.ndarray): The index of the first point of each group
+
+        Returns:
+            np.ndarray: Boolean array of shape (outlines, groups) marking the
+                        groups of points inside each outline
+        """
+        if not self.count or not len(groups):
+            return np.zeros((self.count, len(groups)), dtype=bool)
+
+        pixels = np.floor((np.asarray(points, dtype=float) - self.origin) * self.scale + 0.5).astype(int)
+        height, width = self.labels.shape[:2]
+        inside = ((pixels[:, 0] >= 0) & (pixels[:, 0] < width) & (pixels[:, 1] >= 0) & (pixels[:, 1] < height))
+
+        # Points off the image are inside no outline
+        labels = np.zeros((len(points), self.planes), dtype=np.uint64)
+        labels[inside] = self.labels[pixels[inside, 1], pixels[inside, 0]]
+
+        # A group is inside an outline if all of its points are
+        labels = np.bitwise_and.reduceat(labels, groups, axis=0)
+
+        indices = np.arange(self.count)
+        bits = np.left_shift(np.uint64(1), (indices % 64).astype(np.uint64))
+        return (labels[:, indices // 64].T & bits[:, None]) != 0
+
+
+def locate_words(outlines, texts, max_size=LABEL_IMAGE_SIZE):
+    """
+    Finds the words inside each outline, taking a word to be inside if its
+    corners and centre are. The outlines are drawn into a label image once,
+    then every word is looked up in it together
+
+    Args:
+        outlines (list): A list of outlines, each a list of x, y coordinates
+        texts (OcrResult): The detected words
+        max_size (int): Longest side of the label image
+
+    Returns:
+        list: For each outline, the words inside it, in the order of texts
+    """
+    # Words the OCR engine gave no box for are inside no outline
+    words = np.flatnonzero(np.isfinite(texts.boxes).all(axis=(1, 2)))
+
+    if not len(words) or not outlines:
+        return [[] for _ in outlines]
+
+    # The four corners and the centre of every word, as one array
+    boxes = texts.boxes[words].astype(float)
+    points = np.concatenate([boxes, boxes.mean(axis=1, keepdims=True)], axis=1)
+    groups = np.arange(len(words)) * points.shape[1]
+
+    contained = LabelImage(outlines, max_size).locate(points.reshape(-1, 2), groups)
+    return [[texts.tokens[index] for index in words[row]] for row in contained]
@@ -1,26 +1,53 @@
-import itertools
+import os
 import json
 import time
 import string
-import cv2
-import numpy as np
-from Levenshtein import distance
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from shapely.geometry.polygon import Polygon
-from shapely.errors import TopologicalError
 from copy import deepcopy
 
-from detectron2.config import get_cfg
+from detectron2.config import get_cfg, CfgNode
 from detectron2.utils.logger import setup_logger
 
 from detectors.objectDetect import ObjectDetector
+from detectors.batchScheduler import BatchScheduler
 from detectors.textDetect import TextDetector
+from recognition.analysisContext import AnalysisContext
+from recognition.keywordIndex import KeywordIndex
+from recognition.phraseMatcher import PhraseMatcher, match_keywords
+from recognition.maskGeometry import locate_words, suppress_overlaps
+from serving.metrics import StageTimer, DETECTION_LATENCY
 
 
 CONFIG_FILE = "resources/mask_rcnn_X_101_32x8d_FPN_3x.yaml"
 WEIGHTS = "resources/model_final.pth"
+BACKEND = "torch"
+PRECISION = "fp32"
 CONFIDENCE_THRESHOLD = 0.4
+OVERLAP_THRESHOLD = 0.8
 DICTIONARY_FILE = "resources/keywords.json"
 DEVICE = "cpu"
+OCR_WORKERS = 4
+BATCH_MAX_SIZE = 4
+BATCH_MAX_WAIT = 0.01
+
+# Whether to send only the region holding the detected objects for OCR. This
+# shrinks the upload, but the OCR call then waits for the detector rather than
+# running alongside it, and text outside the objects is not read. Off by
+# default, so request latency stays the slower of detection and OCR
+OCR_CROP_TO_OBJECTS = False
+
+# Model tiers a request can choose between, trading accuracy for speed. Each
+# has its own config and weights, and all but the default are loaded on first use.
+# Tiers with masks turned off skip the mask head and use box outlines instead
+TIERS = {
+    "accurate": {"config": CONFIG_FILE, "weights": WEIGHTS, "masks": True},
+    "fast": {"config": "resources/mask_rcnn_R_50_FPN_3x.yaml", "weights": "resources/model_r50.pth", "masks": True},
+    "boxes": {"config": CONFIG_FILE, "weights": WEIGHTS, "masks": False}
+}
+DEFAULT_TIER = "accurate"
 
 CLASSES = ["cereal",
            "condiment",
@@ -34,28 +61,183 @@ CLASSES = ["cereal",
            "soup"]
 
 
+def get_model_file(weights=WEIGHTS, backend=BACKEND, precision=PRECISION, tier=DEFAULT_TIER):
+    """
+    Gets the file a model is loaded from. Exported and quantised models are
+    saved next to the trained weights, e.g. model_final_int8.onnx, named after
+    their tier unless it is the default, e.g. model_final_boxes.onnx, as tiers
+    sharing weights export different graphs
+
+    Args:
+        weights (str): Path of the trained PyTorch weights
+        backend (str): The inference backend, either torch or onnx
+        precision (str): The model precision, either fp32 or int8
+        tier (str): Name of the tier in TIERS
+
+    Returns:
+        str: The file the detector is loaded from
+    """
+    if backend == "torch" and precision == "fp32":
+        return weights
+
+    name = os.path.splitext(weights)[0]
+    if tier != DEFAULT_TIER:
+        name += f"_{tier}"
+    if precision == "int8":
+        name += "_int8"
+    return name + (".onnx" if backend == "onnx" else ".pth")
+
+
+# The files of every tier, used to invalidate cached results when a model changes
+MODEL_FILES = list(dict.fromkeys(get_model_file(tier["weights"], tier=name) for name, tier in TIERS.items()))
+
+
+class TierUnavailable(Exception):
+    def __init__(self, tier, reason):
+        """
+        Raised when a model tier cannot be served, e.g. its model file is missing
+
+        Args:
+            tier (str): Name of the tier in TIERS
+            reason (str): Description of why the tier cannot be loaded
+        """
+        super().__init__(f"Model tier '{tier}' is not available: {reason}")
+        self.tier = tier
+        self.reason = reason
+
+
 class ObjectInference:
-    def __init__(self):
+    def __init__(self, text_detector=None):
         """
         Constructor for ObjectDetector class
+
+        Args:
+            text_detector (TextDetector): Optional OCR client to share with other
+                                          inference objects, created if not given
         """
-        num_classes = len(CLASSES)
         self.logger = setup_logger(name="recognition")
 
-        cfg = self._setup_config(num_classes, CONFIG_FILE, WEIGHTS, CONFIDENCE_THRESHOLD, DEVICE)
-        self.logger.info(f"Setting up config file \n {cfg}")
+        self.text_detector = text_detector or TextDetector()
+        self.executor = ThreadPoolExecutor(max_workers=OCR_WORKERS)
 
-        self.object_detector = ObjectDetector(cfg)
-        self.text_detector = TextDetector()
+        # Detector and batch scheduler of each loaded tier, and the reason each
+        # tier that failed to load did so, so it is not loaded again by every request
+        self.tiers = {}
+        self.failed_tiers = {}
+        self._lock = threading.Lock()
 
-        self.object_detector.register_metadata(CLASSES)
+        # The default tier is loaded up front, and kept as the object_detector
+        # and batch_scheduler attributes
+        self.object_detector, self.batch_scheduler = self.load_tier(DEFAULT_TIER)
 
         self.logger.info("Loading dictionary file")
         with open(DICTIONARY_FILE) as file:
             self.keywords = json.load(file)
 
+        # Fuzzy keyword lookups go through an index rather than comparing every keyword
+        self.keyword_index = KeywordIndex(self.keywords)
+
+        # Multi-word keywords are matched over the words in reading order
+        self.phrase_matcher = PhraseMatcher(self.keywords)
+
+    def load_tier(self, tier):
+        """
+        Gets the detector of a model tier, loading it if this is the first
+        time the tier has been used. Loaded tiers are shared by all callers
+
+        Args:
+            tier (str): Name of the tier in TIERS
+
+        Returns:
+            tuple: The tier's ObjectDetector and the BatchScheduler in front of it
+
+        Raises:
+            TierUnavailable: If the tier's model file is missing or failed to load
+        """
+        if tier not in TIERS:
+            raise ValueError(f"Unknown model tier: {tier}")
+
+        loaded = self.tiers.get(tier)
+        if loaded:
+            return loaded
+
+        if not self.is_available(tier):
+            raise TierUnavailable(tier, f"its model file {self.get_model_path(tier)} is missing")
+
+        with self._lock:
+            if tier in self.failed_tiers:
+                raise TierUnavailable(tier, self.failed_tiers[tier])
+
+            if tier not in self.tiers:
+                cfg = self.get_config(tier)
+                self.logger.info(f"Setting up config file for the {tier} tier \n {cfg}")
+
+                try:
+                    object_detector = ObjectDetector(cfg)
+                except Exception as e:
+                    self.failed_tiers[tier] = f"loading failed with {type(e).__name__}: {e}"
+                    raise TierUnavailable(tier, self.failed_tiers[tier]) from e
+                object_detector.register_metadata(CLASSES)
+
+                # Concurrent requests are grouped into batches in front of the detector
+                batch_scheduler = BatchScheduler(object_detector, BATCH_MAX_SIZE, BATCH_MAX_WAIT)
+                self.tiers[tier] = (object_detector, batch_scheduler)
+            return self.tiers[tier]
+
+    def get_tiers(self):
+        """
+        Returns:
+            dict: The loaded tiers, mapping each name to its ObjectDetector and
+                  BatchScheduler, copied so it can be read while a request
+                  loads another tier
+        """
+        with self._lock:
+            return dict(self.tiers)
+
     @staticmethod
-    def _setup_config(num_classes, config_file, weights, confidence_thres, device):
+    def get_model_path(tier=DEFAULT_TIER):
+        """
+        Args:
+            tier (str): Name of the tier in TIERS
+
+        Returns:
+            str: The file the tier's detector is loaded from, for the configured
+                 backend and precision
+        """
+        return get_model_file(TIERS[tier]["weights"], BACKEND, PRECISION, tier)
+
+    @classmethod
+    def is_available(cls, tier):
+        """
+        Args:
+            tier (str): Name of the tier in TIERS
+
+        Returns:
+            bool: Whether the tier's model file exists, so the tier can be loaded
+        """
+        return os.path.exists(cls.get_model_path(tier))
+
+    @classmethod
+    def get_config(cls, tier=DEFAULT_TIER, backend=BACKEND, precision=PRECISION):
+        """
+        Creates the configuration of a model tier
+
+        Args:
+            tier (str): Name of the tier in TIERS
+            backend (str): The inference backend, either torch or onnx
+            precision (str): The model precision, either fp32 or int8
+
+        Returns:
+            cfg: Detectron2 configuration file
+        """
+        weights = TIERS[tier]["weights"]
+        return cls._setup_config(len(CLASSES), TIERS[tier]["config"], weights, CONFIDENCE_THRESHOLD, DEVICE,
+                                 backend, get_model_file(weights, "onnx", precision, tier), precision,
+                                 get_model_file(weights, "torch", "int8", tier), TIERS[tier]["masks"])
+
+    @staticmethod
+    def _setup_config(num_classes, config_file, weights, confidence_thres, device,
+                      backend="torch", onnx_model=None, precision="fp32", int8_weights=None, mask_on=True):
         """
         Modifies an existing configuration with project specific params
 
@@ -65,6 +247,11 @@ class ObjectInference:
             weights (str): Weights for a pre-trained model (transfer learning)
             confidence_thres (float): The confidence threshold in order for a detection to be returned
             device (str): The device type used for inference (CPU/GPU)
+            backend (str): The inference backend, either torch or onnx
+            onnx_model (str): Path of the exported model used by the onnx backend
+            precision (str): The model precision, either fp32 or int8
+            int8_weights (str): Path of the quantised weights used by the torch backend at int8
+            mask_on (bool): Whether to predict masks, or only boxes
 
         Returns:
             cfg: Detectron2 configuration file
@@ -75,47 +262,75 @@ class ObjectInference:
         cfg.MODEL.WEIGHTS = weights
         cfg.MODEL.ROI_HEADS.NUM_CLASSES = num_classes
         cfg.MODEL.DEVICE = device
+        cfg.MODEL.MASK_ON = mask_on
 
         # Set score_threshold for builtin models
         cfg.MODEL.RETINANET.SCORE_THRESH_TEST = confidence_thres
         cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = confidence_thres
         cfg.MODEL.PANOPTIC_FPN.COMBINE.INSTANCES_CONFIDENCE_THRESH = confidence_thres
+
+        # Project specific options, read by the ObjectDetector
+        cfg.QST = CfgNode()
+        cfg.QST.BACKEND = backend
+        cfg.QST.ONNX_MODEL = onnx_model
+        cfg.QST.PRECISION = precision
+        cfg.QST.INT8_WEIGHTS = int8_weights
         cfg.freeze()
         return cfg
 
-    def run_inference(self, image_bytes):
+    def run_inference(self, image_bytes, context=None, tier=DEFAULT_TIER):
         """
         Top level inference returning object detection predictions
 
         Args:
             image_bytes (bytes): An input image
+            context (AnalysisContext): Optional per-request context shared with
+                                       other stages, created if not given
+            tier (str): Name of the model tier to detect objects with
 
         Returns:
             dict: A dictionary containing a detection results
         """
-        np_arr = np.frombuffer(image_bytes, np.uint8)
-        image_np = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        if context is None:
+            context = AnalysisContext(image_bytes, self.text_detector)
+
+        _, batch_scheduler = self.load_tier(tier)
+
+        # Without cropping, the OCR call only depends on the image, so send it off
+        # while the detector runs and join the two results before the textual
+        # analysis. OCR results supplied by a batched call are never cropped
+        crop = OCR_CROP_TO_OBJECTS and context.texts_future is None
+        t_total = time.perf_counter()
+        if not crop:
+            self.logger.info("Calling OCR backend...")
+            texts_future = self.executor.submit(contextvars.copy_context().run, lambda: context.texts)
+
+        image = context.image
 
         self.logger.info("Running detectron2 recognition...")
-        t_start = time.perf_counter()
-        objects = self.object_detector.get_pred_list(image_np)
-        t_finish = time.perf_counter()
-        obj_t = t_finish - t_start
-        self.logger.info(f"Inference time: {obj_t:0.4f} seconds")
+        with StageTimer('detection', context.timings) as timer:
+            objects = batch_scheduler.get_pred_list(image)
+        DETECTION_LATENCY.observe(timer.elapsed, tier)
+        self.logger.info(f"Inference time: {timer.elapsed:0.4f} seconds")
 
         # Reduce detections of the same object to highest scoring prediction
-        reduced = self._reduce_multi_pred(objects)
+        with StageTimer('reduce_multi_pred', context.timings):
+            reduced = self._reduce_multi_pred(objects)
+
+        if crop:
+            self.logger.info("Calling OCR backend on the detected objects...")
+            context.crop_ocr_to([detected_object['bbox'] for detected_object in reduced])
+            texts_future = self.executor.submit(contextvars.copy_context().run, lambda: context.texts)
 
-        self.logger.info("Calling google vision API...")
-        t_start = time.perf_counter()
-        texts = self.text_detector.get_text(image_bytes)
+        with StageTimer('ocr_wait', context.timings):
+            texts = texts_future.result()
 
         # Locate detected text inside each detected object
         self.logger.info("Analysing textual content")
-        data = self._analyse_text(reduced, texts)
-        t_finish = time.perf_counter()
-        text_t = t_finish - t_start
-        self.logger.info(f"Lexical analysis time: {text_t:0.4f} seconds")
+        with StageTimer('analyse_text', context.timings) as timer:
+            data = self._analyse_text(reduced, texts)
+        context.timings['object_inference'] = time.perf_counter() - t_total
+        self.logger.info(f"Lexical analysis time: {timer.elapsed:0.4f} seconds")
 
         return data
 
@@ -125,19 +340,20 @@ class ObjectInference:
 
         Args:
             detected_objects (dict):
-            detected_texts (dict):
+            detected_texts (OcrResult):
 
         Returns:
 
         """
         ret = []
 
-        for detected_object in detected_objects:
+        outlines = [self._get_outline(detected_object) for detected_object in detected_objects]
+        located_words = self._locate_words(outlines, detected_texts)
+
+        for detected_object, detected_words in zip(detected_objects, located_words):
             pack = detected_object.copy()
             del pack['mask']
 
-            detected_words = self._locate_words(detected_object['mask'], detected_texts)
-
             # Cleanup words
             cleaned_words = []
             for detected_word in detected_words:
@@ -167,7 +383,7 @@ class ObjectInference:
                     cleaned_words.append(word)
 
             # Prepare output
-            pack['matched_words'] = self._match_in_dict(cleaned_words, self.keywords)
+            pack['matched_words'] = match_keywords(cleaned_words, self.keyword_index, self.phrase_matcher)
 
             textual_pred = self._textual_prediction(pack['matched_words'])
 
@@ -213,26 +429,36 @@ class ObjectInference:
             return None
 
     @staticmethod
-    def _locate_words(obj_mask, texts):
+    def _get_outline(detection):
         """
-        Find which textual items are located inside a given mask
+        Gets the outline of a detection, i.e. its mask, or its bounding box
+        when it was predicted without a mask
 
         Args:
-            obj_mask (list): A list of x, y coordinates, dictating the location of a mask
-            texts (dict):
+            detection (dict): A prediction dictionary
+
+        Returns:
+            list: A list of x, y coordinates
+        """
+        if detection['mask'] is not None:
+            return detection['mask']
 
-        Returns (list): All text contained inside the bounds of a mask
+        x1, y1, x2, y2 = detection['bbox']
+        return [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
 
+    @staticmethod
+    def _locate_words(outlines, texts):
         """
-        ret = []
-        item_poly = Polygon(obj_mask)
+        Find which textual items are located inside each of the given masks
 
-        for text in texts:
-            text_poly = Polygon(texts[text])
+        Args:
+            outlines (list): A list of masks, each a list of x, y coordinates
+            texts (OcrResult): The detected words
 
-            if item_poly.contains(text_poly):
-                ret.append(text)
-        return ret
+        Returns (list): For each mask, all text contained inside its bounds
+        """
+        # The masks are drawn into one label image and all words looked up in it at once
+        return locate_words(outlines, texts)
 
     @staticmethod
     def _reduce_multi_pred(predictions):
@@ -247,58 +473,16 @@ class ObjectInference:
         Returns:
             list: A reduced list of prediction dictionaries.
         """
-        reduce = predictions.copy()
-
-        # Iterate through all combinations of masks, comparing each only once
-        for ((index_a, a), (index_b, b)) in itertools.combinations(enumerate(predictions), 2):
-            a_polygon = Polygon(a['mask'])
-            b_polygon = Polygon(b['mask'])
-
-            # Calculate the intersection between the masks
-            try:
-                intersection = a_polygon.intersection(b_polygon).area
-            except TopologicalError:
-                continue
+        outlines = [ObjectInference._get_outline(prediction) for prediction in predictions]
+        scores = [prediction['object_score'] for prediction in predictions]
+        is_box = [prediction['mask'] is None for prediction in predictions]
 
-            # How much overlap exists between them
-            smallest = min(a_polygon.area, b_polygon.area)
-            overlap = intersection / smallest
-
-            # If high overlap, remove the lower from the result
-            if overlap > 0.8:
-                if a['object_score'] > b['object_score']:
-                    reduce[index_b] = None
-                else:
-                    reduce[index_a] = None
+        # Overlaps are compared for all pairs at once, see maskGeometry.get_overlaps
+        keep = suppress_overlaps(outlines, scores, OVERLAP_THRESHOLD, is_box)
 
-        ret = [x for x in reduce if x]
+        ret = [prediction for prediction, kept in zip(predictions, keep) if kept]
         return ret
 
-    @staticmethod
-    def _match_in_dict(words, keywords):
-        """
-        Searches for word matches in a keyword dictionary
-
-        Args:
-            words (list): A list of textual items found inside a detection mask
-            keywords (dict): Keyword dictionary in the format {"class": ["word1", "word2"]}
-
-        Returns (dict): A data structure containing a list of matched words and
-
-        """
-        matches = {}
-
-        for word in words:
-            for category, items in keywords.items():
-                for item in items:
-                    if distance(item, word) <= 1:
-                        try:
-                            matches[category].append(item)
-                        except KeyError:
-                            matches[category] = [item]
-
-        return matches
-
     @staticmethod
     def _textual_prediction(matched_text):
         """
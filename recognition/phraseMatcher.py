@@ -0,0 +1,174 @@
+from collections import defaultdict, deque
+
+from recognition.keywordIndex import KeywordIndex
+
+
+class PhraseMatcher:
+    def __init__(self, keywords, max_distance=1):
+        """
+        Constructor for PhraseMatcher class, an Aho-Corasick automaton over the
+        words of the multi-word keywords in the dictionary (e.g. "baked beans").
+        OCR words are mapped to every phrase word within the edit distance,
+        through a KeywordIndex, and fed through the automaton, so every phrase
+        in a stream of words is found in a single pass. Words of one character
+        (e.g. the "k" of "special k") only match exactly, as any single
+        character is within one edit of them.
+
+        Args:
+            keywords (dict): Keyword dictionary in the format {"class": ["word1", "two words"]}
+            max_distance (int): The largest edit distance of each word of a phrase, at most 1
+        """
+        # Every occurrence of each phrase as (category position, item position,
+        # category, phrase), keyed by the phrase's words
+        self.entries = defaultdict(list)
+        for category_position, (category, items) in enumerate(keywords.items()):
+            for item_position, item in enumerate(items):
+                words = tuple(item.split())
+                if len(words) > 1:
+                    self.entries[words].append((category_position, item_position, category, item))
+
+        # Phrase words are the symbols of the automaton
+        self.symbols = {}
+        for words in self.entries:
+            for word in words:
+                self.symbols.setdefault(word, len(self.symbols))
+        self.word_index = KeywordIndex({"words": [word for word in self.symbols if len(word) > 1]}, max_distance)
+
+        # Trie of the phrases, where state 0 is the root
+        self.transitions = [{}]
+        self.outputs = [[]]
+        for words in self.entries:
+            state = 0
+            for word in words:
+                symbol = self.symbols[word]
+                if symbol not in self.transitions[state]:
+                    self.transitions[state][symbol] = len(self.transitions)
+                    self.transitions.append({})
+                    self.outputs.append([])
+                state = self.transitions[state][symbol]
+            self.outputs[state].append(words)
+
+        # Failure links point to the state of the longest proper suffix that is
+        # also a prefix of a phrase, filled breadth first so shorter ones exist
+        self.failures = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for symbol, child in self.transitions[state].items():
+                failure = self.failures[state]
+                while failure and symbol not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                self.failures[child] = self.transitions[failure].get(symbol, 0)
+
+                # Phrases ending in a suffix also end here, e.g. "hot chilli" in "red hot chilli"
+                self.outputs[child] = self.outputs[child] + self.outputs[self.failures[child]]
+                queue.append(child)
+
+    def match(self, words):
+        """
+        Searches for phrases in a stream of words, in the order they were read
+
+        Args:
+            words (list): A list of textual items found inside a detection mask
+
+        Returns:
+            dict: The matched phrases of each category, in the format {category: [phrase1, phrase2]}
+        """
+        matches = {}
+        for _, _, category, phrase in self.find(words):
+            matches.setdefault(category, []).append(phrase)
+        return matches
+
+    def find(self, words):
+        """
+        Searches for phrases in a stream of words, in the order they were read
+
+        Args:
+            words (list): A list of textual items found inside a detection mask
+
+        Returns:
+            list: Each phrase found as (start, end, category, phrase), where
+                  words[start:end] are the words it was matched on, ordered by
+                  end position and then by the order of the dictionary
+        """
+        found = []
+        if len(self.transitions) == 1:
+            return found
+
+        # A misread word can be close to several phrase words (e.g. "bean" to
+        # "beans", "beanz" and "bran"), so the automaton is run on all of them
+        # at once, as a set of states
+        states = set()
+        for end, word in enumerate(words, 1):
+            symbols = self._get_symbols(word)
+            states = {self._get_next_state(state, symbol) for state in states | {0} for symbol in symbols}
+            states.discard(0)
+
+            phrases = {phrase for state in states for phrase in self.outputs[state]}
+            occurrences = sorted(entry for phrase in phrases for entry in self.entries[phrase])
+            for _, _, category, phrase in occurrences:
+                found.append((end - len(phrase.split()), end, category, phrase))
+
+        return found
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: The number of phrases, phrase words and automaton states
+        """
+        return {
+            "phrases": len(self.entries),
+            "words": len(self.symbols),
+            "states": len(self.transitions)
+        }
+
+    def _get_next_state(self, state, symbol):
+        """
+        Args:
+            state (int): The current state
+            symbol (int): The next phrase word
+
+        Returns:
+            int: The state of the longest phrase prefix ending in the symbol,
+                 following failure links until one continues with it
+        """
+        while state and symbol not in self.transitions[state]:
+            state = self.failures[state]
+        return self.transitions[state].get(symbol, 0)
+
+    def _get_symbols(self, word):
+        """
+        Args:
+            word (str): A cleaned word
+
+        Returns:
+            set: The symbols of the phrase words within the edit distance of
+                 the word, empty if it is not part of any phrase
+        """
+        candidates = set(self.word_index.lookup(word)) if len(word) > 1 else set()
+        if word in self.symbols:
+            candidates.add(word)
+        return {self.symbols[candidate] for candidate in candidates}
+
+
+def match_keywords(words, keyword_index, phrase_matcher):
+    """
+    Searches for single word and phrase keywords in a stream of words. A phrase
+    is counted in place of the single word keywords of the words it was matched
+    on, so its words are not counted twice
+
+    Args:
+        words (list): A list of textual items found inside a detection mask
+        keyword_index (KeywordIndex): Index of the single word keywords
+        phrase_matcher (PhraseMatcher): Automaton of the phrase keywords
+
+    Returns:
+        dict: The matched keywords of each category, in the format {category: [keyword1, "two words"]}
+    """
+    found = phrase_matcher.find(words)
+    covered = {index for start, end, _, _ in found for index in range(start, end)}
+
+    matches = keyword_index.match([word for index, word in enumerate(words) if index not in covered])
+    for _, _, category, phrase in found:
+        matches.setdefault(category, []).append(phrase)
+    return matches
@@ -0,0 +1,148 @@
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+
+# gRPC must be told about the fork before the OCR client is created
+os.environ.setdefault('GRPC_ENABLE_FORK_SUPPORT', '1')
+
+import torch
+from werkzeug.serving import make_server
+
+import api
+from serving.processMemory import get_memory_usage
+
+
+HOST = '0.0.0.0'
+PORT = 5000
+WORKERS = 4
+REPORT_INTERVAL = 300
+
+logger = logging.getLogger("serve")
+
+
+def run_worker(sock, threads):
+    """
+    Serves the API on a listening socket inherited from the master process
+
+    Args:
+        sock (socket): The listening socket shared by all workers
+        threads (int): Number of torch intra-op threads for this worker
+    """
+    # Stop oversubscribing cores, as each worker would otherwise use them all
+    torch.set_num_threads(threads)
+
+    api.registry.after_fork()
+    api.cache.connect()
+
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, api.app, threaded=True, fd=sock.fileno())
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    logger.info(f"Worker {os.getpid()} serving with {threads} torch threads")
+    server.serve_forever()
+
+
+def spawn_worker(sock, threads):
+    """
+    Forks a worker process
+
+    Args:
+        sock (socket): The listening socket shared by all workers
+        threads (int): Number of torch intra-op threads for the worker
+
+    Returns:
+        int: The worker's process id
+    """
+    pid = os.fork()
+
+    if pid == 0:
+        try:
+            run_worker(sock, threads)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def report_memory(workers):
+    """
+    Logs the memory unique to each worker and the memory shared with the
+    master process, i.e. the copy-on-write model weights
+
+    Args:
+        workers (list): Process ids of the workers
+    """
+    for pid in [os.getpid()] + list(workers):
+        usage = get_memory_usage(pid)
+        if not usage:
+            continue
+
+        role = "master" if pid == os.getpid() else "worker"
+        logger.info(f"{role} {pid}: rss {usage['rss'] / 2 ** 20:.1f}MB, "
+                    f"unique {usage['unique'] / 2 ** 20:.1f}MB, "
+                    f"shared {usage['shared'] / 2 ** 20:.1f}MB, "
+                    f"pss {usage['pss'] / 2 ** 20:.1f}MB")
+
+
+def main():
+    """
+    Pre-fork server entry point. The models are loaded once, by importing the
+    API in this master process, before the workers are forked. The workers
+    inherit the model weights and share their pages copy-on-write, rather than
+    each loading their own copy.
+    """
+    parser = argparse.ArgumentParser(description="Serve the QST API from pre-forked workers")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    # Move everything loaded so far out of the garbage collector's reach, so
+    # collections in the workers do not write to (and so copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+    workers = {spawn_worker(sock, threads) for _ in range(args.workers)}
+    logger.info(f"Started {args.workers} workers on {args.host}:{args.port}")
+
+    def shutdown(signum, frame):
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    last_report = None
+    while True:
+        # Replace any worker that has exited
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid in workers:
+            logger.warning(f"Worker {pid} exited, restarting")
+            workers.remove(pid)
+            workers.add(spawn_worker(sock, threads))
+
+        if last_report is None or time.monotonic() - last_report > REPORT_INTERVAL:
+            report_memory(workers)
+            last_report = time.monotonic()
+
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    main()
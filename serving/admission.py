@@ -0,0 +1,140 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    def __init__(self, status, reason, retry_after):
+        """
+        Raised when a request is turned away by admission control
+
+        Args:
+            status (int): The HTTP status to respond with (429 or 503)
+            reason (str): Description of why the request was rejected
+            retry_after (int): Seconds the client should wait before retrying
+        """
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency, max_queue, queue_timeout):
+        """
+        Constructor for AdmissionController class. Limits the number of requests
+        processed at once, holding a bounded number of further requests in a
+        queue and rejecting the rest immediately instead of letting latency
+        collapse for every caller.
+
+        Args:
+            max_concurrency (int): Number of requests processed at the same time
+            max_queue (int): Number of requests allowed to wait for a free slot
+            queue_timeout (float): Longest time (in seconds) a request may wait in the queue
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+        self.active = 0
+        self.waiting = 0
+        self.service_time = None
+
+        self.stats = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0
+        }
+
+    def acquire(self):
+        """
+        Waits for a free processing slot
+
+        Returns:
+            float: Time the request was admitted at, to be passed to release
+
+        Raises:
+            Overloaded: With status 429 if the queue is full, or 503 if no slot
+                        became free within the queue timeout
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_queue:
+                    self.stats["rejected_queue_full"] += 1
+                    raise Overloaded(429, "Request queue is full", self._retry_after())
+                self.waiting += 1
+
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+
+            if not acquired:
+                with self._lock:
+                    self.stats["rejected_timeout"] += 1
+                raise Overloaded(503, "Timed out waiting for a free worker", self._retry_after())
+
+        with self._lock:
+            self.active += 1
+            self.stats["admitted"] += 1
+        return time.perf_counter()
+
+    def release(self, admitted_at):
+        """
+        Frees a processing slot
+
+        Args:
+            admitted_at (float): The value returned by acquire
+        """
+        elapsed = time.perf_counter() - admitted_at
+
+        with self._lock:
+            self.active -= 1
+
+            # Exponentially weighted average of the time a request holds a slot
+            if self.service_time is None:
+                self.service_time = elapsed
+            else:
+                self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+
+        self._slots.release()
+
+    @contextmanager
+    def admit(self):
+        """
+        Context manager holding a processing slot for the duration of a request
+        """
+        admitted_at = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: The queue depth, active requests and rejection counters
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["active"] = self.active
+            stats["queue_depth"] = self.waiting
+            stats["max_concurrency"] = self.max_concurrency
+            stats["max_queue"] = self.max_queue
+            stats["mean_service_time"] = self.service_time
+        return stats
+
+    def _retry_after(self):
+        """
+        Estimates how long it would take for the current queue to clear
+
+        Returns:
+            int: A Retry-After value in whole seconds
+        """
+        service_time = self.service_time or 1
+        return max(1, math.ceil(service_time * (self.waiting + 1) / self.max_concurrency))
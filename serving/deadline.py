@@ -0,0 +1,53 @@
+import time
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a call could not finish within the time left to its request
+    """
+
+
+class Deadline:
+    def __init__(self, budget, start=None):
+        """
+        Constructor for Deadline class, the time by which a request has to be
+        answered. Passed down to the calls made for the request, so each can
+        give up once the request has run out of time
+
+        Args:
+            budget (float): The time (in seconds) the request may take
+            start (float): Optional perf_counter time the budget runs from,
+                           defaults to now
+        """
+        self.budget = budget
+        self.expires_at = (time.perf_counter() if start is None else start) + budget
+
+    def remaining(self):
+        """
+        Returns:
+            float: The time (in seconds) left before the deadline, 0 once passed
+        """
+        return max(self.expires_at - time.perf_counter(), 0.0)
+
+    @property
+    def expired(self):
+        """
+        Returns:
+            bool: Whether the deadline has passed
+        """
+        return self.remaining() <= 0
+
+    def reserve(self, seconds):
+        """
+        Creates an earlier deadline, keeping time back for the work that
+        follows a call, e.g. analysing its result
+
+        Args:
+            seconds (float): The time (in seconds) to keep back
+
+        Returns:
+            Deadline: A deadline expiring the given time before this one
+        """
+        deadline = Deadline(self.budget)
+        deadline.expires_at = self.expires_at - seconds
+        return deadline
@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from serving.deadline import DeadlineExceeded
+
+
+class HedgedCaller:
+    def __init__(self, max_attempts=2, percentile=95, initial_delay=1.0, window=256, min_samples=20,
+                 is_retryable=None, max_workers=16):
+        """
+        Constructor for HedgedCaller class. Makes calls to a remote service
+        within a deadline, sending a second (hedged) copy of a call still
+        outstanding after the usual latency of the service, and retrying calls
+        that fail with a transient error. The first attempt to succeed wins, so
+        a single slow or failed response does not hold up the request
+
+        Args:
+            max_attempts (int): The most attempts made per call, hedges and
+                                retries included
+            percentile (float): Percentile (0-100) of the recent latencies after
+                                which an outstanding call is hedged
+            initial_delay (float): Hedging delay (in seconds) used until enough
+                                   latencies have been recorded
+            window (int): Number of recent latencies kept
+            min_samples (int): Number of latencies needed to use the percentile
+            is_retryable (function): Takes an exception and returns whether the
+                                     call may be retried, none are by default
+            max_workers (int): Number of attempts running at once
+        """
+        self.max_attempts = max_attempts
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.is_retryable = is_retryable or (lambda error: False)
+        self.max_workers = max_workers
+
+        self.latencies = deque(maxlen=window)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "calls": 0,
+            "hedged": 0,
+            "retried": 0,
+            "won_by_later_attempt": 0,
+            "failed": 0,
+            "timed_out": 0
+        }
+
+    def get_delay(self):
+        """
+        Returns:
+            float: The time (in seconds) after which an outstanding call is hedged
+        """
+        with self._lock:
+            latencies = list(self.latencies)
+
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        return float(np.percentile(latencies, self.percentile))
+
+    def call(self, function, deadline=None):
+        """
+        Calls a function, hedging and retrying it until an attempt succeeds,
+        the attempts run out or the deadline passes
+
+        Args:
+            function (function): Makes one attempt, taking the time (in seconds)
+                                 left before the deadline, or None
+            deadline (Deadline): Optional deadline of the request
+
+        Returns:
+            The result of the first attempt to succeed
+
+        Raises:
+            DeadlineExceeded: If no attempt succeeded before the deadline
+            Exception: The error of the last attempt, if every attempt failed,
+                       or the first error that cannot be retried
+        """
+        self._count("calls")
+        if deadline is not None and deadline.expired:
+            self._count("timed_out")
+            raise DeadlineExceeded("The deadline passed before the call was made")
+
+        executor = self._get_executor()
+        delay = self.get_delay()
+        attempts = {}
+        errors = []
+
+        def launch():
+            timeout = deadline.remaining() if deadline is not None else None
+            future = executor.submit(contextvars.copy_context().run, function, timeout)
+            attempts[future] = (len(attempts), time.perf_counter())
+            return future
+
+        pending = {launch()}
+        next_hedge = time.perf_counter() + delay
+
+        while True:
+            timeouts = [deadline.remaining()] if deadline is not None else []
+            if len(attempts) < self.max_attempts:
+                timeouts.append(max(next_hedge - time.perf_counter(), 0))
+            done, pending = wait(pending, timeout=min(timeouts, default=None), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    self._record(*attempts[future])
+                    for outstanding in pending:
+                        outstanding.cancel()
+                    return future.result()
+
+                if not self.is_retryable(error):
+                    raise error
+                errors.append(error)
+
+            if deadline is not None and deadline.expired:
+                self._count("timed_out")
+                raise DeadlineExceeded(f"No result within the {deadline.budget:g}s deadline")
+
+            if len(attempts) < self.max_attempts:
+                # Failed attempts are retried straight away, slow ones once the delay has passed
+                if done:
+                    self._count("retried")
+                    pending.add(launch())
+                    next_hedge = time.perf_counter() + delay
+                elif time.perf_counter() >= next_hedge:
+                    self._count("hedged")
+                    pending.add(launch())
+                    next_hedge = time.perf_counter() + delay
+
+            elif not pending:
+                self._count("failed")
+                raise errors[-1]
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: The calls made, how many were hedged, retried, won by a later
+                  attempt, failed or timed out, and the current hedging delay
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        stats["delay"] = round(self.get_delay(), 4)
+        return stats
+
+    def _get_executor(self):
+        """
+        Returns:
+            ThreadPoolExecutor: The threads running the attempts, created on first
+                                use in each process, as threads do not survive a fork
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedged-call")
+                self._pid = os.getpid()
+        return self._executor
+
+    def _record(self, index, start):
+        """
+        Records the latency of a successful attempt
+
+        Args:
+            index (int): The position of the attempt, 0 for the first
+            start (float): perf_counter time the attempt was made
+        """
+        with self._lock:
+            self.latencies.append(time.perf_counter() - start)
+            if index > 0:
+                self.stats["won_by_later_attempt"] += 1
+
+    def _count(self, name):
+        """
+        Args:
+            name (str): The statistic to increment
+        """
+        with self._lock:
+            self.stats[name] += 1
@@ -0,0 +1,204 @@
+import time
+import bisect
+import threading
+
+from serving import tracing
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Counter:
+    def __init__(self, name, description, labelnames=()):
+        """
+        Constructor for Counter class, a monotonically increasing value
+
+        Args:
+            name (str): The metric name
+            description (str): Help text describing the metric
+            labelnames (tuple): Names of the labels the values are split by
+        """
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        """
+        Increments the counter
+
+        Args:
+            labels (str): A value for each of the label names
+            amount (float): The amount to increment by
+        """
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self, const_labels=None):
+        """
+        Args:
+            const_labels (dict): Optional labels added to every value, e.g. the worker
+
+        Returns:
+            list: Lines of the metric in Prometheus text format
+        """
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        const_labels = const_labels or {}
+        names = tuple(const_labels) + self.labelnames
+
+        with self._lock:
+            for labels, value in sorted(self.values.items()):
+                labels = tuple(const_labels.values()) + labels
+                lines.append(f"{self.name}{_format_labels(names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Constructor for Histogram class, counting observations in cumulative buckets
+
+        Args:
+            name (str): The metric name
+            description (str): Help text describing the metric
+            labelnames (tuple): Names of the labels the observations are split by
+            buckets (tuple): Sorted upper bounds of the buckets
+        """
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        """
+        Records an observation
+
+        Args:
+            value (float): The observed value, e.g. a duration in seconds
+            labels (str): A value for each of the label names
+        """
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts, total = self.values.get(labels, ([0] * (len(self.buckets) + 1), 0))
+            counts[index] += 1
+            self.values[labels] = (counts, total + value)
+
+    def render(self, const_labels=None):
+        """
+        Args:
+            const_labels (dict): Optional labels added to every value, e.g. the worker
+
+        Returns:
+            list: Lines of the metric in Prometheus text format
+        """
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        const_labels = const_labels or {}
+        names = tuple(const_labels) + self.labelnames
+
+        with self._lock:
+            for labels, (counts, total) in sorted(self.values.items()):
+                labels = tuple(const_labels.values()) + labels
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(names + ('le',), labels + (bound,))} {cumulative}")
+
+                lines.append(f"{self.name}_sum{_format_labels(names, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(names, labels)} {cumulative}")
+        return lines
+
+
+class StageTimer:
+    def __init__(self, stage, timings=None):
+        """
+        Context manager recording the duration of a pipeline stage in the
+        stage latency histogram, and as a span of the current request's trace
+
+        Args:
+            stage (str): Name of the stage
+            timings (dict): Optional dictionary the duration is also stored in,
+                            e.g. the timings of an AnalysisContext
+        """
+        self.stage = stage
+        self.timings = timings
+        self.start = None
+        self.elapsed = None
+        self.span = None
+        self._token = None
+
+    def __enter__(self):
+        self.span, self._token = tracing.start_span(self.stage)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = time.perf_counter() - self.start
+        tracing.end_span(self.span, self._token)
+        STAGE_LATENCY.observe(self.elapsed, self.stage)
+
+        if self.timings is not None:
+            self.timings[self.stage] = self.elapsed
+
+
+def render(const_labels=None):
+    """
+    Renders every metric in the Prometheus text exposition format
+
+    Args:
+        const_labels (dict): Optional labels added to every value, e.g. the
+                             worker process, so the series of each pre-forked
+                             worker stay apart when scraped
+
+    Returns:
+        str: The metrics page
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render(const_labels))
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(names, values):
+    """
+    Args:
+        names (tuple): The label names
+        values (tuple): The label values
+
+    Returns:
+        str: Labels formatted as {name="value"}, or an empty string if there are none
+    """
+    if not names:
+        return ""
+
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+STAGE_LATENCY = Histogram("qst_stage_duration_seconds",
+                          "Time spent in each stage of the detection pipeline", ("stage",))
+DETECTION_LATENCY = Histogram("qst_detection_duration_seconds",
+                              "Time spent detecting objects, per model tier", ("tier",))
+REQUEST_LATENCY = Histogram("qst_request_duration_seconds",
+                            "Time taken to handle a request", ("endpoint",))
+REQUESTS = Counter("qst_requests_total", "Requests handled", ("endpoint", "status"))
+ERRORS = Counter("qst_errors_total", "Requests that failed with an exception", ("endpoint",))
+CACHE_REQUESTS = Counter("qst_cache_requests_total",
+                         "Result cache lookups by outcome (hit, miss or coalesced)", ("result",))
+OCR_CALLS = Counter("qst_ocr_calls_total", "Requests made to the OCR API")
+OCR_IMAGES = Counter("qst_ocr_images_total", "Images sent to the OCR API")
+OCR_BYTES = Counter("qst_ocr_bytes_total",
+                    "Bytes of the uploaded images (original) and of the reduced images sent for OCR (sent)",
+                    ("image",))
+OCR_FALLBACKS = Counter("qst_ocr_fallbacks_total",
+                        "Images analysed without their text, as OCR missed the request deadline (timeout) "
+                        "or failed on every attempt (unavailable)", ("reason",))
+
+METRICS = [STAGE_LATENCY, DETECTION_LATENCY, REQUEST_LATENCY, REQUESTS, ERRORS, CACHE_REQUESTS, OCR_CALLS, OCR_IMAGES,
+           OCR_BYTES, OCR_FALLBACKS]
@@ -0,0 +1,163 @@
+import os
+import time
+import resource
+import threading
+
+from detectors.textDetect import TextDetector
+from recognition.objectRec import ObjectInference, get_model_file, DICTIONARY_FILE
+from recognition.expiryRec import ExpiryInference
+from serving.processMemory import get_memory_usage
+
+
+class ModelRegistry:
+    def __init__(self):
+        """
+        Constructor for ModelRegistry class. Holds a single, shared set of
+        inference objects per process so that request handlers do not have
+        to reload the model weights and keyword dictionary on every call.
+        """
+        self.text_detector = None
+        self.object_inference = None
+        self.expiry_inference = None
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        """
+        Returns:
+            bool: Whether the models have been loaded into this process
+        """
+        return self.object_inference is not None
+
+    def load(self):
+        """
+        Loads the OCR client, object inference and expiry inference objects.
+        Subsequent calls are no-ops, so this is safe to call from several
+        threads at startup.
+
+        Returns:
+            ModelRegistry: The loaded registry
+        """
+        with self._lock:
+            if self.loaded:
+                return self
+
+            rss_start = self._get_rss()
+            t_start = time.perf_counter()
+
+            self.text_detector = TextDetector()
+            t_text = time.perf_counter()
+
+            self.object_inference = ObjectInference(self.text_detector)
+            t_object = time.perf_counter()
+
+            self.expiry_inference = ExpiryInference(self.text_detector)
+            t_finish = time.perf_counter()
+
+            rss_finish = self._get_rss()
+
+            self.stats = {
+                "pid": os.getpid(),
+                "load_time": {
+                    "text_detector": t_text - t_start,
+                    "object_inference": t_object - t_text,
+                    "expiry_inference": t_finish - t_object,
+                    "total": t_finish - t_start
+                },
+                "memory": {
+                    "rss_before_load": rss_start,
+                    "rss_after_load": rss_finish,
+                    "rss_delta": rss_finish - rss_start,
+                    "model_parameters": self._get_parameter_bytes(self.object_inference),
+                    "weights_file": self._get_file_size(get_model_file()),
+                    "dictionary_file": self._get_file_size(DICTIONARY_FILE)
+                }
+            }
+        return self
+
+    def after_fork(self):
+        """
+        Prepares the models loaded by a parent process for use in a forked
+        worker. The model weights are kept and shared copy-on-write, but the
+        OCR client's gRPC channel has to be replaced
+        """
+        if self.loaded:
+            self.text_detector.connect()
+            self.stats["pid"] = os.getpid()
+
+    def get_object_inference(self):
+        """
+        Returns:
+            ObjectInference: The shared object inference instance
+        """
+        return self.load().object_inference
+
+    def get_expiry_inference(self):
+        """
+        Returns:
+            ExpiryInference: The shared expiry inference instance
+        """
+        return self.load().expiry_inference
+
+    def get_stats(self):
+        """
+        Summarises the load time and memory footprint of the loaded models
+
+        Returns:
+            dict: Load times (in seconds) and memory usage (in bytes)
+        """
+        stats = dict(self.stats)
+        stats["loaded"] = self.loaded
+        stats["rss_current"] = self._get_rss()
+        stats["process_memory"] = get_memory_usage()
+        return stats
+
+    @staticmethod
+    def _get_rss():
+        """
+        Gets the resident set size of the current process
+
+        Returns:
+            int: Resident memory in bytes
+        """
+        try:
+            with open('/proc/self/statm') as file:
+                pages = int(file.read().split()[1])
+            return pages * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            # Peak RSS is reported in kB on Linux, used when /proc is unavailable
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    @staticmethod
+    def _get_parameter_bytes(object_inference):
+        """
+        Counts the memory held by the parameters and buffers of the detectron2 model
+
+        Args:
+            object_inference (ObjectInference): A loaded object inference instance
+
+        Returns:
+            int: Size of the model tensors in bytes, or None if the model is not
+                 held by PyTorch, e.g. when served by ONNX Runtime
+        """
+        model = object_inference.object_detector.predictor.model
+        if not hasattr(model, "parameters"):
+            return None
+
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+    @staticmethod
+    def _get_file_size(path):
+        """
+        Args:
+            path (str): Path to a file
+
+        Returns:
+            int: Size of the file in bytes, or None if it does not exist
+        """
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
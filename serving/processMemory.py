@@ -0,0 +1,36 @@
+SMAPS_FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"]
+
+
+def get_memory_usage(pid="self"):
+    """
+    Splits a process' resident memory into the pages unique to it and the pages
+    it shares with other processes, e.g. model weights inherited from a parent
+    process across a fork and not written to since
+
+    Args:
+        pid (int): The process id, defaults to the current process
+
+    Returns:
+        dict: Resident, proportional, unique and shared memory in bytes,
+              or None if /proc is unavailable
+    """
+    fields = {}
+
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as file:
+            for line in file:
+                parts = line.split()
+
+                # Lines are formatted as 'Field:   1234 kB'
+                name = parts[0].rstrip(':')
+                if name in SMAPS_FIELDS:
+                    fields[name] = int(parts[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "unique": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    }
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Number of results written between deletions of the expired rows of the
+# SQLite tier, which would otherwise only be dropped when the model changes
+PURGE_INTERVAL = 256
+
+
+class ResultCache:
+    def __init__(self, version_files, max_entries=256, ttl=86400, db_path=None, purge_interval=PURGE_INTERVAL):
+        """
+        Constructor for ResultCache class. Stores analysis results keyed on the
+        content hash of the image, the endpoint and the model version, in a
+        bounded in-memory LRU tier and an optional SQLite tier.
+
+        Args:
+            version_files (list): Paths of the files the results depend on, e.g. the
+                                  model weights and keyword dictionary. Results are
+                                  invalidated whenever one of these files changes
+            max_entries (int): Maximum number of results held in memory
+            ttl (float): Time (in seconds) a result stays valid for
+            db_path (str): Optional path to a SQLite database used as a second tier
+            purge_interval (int): Number of results written between deletions of
+                                  the expired results of the SQLite tier
+        """
+        self.version_files = version_files
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.purge_interval = purge_interval
+
+        self.memory = OrderedDict()
+        self.version = None
+        self._version_stat = None
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "expired": 0
+        }
+
+        self.db = None
+        self.connect()
+        self.get_version()
+
+    def connect(self):
+        """
+        Opens the SQLite tier, if configured, and deletes the results that
+        expired while it was closed. Also used to reopen the database in a
+        forked process, as SQLite connections cannot be shared across a fork
+        """
+        if not self.db_path:
+            return
+
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS results "
+                        "(key TEXT PRIMARY KEY, version TEXT, value TEXT, expires REAL)")
+        self.db.commit()
+
+        with self._lock:
+            self._purge_expired()
+
+    def make_key(self, image_bytes, endpoint, params=""):
+        """
+        Builds the cache key for an image
+
+        Args:
+            image_bytes (bytes): The image being analysed
+            endpoint (str): Name of the endpoint producing the result
+            params (str): Any request parameters that change the result
+
+        Returns:
+            str: The cache key
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"{digest}:{endpoint}:{params}:{self.get_version()}"
+
+    def get(self, key):
+        """
+        Looks up a result, checking memory before the SQLite tier
+
+        Args:
+            key (str): A key from make_key
+
+        Returns:
+            The cached result, or None on a miss
+        """
+        now = time.time()
+
+        with self._lock:
+            entry = self.memory.get(key)
+
+            if entry and entry[1] > now:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[0]
+            elif entry:
+                del self.memory[key]
+
+            if self.db:
+                row = self.db.execute("SELECT value, expires FROM results WHERE key = ? AND expires > ?",
+                                      (key, now)).fetchone()
+                if row:
+                    value = json.loads(row[0])
+                    self._store_memory(key, value, row[1])
+                    self.stats["disk_hits"] += 1
+                    return value
+
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        """
+        Stores a result in every tier
+
+        Args:
+            key (str): A key from make_key
+            value: A JSON serialisable result
+        """
+        expires = time.time() + self.ttl
+
+        with self._lock:
+            self._store_memory(key, value, expires)
+
+            if self.db:
+                self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                (key, self.version, json.dumps(value), expires))
+                self.db.commit()
+
+                self._writes += 1
+                if self._writes % self.purge_interval == 0:
+                    self._purge_expired()
+
+    def get_version(self):
+        """
+        Gets the model version, derived from the size and modification time of
+        the version files. Cached results are dropped when the version changes.
+
+        Returns:
+            str: The current model version
+        """
+        stat = []
+        for path in self.version_files:
+            try:
+                file_stat = os.stat(path)
+                stat.append((path, file_stat.st_size, file_stat.st_mtime_ns))
+            except OSError:
+                stat.append((path, None, None))
+
+        if stat != self._version_stat:
+            with self._lock:
+                self._version_stat = stat
+                self.version = hashlib.sha1(repr(stat).encode()).hexdigest()[:12]
+                self._invalidate()
+        return self.version
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Hit and miss counters and the size of each tier
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            stats["memory_entries"] = len(self.memory)
+            stats["version"] = self.version
+
+            if self.db:
+                stats["disk_entries"] = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return stats
+
+    def _store_memory(self, key, value, expires):
+        """
+        Adds a result to the memory tier, evicting the least recently used
+        results once the tier is full
+
+        Args:
+            key (str): A key from make_key
+            value: The result
+            expires (float): Timestamp the result expires at
+        """
+        self.memory[key] = (value, expires)
+        self.memory.move_to_end(key)
+
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _purge_expired(self):
+        """
+        Deletes the expired results of the SQLite tier
+        """
+        deleted = self.db.execute("DELETE FROM results WHERE expires <= ?", (time.time(),)).rowcount
+        self.db.commit()
+        self.stats["expired"] += deleted
+
+    def _invalidate(self):
+        """
+        Drops results produced by other model versions, and any expired results
+        """
+        if self.memory:
+            self.stats["invalidations"] += 1
+        self.memory.clear()
+
+        if self.db:
+            self.db.execute("DELETE FROM results WHERE version != ? OR expires <= ?",
+                            (self.version, time.time()))
+            self.db.commit()
@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Constructor for SingleFlight class. Deduplicates concurrent calls with
+        the same key, so that identical requests arriving while one is already
+        being processed wait for its result rather than repeating the work.
+        """
+        self.in_flight = {}
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "executed": 0,
+            "coalesced": 0
+        }
+
+    def do(self, key, function):
+        """
+        Calls a function, unless a call with the same key is already running,
+        in which case its result (or exception) is shared
+
+        Args:
+            key (str): Key identifying identical calls, e.g. an image hash
+            function (function): Function taking no arguments, producing the result
+
+        Returns:
+            tuple: The result and a boolean indicating whether it was shared
+                   from a call already in flight
+        """
+        with self._lock:
+            future = self.in_flight.get(key)
+
+            if future is not None:
+                self.stats["coalesced"] += 1
+                leader = False
+            else:
+                future = Future()
+                self.in_flight[key] = future
+                self.stats["executed"] += 1
+                leader = True
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            future.set_result(function())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self.in_flight[key]
+
+        return future.result(), False
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Counts of executed and coalesced calls, and calls currently in flight
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self.in_flight)
+        return stats
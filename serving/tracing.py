@@ -0,0 +1,207 @@
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+_current_span = contextvars.ContextVar("qst_current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, start=None):
+        """
+        Constructor for Span class, a timed section of a request. Spans form a
+        tree, with nested spans for each call made within the section
+
+        Args:
+            name (str): Name of the section
+            start (float): Optional perf_counter start time, defaults to now
+        """
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.duration = None
+        self.children = []
+
+    def finish(self, end=None):
+        """
+        Args:
+            end (float): Optional perf_counter end time, defaults to now
+        """
+        end = time.perf_counter() if end is None else end
+        self.duration = end - self.start
+
+    def to_dict(self, origin):
+        """
+        Args:
+            origin (float): perf_counter time the offsets are relative to,
+                            i.e. the start of the request
+
+        Returns:
+            dict: The span and its children, with times in milliseconds
+        """
+        return {
+            "name": self.name,
+            "offset": round((self.start - origin) * 1000, 3),
+            "duration": None if self.duration is None else round(self.duration * 1000, 3),
+            "children": [child.to_dict(origin) for child in self.children]
+        }
+
+    def flatten(self, prefix=""):
+        """
+        Lists the spans below this one, naming each by its path from this span
+
+        Args:
+            prefix (str): Path of this span
+
+        Returns:
+            list: A list of (path, duration) tuples
+        """
+        ret = []
+        for child in self.children:
+            path = f"{prefix}.{child.name}" if prefix else child.name
+            if child.duration is not None:
+                ret.append((path, child.duration))
+            ret.extend(child.flatten(path))
+        return ret
+
+
+class Trace:
+    def __init__(self, name):
+        """
+        Constructor for Trace class, holding the span tree of one request. The
+        root span becomes the current span, so spans opened while handling the
+        request (in this thread, or in a thread given a copy of its context)
+        are nested under it
+
+        Args:
+            name (str): Name of the request, e.g. its path
+        """
+        self.id = uuid.uuid4().hex
+        self.timestamp = time.time()
+        self.root = Span(name)
+        self._token = _current_span.set(self.root)
+
+    def detach(self):
+        """
+        Stops collecting spans in the current thread
+        """
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+
+    def server_timing(self):
+        """
+        Formats the finished spans as a Server-Timing header value
+
+        Returns:
+            str: Entries formatted as name;dur=milliseconds
+        """
+        entries = [f"{path};dur={duration * 1000:.2f}" for path, duration in self.root.flatten()]
+        total = self.root.duration if self.root.duration is not None else time.perf_counter() - self.root.start
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The trace id, start time and span tree
+        """
+        return {
+            "trace_id": self.id,
+            "timestamp": self.timestamp,
+            "spans": self.root.to_dict(self.root.start)
+        }
+
+
+class TraceWriter:
+    def __init__(self, path):
+        """
+        Constructor for TraceWriter class, appending finished traces to a JSONL file
+
+        Args:
+            path (str): Path of the trace file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, trace):
+        """
+        Args:
+            trace (Trace): A finished trace
+        """
+        line = json.dumps(trace.to_dict()) + "\n"
+
+        with self._lock:
+            with open(self.path, "a") as file:
+                file.write(line)
+
+
+def start_span(name):
+    """
+    Opens a span nested under the current span
+
+    Args:
+        name (str): Name of the span
+
+    Returns:
+        tuple: The span and a token for end_span, or (None, None) when no
+               trace is being collected
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None, None
+
+    span = Span(name)
+    parent.children.append(span)
+    return span, _current_span.set(span)
+
+
+def end_span(span, token):
+    """
+    Closes a span opened by start_span
+
+    Args:
+        span (Span): The span, or None
+        token (Token): The token returned with the span
+    """
+    if span is None:
+        return
+
+    span.finish()
+    _current_span.reset(token)
+
+
+@contextmanager
+def span(name):
+    """
+    Context manager timing a section of the current request as a nested span
+
+    Args:
+        name (str): Name of the span
+    """
+    opened, token = start_span(name)
+    try:
+        yield opened
+    finally:
+        end_span(opened, token)
+
+
+def record_span(name, start, end):
+    """
+    Adds an already finished section, e.g. work done for this request in
+    another thread, as a span under the current span
+
+    Args:
+        name (str): Name of the span
+        start (float): perf_counter start time
+        end (float): perf_counter end time
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return
+
+    recorded = Span(name, start)
+    recorded.finish(end)
+    parent.children.append(recorded)
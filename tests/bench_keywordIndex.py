@@ -0,0 +1,47 @@
+"""
+Compares matching words against every keyword with the deletion index in
+recognition.keywordIndex as the dictionary grows. Run from the root folder with:
+
+    python -m tests.bench_keywordIndex
+"""
+import time
+import random
+
+from recognition.keywordIndex import KeywordIndex
+from tests.test_keywordIndex import make_dictionary, match_brute_force, add_typo
+
+
+SIZES = (250, 1000, 5000, 20000)
+WORDS = 300
+
+
+def main():
+    print(f"{'keywords':>8} {'build':>10} {'brute force':>12} {'index':>10} {'per word':>10} {'speedup':>8}")
+
+    for size in SIZES:
+        keywords = make_dictionary(size)
+        items = [item for values in keywords.values() for item in values]
+
+        rng = random.Random(0)
+        words = [add_typo(rng.choice(items), rng) if rng.random() < 0.5 else rng.choice(items)
+                 for _ in range(WORDS)]
+
+        t_start = time.perf_counter()
+        index = KeywordIndex(keywords)
+        build = time.perf_counter() - t_start
+
+        t_start = time.perf_counter()
+        expected = match_brute_force(words, keywords)
+        brute_force = time.perf_counter() - t_start
+
+        t_start = time.perf_counter()
+        result = index.match(words)
+        indexed = time.perf_counter() - t_start
+
+        assert result == expected
+        print(f"{size:>8} {build * 1000:>8.1f}ms {brute_force * 1000:>10.1f}ms {indexed * 1000:>8.2f}ms "
+              f"{indexed / WORDS * 1e6:>8.1f}us {brute_force / indexed:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
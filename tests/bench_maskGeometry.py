@@ -0,0 +1,69 @@
+"""
+Compares the pairwise shapely overlap suppression and word localisation with
+the vectorised versions in recognition.maskGeometry as the number of
+detections and words grows. Run from the root folder with:
+
+    python -m tests.bench_maskGeometry
+"""
+import time
+
+from recognition.maskGeometry import LabelImage, suppress_overlaps, locate_words
+from tests.test_maskGeometry import make_shelf, make_words, reduce_pairwise, locate_pairwise
+
+
+COUNTS = (10, 25, 50, 100, 200, 400)
+WORD_COUNTS = ((10, 100), (30, 300), (60, 600), (100, 1000))
+REPEATS = 5
+
+
+def best_time(function, *args, **kwargs):
+    """
+    Args:
+        function (function): The function to time
+        args: Positional arguments for the function
+        kwargs: Keyword arguments for the function
+
+    Returns:
+        float: The fastest of REPEATS runs, in seconds
+    """
+    times = []
+    for _ in range(REPEATS):
+        t_start = time.perf_counter()
+        function(*args, **kwargs)
+        times.append(time.perf_counter() - t_start)
+    return min(times)
+
+
+def main():
+    print(f"{'outlines':>8} {'detections':>10} {'pairwise':>12} {'vectorised':>12} {'speedup':>8}")
+
+    for boxes in (False, True):
+        for count in COUNTS:
+            outlines, scores = make_shelf(count, boxes=boxes)
+            is_box = [boxes] * count
+
+            assert suppress_overlaps(outlines, scores, is_box=is_box).tolist() == reduce_pairwise(outlines, scores)
+
+            pairwise = best_time(reduce_pairwise, outlines, scores)
+            vectorised = best_time(suppress_overlaps, outlines, scores, is_box=is_box)
+
+            print(f"{'boxes' if boxes else 'masks':>8} {count:>10} {pairwise * 1000:>10.2f}ms "
+                  f"{vectorised * 1000:>10.2f}ms {pairwise / vectorised:>7.1f}x")
+
+    print()
+    print(f"{'objects':>8} {'words':>6} {'pairwise':>12} {'label image':>12} {'lookup':>10} {'total':>12} {'speedup':>8}")
+
+    for count, words in WORD_COUNTS:
+        outlines, _ = make_shelf(count)
+        texts = make_words(words)
+
+        pairwise = best_time(locate_pairwise, outlines, texts)
+        label_image = best_time(LabelImage, outlines)
+        total = best_time(locate_words, outlines, texts)
+
+        print(f"{count:>8} {words:>6} {pairwise * 1000:>10.2f}ms {label_image * 1000:>10.3f}ms "
+              f"{(total - label_image) * 1e6:>8.0f}us {total * 1000:>10.3f}ms {pairwise / total:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
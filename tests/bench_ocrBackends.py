@@ -0,0 +1,133 @@
+"""
+Compares the latency and recall of the OCR backends in detectors.ocrBackends
+on a folder of sample images. Run from the root folder with:
+
+    python -m tests.bench_ocrBackends --images FOLDER --labels labels.json
+
+The labels file gives the expiry date and keywords printed on each image,
+formatted as {"image.jpg": {"expiry_date": "2020-07-22", "keywords": ["heinz", "beanz"]}}.
+Backends that cannot be created here, e.g. without credentials or the
+Tesseract engine, are skipped. Pass --record to save the results of the first
+backend as fixtures for the replay backend.
+"""
+import os
+import json
+import time
+import argparse
+from glob import glob
+from datetime import datetime
+
+import numpy as np
+from Levenshtein import distance
+
+from detectors.ocrBackends import OCR_BACKENDS, ReplayBackend, FIXTURES_FOLDER
+from detectors.expiryDetect import ExpiryDetector
+from detectors.textDetect import TextDetector
+from recognition.expiryRec import ExpiryInference
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def load_images(folder):
+    """
+    Args:
+        folder (str): Folder of sample images
+
+    Returns:
+        dict: The bytes of each image, by file name
+    """
+    images = {}
+    for path in sorted(glob(os.path.join(folder, '*'))):
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            with open(path, 'rb') as file:
+                images[os.path.basename(path)] = file.read()
+    return images
+
+
+def get_recall(texts, expiry_inference, content, label):
+    """
+    Args:
+        texts (dict): Detected words formatted as {text: [bbox]}
+        expiry_inference (ExpiryInference): Used to predict the expiry date from the words
+        content (bytes): The image, for its EXIF capture date
+        label (dict): The expiry date and keywords printed on the image
+
+    Returns:
+        tuple: Whether the expiry date was predicted, or None if not labelled, and
+               the number of labelled keywords found within one edit of a word
+    """
+    date_found = None
+    if label.get('expiry_date'):
+        prediction = expiry_inference.predict_from_texts(texts, ExpiryDetector.get_capture_date(content))
+        expected = datetime.strptime(label['expiry_date'], '%Y-%m-%d').date()
+        date_found = isinstance(prediction, datetime) and prediction.date() == expected
+
+    keywords_found = sum(any(distance(keyword, word) <= 1 for word in texts) for keyword in label.get('keywords', []))
+    return date_found, keywords_found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the OCR backends on sample images")
+    parser.add_argument('--images', metavar='FOLDER', default='images')
+    parser.add_argument('--labels', help="JSON file of the expiry date and keywords of each image")
+    parser.add_argument('--backends', nargs='+', choices=list(OCR_BACKENDS), default=list(OCR_BACKENDS))
+    parser.add_argument('--fixtures', metavar='FOLDER', default=FIXTURES_FOLDER)
+    parser.add_argument('--record', action='store_true', help="Save the first backend's results as fixtures")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    labels = {}
+    if args.labels:
+        with open(args.labels) as file:
+            labels = json.load(file)
+
+    print(f"{len(images)} images, {len(labels)} labelled")
+    print(f"{'backend':>10} {'mean':>10} {'p95':>10} {'words':>8} {'dates':>8} {'keywords':>10}")
+
+    recorder = ReplayBackend(args.fixtures) if args.record else None
+
+    for name in args.backends:
+        try:
+            options = {'folder': args.fixtures} if name == 'replay' else {}
+            text_detector = TextDetector(name, **options)
+        except Exception as e:
+            print(f"{name:>10} skipped: {e}")
+            continue
+
+        expiry_inference = ExpiryInference(text_detector)
+        latencies, words, dates, keywords = [], [], [], [0, 0]
+
+        for file_name, content in images.items():
+            t_start = time.perf_counter()
+            try:
+                texts = text_detector.get_text(content)
+            except Exception as e:
+                print(f"{name:>10} failed on {file_name}: {e}")
+                continue
+            latencies.append(time.perf_counter() - t_start)
+            words.append(len(texts))
+
+            if recorder is not None:
+                recorder.record(content, texts)
+
+            if file_name in labels:
+                date_found, keywords_found = get_recall(texts, expiry_inference, content, labels[file_name])
+                if date_found is not None:
+                    dates.append(date_found)
+                keywords[0] += keywords_found
+                keywords[1] += len(labels[file_name].get('keywords', []))
+
+        recorder = None
+
+        if not latencies:
+            continue
+
+        date_recall = f"{np.mean(dates):.0%}" if dates else "-"
+        keyword_recall = f"{keywords[0] / keywords[1]:.0%}" if keywords[1] else "-"
+        print(f"{name:>10} {np.mean(latencies) * 1000:>8.1f}ms {np.percentile(latencies, 95) * 1000:>8.1f}ms "
+              f"{np.mean(words):>8.1f} {date_recall:>8} {keyword_recall:>10}")
+
+
+if __name__ == '__main__':
+    main()
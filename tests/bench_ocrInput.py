@@ -0,0 +1,70 @@
+"""
+Compares sending the uploaded images for OCR with sending the reduced images
+prepared by detectors.ocrInput, in upload size, OCR latency and words read.
+Run from the root folder with:
+
+    python -m tests.bench_ocrInput --images FOLDER --backend google
+
+Without the detector, the crop is a centred region covering --crop of each
+side of the image, standing in for the detected objects. Downscaled images are
+sent alongside detection, while cropped ones wait for it, so cropping
+(OCR_CROP_TO_OBJECTS) only pays off if it saves more OCR latency than the
+detection latency it adds.
+"""
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from detectors.ocrBackends import OCR_BACKENDS
+from detectors.ocrInput import OcrInput, OCR_MAX_SIDE, OCR_JPEG_QUALITY
+from detectors.textDetect import TextDetector
+from tests.bench_ocrBackends import load_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR on the uploaded and the reduced images")
+    parser.add_argument('--images', metavar='FOLDER', default='images')
+    parser.add_argument('--backend', choices=list(OCR_BACKENDS), default='google')
+    parser.add_argument('--max-side', type=int, default=OCR_MAX_SIDE)
+    parser.add_argument('--quality', type=int, default=OCR_JPEG_QUALITY)
+    parser.add_argument('--crop', type=float, default=0.6, help="Side of the centred crop, as a fraction")
+    args = parser.parse_args()
+
+    text_detector = TextDetector(args.backend)
+    images = load_images(args.images)
+    results = {"original": [], "downscaled": [], "cropped": []}
+
+    for content in images.values():
+        image = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+        height, width = image.shape[:2]
+        x1, y1 = width * (1 - args.crop) / 2, height * (1 - args.crop) / 2
+        box = [x1, y1, width - x1, height - y1]
+
+        inputs = {
+            "original": OcrInput(content, len(content)),
+            "downscaled": OcrInput.reduce(image, content, max_side=args.max_side, quality=args.quality),
+            "cropped": OcrInput.reduce(image, content, [box], max_side=args.max_side, quality=args.quality,
+                                       margin=0)
+        }
+
+        for name, ocr_input in inputs.items():
+            t_start = time.perf_counter()
+            texts = text_detector.get_text(ocr_input.content)
+            latency = time.perf_counter() - t_start
+
+            results[name].append((len(ocr_input.content), latency, len(ocr_input.map_back(texts))))
+
+    print(f"{len(images)} images, {args.backend} backend")
+    print(f"{'input':>10} {'bytes':>10} {'latency':>10} {'saved':>10} {'words':>8}")
+
+    original_latency = np.mean([latency for _, latency, _ in results["original"]])
+    for name, rows in results.items():
+        sizes, latencies, words = np.asarray(rows).T
+        print(f"{name:>10} {np.mean(sizes) / 1024:>8.0f}kB {np.mean(latencies) * 1000:>8.0f}ms "
+              f"{(original_latency - np.mean(latencies)) * 1000:>8.0f}ms {np.mean(words):>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
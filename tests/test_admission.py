@@ -0,0 +1,73 @@
+import time
+import threading
+import unittest
+
+from serving.admission import AdmissionController, Overloaded
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def test_admit_within_limit(self):
+        """
+        Test requests within the concurrency limit are admitted
+        """
+        controller = AdmissionController(2, 0, 0.01)
+
+        with controller.admit():
+            with controller.admit():
+                self.assertEqual(controller.get_stats()['active'], 2)
+
+        stats = controller.get_stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['admitted'], 2)
+
+    def test_queue_full(self):
+        """
+        Test requests are rejected with a 429 when the queue is full
+        """
+        controller = AdmissionController(1, 0, 1)
+
+        with controller.admit():
+            with self.assertRaises(Overloaded) as context:
+                controller.acquire()
+
+        self.assertEqual(context.exception.status, 429)
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+        self.assertEqual(controller.get_stats()['rejected_queue_full'], 1)
+
+    def test_queue_timeout(self):
+        """
+        Test queued requests are rejected with a 503 once the queue timeout passes
+        """
+        controller = AdmissionController(1, 1, 0.01)
+
+        with controller.admit():
+            with self.assertRaises(Overloaded) as context:
+                controller.acquire()
+
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(controller.get_stats()['rejected_timeout'], 1)
+        self.assertEqual(controller.get_stats()['queue_depth'], 0)
+
+    def test_queued_request_admitted(self):
+        """
+        Test a queued request is admitted once a slot is released
+        """
+        controller = AdmissionController(1, 1, 1)
+        admitted_at = controller.acquire()
+        result = []
+
+        thread = threading.Thread(target=lambda: result.append(controller.acquire()))
+        thread.start()
+
+        while controller.get_stats()['queue_depth'] == 0:
+            time.sleep(0.001)
+        controller.release(admitted_at)
+        thread.join(1)
+
+        self.assertEqual(len(result), 1)
+        self.assertEqual(controller.get_stats()['admitted'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,165 @@
+import unittest
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from detectors.ocrResult import OcrResult
+from detectors.textDetect import OcrUnavailable
+from recognition.analysisContext import AnalysisContext, InvalidImage
+from serving.deadline import Deadline, DeadlineExceeded
+
+
+class CountingTextDetector:
+    def __init__(self):
+        self.calls = 0
+
+    def get_text(self, content, deadline=None):
+        self.calls += 1
+        return OcrResult(['best'], [[(0, 0), (10, 0), (10, 10), (0, 10)]])
+
+
+class TestAnalysisContext(unittest.TestCase):
+
+    def setUp(self):
+        with open('images/readme_example.jpg', 'rb') as image_file:
+            self.image_bytes = image_file.read()
+
+        self.textDetector = CountingTextDetector()
+        self.context = AnalysisContext(self.image_bytes, self.textDetector)
+
+    def test_texts_single_ocr_call(self):
+        """
+        Test the OCR result is shared between every stage reading it
+        """
+        first = self.context.texts
+        second = self.context.texts
+
+        self.assertIs(first, second)
+        self.assertEqual(first.tokens, ['best'])
+        self.assertEqual(self.textDetector.calls, 1)
+        self.assertEqual(self.context.ocr_calls, 1)
+
+    def test_texts_from_future(self):
+        """
+        Test an OCR result supplied by a batched call is used instead of the client
+        """
+        texts = OcrResult(['milk'], [[(0, 0), (5, 0), (5, 5), (0, 5)]])
+        future = Future()
+        future.set_result(texts)
+
+        self.context.use_texts_from(future)
+
+        self.assertEqual(self.context.texts, texts)
+        self.assertEqual(self.textDetector.calls, 0)
+
+    def test_texts_cropped_to_objects(self):
+        """
+        Test only the region holding the given boxes is sent for OCR, and the
+        words are mapped back to the uploaded image
+        """
+        sent = []
+
+        class CroppingTextDetector:
+            def get_text(self, content, deadline=None):
+                sent.append(cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR))
+                return OcrResult(["best"], [[(10, 10), (30, 10), (30, 20), (10, 20)]])
+
+        context = AnalysisContext(self.image_bytes, CroppingTextDetector())
+        context.crop_ocr_to([[100, 50, 200, 150]])
+        texts = context.texts
+
+        self.assertEqual(sent[0].shape[:2], (110, 110))
+        self.assertEqual(texts.boxes[0, 0].tolist(), [105, 55])
+        self.assertEqual(context.get_ocr_stats()["offset"], [95, 45])
+        self.assertIn('ocr_reduce', context.timings)
+
+    def test_texts_after_deadline(self):
+        """
+        Test the image is analysed without text when OCR misses the deadline,
+        and the deadline is passed on to the text detector
+        """
+        deadlines = []
+
+        class TimingOutTextDetector:
+            def get_text(self, content, deadline=None):
+                deadlines.append(deadline)
+                raise DeadlineExceeded("No result within the deadline")
+
+        deadline = Deadline(5)
+        context = AnalysisContext(self.image_bytes, TimingOutTextDetector(), deadline)
+
+        self.assertEqual(len(context.texts), 0)
+        self.assertEqual(context.ocr_failure, 'timeout')
+        self.assertLess(deadlines[0].expires_at, deadline.expires_at)
+
+    def test_texts_after_failed_attempts(self):
+        """
+        Test the image is analysed without text when every OCR attempt failed
+        """
+        class FailingTextDetector:
+            def get_text(self, content, deadline=None):
+                raise OcrUnavailable("OCR failed after 2 attempts")
+
+        context = AnalysisContext(self.image_bytes, FailingTextDetector(), Deadline(5))
+
+        self.assertEqual(len(context.texts), 0)
+        self.assertEqual(context.ocr_failure, 'unavailable')
+
+    def test_texts_future_failed(self):
+        """
+        Test a batched OCR call that failed on every attempt falls back too
+        """
+        future = Future()
+        future.set_exception(OcrUnavailable("OCR failed after 2 attempts"))
+        self.context.use_texts_from(future)
+
+        self.assertEqual(len(self.context.texts), 0)
+        self.assertEqual(self.context.ocr_failure, 'unavailable')
+
+    def test_texts_future_after_deadline(self):
+        """
+        Test a batched OCR result still outstanding at the deadline is not waited for
+        """
+        context = AnalysisContext(self.image_bytes, self.textDetector, Deadline(0.6))
+        context.use_texts_from(Future())
+
+        self.assertEqual(len(context.texts), 0)
+        self.assertEqual(context.ocr_failure, 'timeout')
+        self.assertLess(context.timings['ocr'], 0.5)
+
+    def test_image_decoded_once(self):
+        """
+        Test the image is decoded into a BGR array and cached
+        """
+        image = self.context.image
+
+        self.assertEqual(image.ndim, 3)
+        self.assertEqual(image.shape[2], 3)
+        self.assertIs(image, self.context.image)
+
+    def test_invalid_image(self):
+        """
+        Test bytes that are not an image raise InvalidImage before any OCR call
+        """
+        for image_bytes in (b'', b'not an image'):
+            context = AnalysisContext(image_bytes, self.textDetector)
+
+            with self.assertRaises(InvalidImage):
+                context.image
+            with self.assertRaises(InvalidImage):
+                context.texts
+        self.assertEqual(self.textDetector.calls, 0)
+
+    def test_capture_date_without_exif(self):
+        """
+        Test a missing EXIF capture date is cached as None
+        """
+        context = AnalysisContext(b'', self.textDetector)
+
+        self.assertIsNone(context.capture_date)
+        self.assertIsNone(context.capture_date)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,93 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from detectors.batchScheduler import BatchScheduler
+
+
+class RecordingDetector:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def get_pred_lists(self, images):
+        self.batches.append(list(images))
+        if self.fail:
+            raise RuntimeError('forward failed')
+        return [ValueError('bad image') if image is None else [{'object_class': image}] for image in images]
+
+
+class TestBatchScheduler(unittest.TestCase):
+
+    def test_concurrent_requests_batched(self):
+        """
+        Test concurrent requests share a batch and each get their own result
+        """
+        detector = RecordingDetector()
+        scheduler = BatchScheduler(detector, max_batch_size=4, max_wait=0.5)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(scheduler.get_pred_list, ['a', 'b', 'c', 'd']))
+
+        self.assertEqual(results, [[{'object_class': x}] for x in ['a', 'b', 'c', 'd']])
+        self.assertEqual(len(detector.batches), 1)
+
+        stats = scheduler.get_stats()
+        self.assertEqual(stats['batches'], 1)
+        self.assertEqual(stats['requests'], 4)
+        self.assertEqual(stats['batch_sizes'], {4: 1})
+
+    def test_max_batch_size(self):
+        """
+        Test batches are never larger than the maximum batch size
+        """
+        detector = RecordingDetector()
+        scheduler = BatchScheduler(detector, max_batch_size=2, max_wait=0.5)
+
+        results = scheduler.get_pred_lists(['a', 'b', 'c', 'd', 'e'])
+
+        self.assertEqual([result[0]['object_class'] for result in results], ['a', 'b', 'c', 'd', 'e'])
+        self.assertTrue(all(len(batch) <= 2 for batch in detector.batches))
+
+    def test_max_wait(self):
+        """
+        Test a lone request runs once the maximum wait has passed
+        """
+        detector = RecordingDetector()
+        scheduler = BatchScheduler(detector, max_batch_size=8, max_wait=0.05)
+
+        t_start = time.perf_counter()
+        result = scheduler.get_pred_list('a')
+        elapsed = time.perf_counter() - t_start
+
+        self.assertEqual(result, [{'object_class': 'a'}])
+        self.assertLess(elapsed, 1)
+        self.assertGreaterEqual(scheduler.get_stats()['max_wait_seen'], 0.04)
+
+    def test_forward_error(self):
+        """
+        Test a failed forward pass raises in every caller of the batch
+        """
+        scheduler = BatchScheduler(RecordingDetector(fail=True), max_batch_size=2, max_wait=0.01)
+
+        with self.assertRaises(RuntimeError):
+            scheduler.get_pred_list('a')
+
+    def test_item_error(self):
+        """
+        Test an error returned for one image only raises in its own caller
+        """
+        detector = RecordingDetector()
+        scheduler = BatchScheduler(detector, max_batch_size=3, max_wait=0.5)
+
+        futures = [scheduler.submit(image) for image in ['a', None, 'b']]
+
+        self.assertEqual(futures[0].result(), [{'object_class': 'a'}])
+        self.assertEqual(futures[2].result(), [{'object_class': 'b'}])
+        with self.assertRaises(ValueError):
+            futures[1].result()
+        self.assertEqual(len(detector.batches), 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -248,6 +248,20 @@ class TestExpiryRecognition(unittest.TestCase):
         result = self.expiryDetector.day_is_valid(month)
         self.assertFalse(result)
 
+    def test_get_capture_date(self):
+        """
+        Test reading the EXIF capture date from in-memory image bytes
+        """
+        with open('images/readme_example.jpg', 'rb') as image_file:
+            image_bytes = image_file.read()
+
+        expected = datetime(2020, 8, 11)
+        result = self.expiryDetector.get_capture_date(image_bytes)
+        self.assertEqual(expected, result)
+
+        result = self.expiryDetector.get_capture_date(b'')
+        self.assertIsNone(result)
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
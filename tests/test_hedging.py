@@ -0,0 +1,163 @@
+import time
+import threading
+import unittest
+
+from serving.deadline import Deadline, DeadlineExceeded
+from serving.hedging import HedgedCaller
+
+
+class FlakyService:
+    def __init__(self, latencies, errors=()):
+        """
+        Fake remote service, answering each attempt after the given latency,
+        or raising the given error
+
+        Args:
+            latencies (list): Latency (in seconds) of each attempt
+            errors (list): Error raised by each attempt, None to succeed
+        """
+        self.latencies = list(latencies)
+        self.errors = list(errors)
+        self.timeouts = []
+        self.attempts = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, timeout):
+        with self._lock:
+            attempt = self.attempts
+            self.attempts += 1
+            self.timeouts.append(timeout)
+
+        time.sleep(self.latencies[attempt])
+        if attempt < len(self.errors) and self.errors[attempt] is not None:
+            raise self.errors[attempt]
+        return attempt
+
+
+class TestHedgedCaller(unittest.TestCase):
+
+    def test_fast_call_not_hedged(self):
+        """
+        Test a call answered within the delay is only made once
+        """
+        service = FlakyService([0.01])
+        caller = HedgedCaller(initial_delay=0.5)
+
+        self.assertEqual(caller.call(service), 0)
+        self.assertEqual(service.attempts, 1)
+        self.assertEqual(caller.get_stats()["hedged"], 0)
+
+    def test_slow_call_hedged(self):
+        """
+        Test a call still outstanding after the delay is sent again, and the
+        faster attempt wins
+        """
+        service = FlakyService([1.0, 0.01])
+        caller = HedgedCaller(initial_delay=0.05)
+
+        t_start = time.perf_counter()
+        self.assertEqual(caller.call(service), 1)
+        self.assertLess(time.perf_counter() - t_start, 0.5)
+
+        stats = caller.get_stats()
+        self.assertEqual(stats["hedged"], 1)
+        self.assertEqual(stats["won_by_later_attempt"], 1)
+
+    def test_transient_error_retried(self):
+        """
+        Test a call failing with a retryable error is retried straight away
+        """
+        service = FlakyService([0.01, 0.01], [ConnectionError("reset")])
+        caller = HedgedCaller(initial_delay=5, is_retryable=lambda error: isinstance(error, ConnectionError))
+
+        t_start = time.perf_counter()
+        self.assertEqual(caller.call(service), 1)
+        self.assertLess(time.perf_counter() - t_start, 1)
+        self.assertEqual(caller.get_stats()["retried"], 1)
+
+    def test_error_not_retried(self):
+        """
+        Test other errors are raised without retrying
+        """
+        service = FlakyService([0.01, 0.01], [ValueError("bad image")])
+        caller = HedgedCaller()
+
+        with self.assertRaises(ValueError):
+            caller.call(service)
+        self.assertEqual(service.attempts, 1)
+
+    def test_attempts_exhausted(self):
+        """
+        Test the last error is raised once every attempt has failed
+        """
+        service = FlakyService([0.01, 0.01], [ConnectionError("first"), ConnectionError("second")])
+        caller = HedgedCaller(max_attempts=2, is_retryable=lambda error: True)
+
+        with self.assertRaisesRegex(ConnectionError, "second"):
+            caller.call(service)
+        self.assertEqual(caller.get_stats()["failed"], 1)
+
+    def test_deadline(self):
+        """
+        Test the call gives up once the deadline passes, passing the time left
+        to each attempt
+        """
+        service = FlakyService([1.0, 1.0])
+        caller = HedgedCaller(initial_delay=0.05)
+
+        t_start = time.perf_counter()
+        with self.assertRaises(DeadlineExceeded):
+            caller.call(service, Deadline(0.2))
+
+        self.assertLess(time.perf_counter() - t_start, 0.5)
+        self.assertLessEqual(service.timeouts[0], 0.2)
+        self.assertEqual(caller.get_stats()["timed_out"], 1)
+
+    def test_deadline_passed(self):
+        """
+        Test no attempt is made once the deadline has passed
+        """
+        service = FlakyService([0.01])
+
+        with self.assertRaises(DeadlineExceeded):
+            HedgedCaller().call(service, Deadline(0.1, start=time.perf_counter() - 1))
+        self.assertEqual(service.attempts, 0)
+
+    def test_delay_from_latencies(self):
+        """
+        Test the hedging delay follows the percentile of recent latencies once
+        enough have been seen
+        """
+        caller = HedgedCaller(percentile=90, initial_delay=2.0, min_samples=10)
+        self.assertEqual(caller.get_delay(), 2.0)
+
+        caller.latencies.extend(0.01 * value for value in range(1, 11))
+        self.assertAlmostEqual(caller.get_delay(), 0.091)
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_remaining(self):
+        """
+        Test the time left counts down from the start and stops at 0
+        """
+        deadline = Deadline(1.0, start=time.perf_counter() - 0.5)
+        self.assertAlmostEqual(deadline.remaining(), 0.5, delta=0.05)
+        self.assertFalse(deadline.expired)
+
+        self.assertTrue(Deadline(1.0, start=time.perf_counter() - 2).expired)
+        self.assertEqual(Deadline(1.0, start=time.perf_counter() - 2).remaining(), 0)
+
+    def test_reserve(self):
+        """
+        Test a reserved deadline expires the given time earlier
+        """
+        deadline = Deadline(1.0)
+        reserved = deadline.reserve(0.25)
+
+        self.assertAlmostEqual(deadline.expires_at - reserved.expires_at, 0.25)
+        self.assertTrue(deadline.reserve(2).expired)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,139 @@
+import json
+import random
+import string
+import unittest
+
+from Levenshtein import distance
+
+from recognition.keywordIndex import KeywordIndex
+
+
+DICTIONARY_FILE = "resources/keywords.json"
+
+
+def match_brute_force(words, keywords):
+    """
+    Reference implementation comparing every word with every single word keyword
+
+    Args:
+        words (list): A list of cleaned words
+        keywords (dict): Keyword dictionary in the format {"class": ["word1", "word2"]}
+
+    Returns:
+        dict: The matched keywords of each category
+    """
+    matches = {}
+
+    for word in words:
+        for category, items in keywords.items():
+            for item in items:
+                if ' ' not in item and distance(item, word) <= 1:
+                    try:
+                        matches[category].append(item)
+                    except KeyError:
+                        matches[category] = [item]
+
+    return matches
+
+
+def add_typo(word, rng):
+    """
+    Applies a random single character OCR error to a word
+
+    Args:
+        word (str): A word
+        rng (Random): Random number generator
+
+    Returns:
+        str: The word with a character inserted, deleted or substituted
+    """
+    index = rng.randrange(len(word) + 1)
+    letter = rng.choice(string.ascii_lowercase)
+    edit = rng.choice(["insert", "delete", "substitute"])
+
+    if edit == "insert":
+        return word[:index] + letter + word[index:]
+    elif edit == "delete":
+        return word[:index] + word[index + 1:]
+    return word[:index] + letter + word[index + 1:]
+
+
+def make_dictionary(size, seed=0):
+    """
+    Creates a keyword dictionary of random brand names
+
+    Args:
+        size (int): Number of keywords
+        seed (int): Random seed
+
+    Returns:
+        dict: Keyword dictionary in the format {"class": ["word1", "word2"]}
+    """
+    rng = random.Random(seed)
+    categories = ["cereal", "condiment", "bread", "pasta", "milk", "egg", "butter", "soup"]
+    keywords = {category: [] for category in categories}
+
+    for _ in range(size):
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+        keywords[rng.choice(categories)].append(word)
+    return keywords
+
+
+class TestKeywordIndex(unittest.TestCase):
+
+    def setUp(self):
+        with open(DICTIONARY_FILE) as file:
+            self.keywords = json.load(file)
+        self.index = KeywordIndex(self.keywords)
+
+    def test_matches_brute_force(self):
+        """
+        Test matches equal those of comparing every keyword, including their
+        order and keywords listed more than once
+        """
+        rng = random.Random(0)
+        keywords = [item for items in self.keywords.values() for item in items]
+
+        for _ in range(50):
+            words = [add_typo(rng.choice(keywords), rng) for _ in range(10)]
+            words += [rng.choice(keywords) for _ in range(5)]
+            words += ["", "a", "x" * 12]
+            rng.shuffle(words)
+
+            self.assertEqual(self.index.match(words), match_brute_force(words, self.keywords))
+
+    def test_large_dictionary(self):
+        """
+        Test matches on a dictionary of thousands of brands
+        """
+        keywords = make_dictionary(5000)
+        index = KeywordIndex(keywords)
+        rng = random.Random(1)
+        items = [item for values in keywords.values() for item in values]
+
+        words = [add_typo(rng.choice(items), rng) for _ in range(200)]
+        self.assertEqual(index.match(words), match_brute_force(words, keywords))
+
+    def test_lookup(self):
+        """
+        Test single edits of a keyword are matched, and two edits are not
+        """
+        self.assertIn("weetabix", self.index.lookup("weetabix"))
+        self.assertIn("weetabix", self.index.lookup("weetabx"))
+        self.assertIn("weetabix", self.index.lookup("weetabiix"))
+        self.assertIn("weetabix", self.index.lookup("wetabix"))
+        self.assertIn("weetabix", self.index.lookup("weelabix"))
+        self.assertNotIn("weetabix", self.index.lookup("wetabx"))
+
+    def test_exact_only(self):
+        """
+        Test an index with a maximum distance of 0 only matches exact words
+        """
+        index = KeywordIndex(self.keywords, max_distance=0)
+
+        self.assertEqual(index.lookup("alpen"), ["alpen"])
+        self.assertEqual(index.lookup("alpem"), [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
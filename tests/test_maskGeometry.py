@@ -0,0 +1,277 @@
+import random
+import itertools
+import unittest
+
+import numpy as np
+from shapely.geometry.polygon import Polygon
+from shapely.errors import TopologicalError
+
+from detectors.ocrResult import OcrResult
+from recognition.maskGeometry import get_areas, get_box_intersections, suppress_overlaps, locate_words
+
+
+def make_outline(x, y, width, height, points=24, rng=random):
+    """
+    Creates a convex, roughly elliptical outline like a polygonised mask
+
+    Args:
+        x (float): Left edge
+        y (float): Top edge
+        width (float): Width of the outline
+        height (float): Height of the outline
+        points (int): Number of vertices
+        rng (Random): Random number generator
+
+    Returns:
+        list: A list of x, y coordinates
+    """
+    angles = np.linspace(0, 2 * np.pi, points, endpoint=False) + rng.uniform(0, np.pi)
+    return [[x + width / 2 * (1 + np.cos(angle)), y + height / 2 * (1 + np.sin(angle))] for angle in angles]
+
+
+def make_shelf(count, duplicate_rate=0.3, boxes=False, seed=0):
+    """
+    Creates detections of items on a shelf, some of which are detected twice
+
+    Args:
+        count (int): Number of detections
+        duplicate_rate (float): Chance of each item being detected again, slightly shifted
+        boxes (bool): Whether to create box outlines rather than mask outlines
+        seed (int): Random seed
+
+    Returns:
+        tuple: The outlines and scores of the detections
+    """
+    rng = random.Random(seed)
+    outlines = []
+    scores = []
+
+    while len(outlines) < count:
+        x, y = rng.uniform(0, 2000), rng.uniform(0, 1500)
+        width, height = rng.uniform(40, 200), rng.uniform(80, 300)
+
+        copies = 2 if rng.random() < duplicate_rate else 1
+        for _ in range(copies):
+            dx, dy = rng.uniform(-0.15, 0.15) * width, rng.uniform(-0.15, 0.15) * height
+
+            if boxes:
+                x1, y1, x2, y2 = x + dx, y + dy, x + dx + width, y + dy + height
+                outlines.append([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+            else:
+                outlines.append(make_outline(x + dx, y + dy, width, height, rng=rng))
+            scores.append(round(rng.uniform(0.4, 1), 2))
+
+    return outlines[:count], scores[:count]
+
+
+def make_words(count, seed=0):
+    """
+    Creates OCR words scattered over the shelf
+
+    Args:
+        count (int): Number of words
+        seed (int): Random seed
+
+    Returns:
+        OcrResult: The words, with integer coordinates as given by the OCR API
+    """
+    rng = random.Random(seed)
+    words = []
+
+    for index in range(count):
+        x, y = rng.randint(0, 2200), rng.randint(0, 1800)
+        width, height = rng.randint(10, 60), rng.randint(6, 20)
+        words.append((f"word{index}", [(x, y), (x + width, y), (x + width, y + height), (x, y + height)]))
+    return OcrResult.from_words(words)
+
+
+def locate_pairwise(outlines, texts):
+    """
+    Reference implementation testing every word against every outline with shapely
+
+    Args:
+        outlines (list): A list of outlines, each a list of x, y coordinates
+        texts (OcrResult): The detected words
+
+    Returns:
+        list: For each outline, the words inside it
+    """
+    ret = []
+
+    for outline in outlines:
+        item_poly = Polygon(outline)
+        ret.append([text for text, box in zip(texts.tokens, texts.boxes) if item_poly.contains(Polygon(box))])
+    return ret
+
+
+def reduce_pairwise(outlines, scores, threshold=0.8):
+    """
+    Reference implementation comparing every pair of outlines with shapely
+
+    Args:
+        outlines (list): A list of outlines, each a list of x, y coordinates
+        scores (list): The confidence score of each detection
+        threshold (float): The overlap above which two detections are duplicates
+
+    Returns:
+        list: Whether each detection is kept
+    """
+    keep = [True] * len(outlines)
+
+    for ((index_a, a), (index_b, b)) in itertools.combinations(enumerate(outlines), 2):
+        a_polygon = Polygon(a)
+        b_polygon = Polygon(b)
+
+        try:
+            intersection = a_polygon.intersection(b_polygon).area
+        except TopologicalError:
+            continue
+
+        overlap = intersection / min(a_polygon.area, b_polygon.area)
+
+        if overlap > threshold:
+            if scores[index_a] > scores[index_b]:
+                keep[index_b] = False
+            else:
+                keep[index_a] = False
+    return keep
+
+
+class TestMaskGeometry(unittest.TestCase):
+
+    def test_areas_match_shapely(self):
+        """
+        Test the shoelace areas equal the shapely polygon areas
+        """
+        outlines, _ = make_shelf(20)
+        expected = [Polygon(outline).area for outline in outlines]
+
+        np.testing.assert_allclose(get_areas(outlines), expected)
+
+    def test_box_intersections(self):
+        """
+        Test intersections of boxes, including touching and disjoint boxes
+        """
+        bounds = np.array([[0, 0, 10, 10], [5, 5, 15, 15], [10, 0, 20, 10], [30, 30, 40, 40]], dtype=float)
+        intersections = get_box_intersections(bounds)
+
+        self.assertEqual(intersections[0, 1], 25)
+        self.assertEqual(intersections[0, 2], 0)
+        self.assertEqual(intersections[1, 2], 25)
+        self.assertEqual(intersections[0, 3], 0)
+        self.assertEqual(intersections[2, 2], 100)
+
+    def test_same_decisions_as_pairwise(self):
+        """
+        Test the kept masks match those of the pairwise shapely comparison
+        """
+        for seed in range(20):
+            outlines, scores = make_shelf(40, duplicate_rate=0.5, seed=seed)
+
+            keep = suppress_overlaps(outlines, scores)
+            self.assertEqual(keep.tolist(), reduce_pairwise(outlines, scores), f"seed {seed}")
+
+    def test_same_decisions_for_boxes(self):
+        """
+        Test the kept boxes match those of the pairwise shapely comparison
+        """
+        for seed in range(20):
+            outlines, scores = make_shelf(40, duplicate_rate=0.5, boxes=True, seed=seed)
+
+            keep = suppress_overlaps(outlines, scores, is_box=[True] * len(outlines))
+            self.assertEqual(keep.tolist(), reduce_pairwise(outlines, scores), f"seed {seed}")
+
+    def test_chained_duplicates(self):
+        """
+        Test every pair is compared, even when one of them has already been dropped
+        """
+        box = [[0, 0], [10, 0], [10, 10], [0, 10]]
+        outlines = [box, box, box]
+
+        keep = suppress_overlaps(outlines, [0.5, 0.9, 0.7])
+        self.assertEqual(keep.tolist(), [False, True, False])
+
+        # Tied scores drop the first of the pair
+        keep = suppress_overlaps(outlines, [0.5, 0.5, 0.5])
+        self.assertEqual(keep.tolist(), reduce_pairwise(outlines, [0.5, 0.5, 0.5]))
+
+    def test_single_detection(self):
+        """
+        Test fewer than two detections are all kept
+        """
+        self.assertEqual(suppress_overlaps([], []).tolist(), [])
+        self.assertEqual(suppress_overlaps([[[0, 0], [1, 0], [1, 1]]], [0.5]).tolist(), [True])
+
+    def test_locate_words(self):
+        """
+        Test words are located in the same outlines as by shapely, apart from
+        words within a pixel of an outline's edge
+        """
+        outlines, _ = make_shelf(30, duplicate_rate=0.5)
+        texts = make_words(300)
+
+        located = locate_words(outlines, texts, max_size=4000)
+        expected = locate_pairwise(outlines, texts)
+
+        for outline, words, expected_words in zip(outlines, located, expected):
+            exterior = Polygon(outline).exterior
+
+            for text in set(words) ^ set(expected_words):
+                box = texts.boxes[texts.tokens.index(text)]
+                self.assertLessEqual(exterior.distance(Polygon(box)), 1.5, text)
+
+        self.assertGreater(sum(len(words) for words in expected), 0)
+
+    def test_locate_words_downscaled(self):
+        """
+        Test words well inside or outside an outline are located correctly in a
+        downscaled label image, and keep the order of the OCR result
+        """
+        outlines = [[[0, 0], [4000, 0], [4000, 3000], [0, 3000]], [[100, 100], [300, 100], [300, 300], [100, 300]]]
+        texts = OcrResult.from_words([
+            ("milk", [(150, 150), (200, 150), (200, 170), (150, 170)]),
+            ("semi", [(1000, 1000), (1100, 1000), (1100, 1040), (1000, 1040)]),
+            ("skimmed", [(250, 250), (400, 250), (400, 280), (250, 280)]),
+            ("pint", [(3900, 2900), (4100, 2900), (4100, 2950), (3900, 2950)])
+        ])
+
+        located = locate_words(outlines, texts, max_size=500)
+        self.assertEqual(located, [["milk", "semi", "skimmed"], ["milk"]])
+
+    def test_locate_words_many_outlines(self):
+        """
+        Test more outlines than fit in one 64 bit label plane
+        """
+        outlines = [[[x, 0], [x + 10, 0], [x + 10, 10], [x, 10]] for x in range(0, 1000, 10)]
+        texts = OcrResult.from_words((f"word{x}", [(x + 2, 2), (x + 8, 2), (x + 8, 8), (x + 2, 8)])
+                                     for x in range(0, 1000, 10))
+
+        located = locate_words(outlines, texts)
+        self.assertEqual(located, [[f"word{x}"] for x in range(0, 1000, 10)])
+
+    def test_locate_no_words(self):
+        """
+        Test images without words or without outlines
+        """
+        self.assertEqual(locate_words([[[0, 0], [1, 0], [1, 1]]], OcrResult()), [[]])
+        self.assertEqual(locate_words([], OcrResult.from_words([("milk", [(0, 0), (1, 0), (1, 1), (0, 1)])])), [])
+
+    def test_locate_repeated_words(self):
+        """
+        Test a word printed twice is located by each of its boxes, and words
+        without a box are inside no outline
+        """
+        outlines = [[[0, 0], [100, 0], [100, 100], [0, 100]], [[200, 0], [300, 0], [300, 100], [200, 100]]]
+        texts = OcrResult.from_words([
+            ("best", [(10, 10), (40, 10), (40, 20), (10, 20)]),
+            ("before", [(50, 10), (90, 10), (90, 20), (50, 20)]),
+            ("best", [(210, 10), (240, 10), (240, 20), (210, 20)]),
+            ("best", [(np.nan, np.nan)] * 4)
+        ])
+
+        located = locate_words(outlines, texts)
+        self.assertEqual(located, [["best", "before"], ["best"]])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
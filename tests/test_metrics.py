@@ -0,0 +1,70 @@
+import unittest
+
+from serving.metrics import Counter, Histogram, StageTimer, STAGE_LATENCY
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter_render(self):
+        """
+        Test counters are rendered per label in Prometheus text format
+        """
+        counter = Counter('qst_test_total', 'A test counter', ('result',))
+        counter.inc('hit')
+        counter.inc('hit')
+        counter.inc('miss', amount=3)
+
+        expected = ['# HELP qst_test_total A test counter',
+                    '# TYPE qst_test_total counter',
+                    'qst_test_total{result="hit"} 2',
+                    'qst_test_total{result="miss"} 3']
+        self.assertEqual(counter.render(), expected)
+
+    def test_histogram_buckets(self):
+        """
+        Test histogram buckets are cumulative, inclusive of their upper bound
+        """
+        histogram = Histogram('qst_test_seconds', 'A test histogram', ('stage',), buckets=(0.1, 1))
+        histogram.observe(0.05, 'ocr')
+        histogram.observe(0.1, 'ocr')
+        histogram.observe(5, 'ocr')
+
+        expected = ['# HELP qst_test_seconds A test histogram',
+                    '# TYPE qst_test_seconds histogram',
+                    'qst_test_seconds_bucket{stage="ocr",le="0.1"} 2',
+                    'qst_test_seconds_bucket{stage="ocr",le="1"} 2',
+                    'qst_test_seconds_bucket{stage="ocr",le="+Inf"} 3',
+                    'qst_test_seconds_sum{stage="ocr"} 5.15',
+                    'qst_test_seconds_count{stage="ocr"} 3']
+        self.assertEqual(histogram.render(), expected)
+
+    def test_const_labels(self):
+        """
+        Test constant labels are added ahead of the metric's own labels
+        """
+        counter = Counter('qst_test_total', 'A test counter', ('result',))
+        counter.inc('hit')
+        histogram = Histogram('qst_test_seconds', 'A test histogram', buckets=(1,))
+        histogram.observe(0.5)
+
+        self.assertEqual(counter.render({'worker': '12'})[2], 'qst_test_total{worker="12",result="hit"} 1')
+        self.assertEqual(histogram.render({'worker': '12'})[2:],
+                         ['qst_test_seconds_bucket{worker="12",le="1"} 1',
+                          'qst_test_seconds_bucket{worker="12",le="+Inf"} 1',
+                          'qst_test_seconds_sum{worker="12"} 0.5',
+                          'qst_test_seconds_count{worker="12"} 1'])
+
+    def test_stage_timer(self):
+        """
+        Test stage timings are observed and optionally stored
+        """
+        timings = {}
+        with StageTimer('test_stage', timings) as timer:
+            pass
+
+        self.assertEqual(timings['test_stage'], timer.elapsed)
+        self.assertEqual(STAGE_LATENCY.values[('test_stage',)][0][0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
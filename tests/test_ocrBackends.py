@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from detectors.ocrBackends import ReplayBackend, TesseractBackend
+from detectors.ocrResult import OcrResult
+from detectors.textDetect import TextDetector
+
+try:
+    import pytesseract
+    pytesseract.get_tesseract_version()
+    HAS_TESSERACT = True
+except Exception:
+    HAS_TESSERACT = False
+
+
+def make_label(text):
+    """
+    Draws a word on a white image
+
+    Args:
+        text (str): The word to draw
+
+    Returns:
+        bytes: The image encoded as a PNG
+    """
+    image = np.full((120, 400, 3), 255, np.uint8)
+    cv2.putText(image, text, (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+class TestOcrBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.texts = OcrResult(["heinz", "beanz", "415g", "heinz"],
+                               [[(10, 10), (60, 10), (60, 30), (10, 30)],
+                                [(70, 10), (130, 10), (130, 30), (70, 30)],
+                                [(10, 40), (50, 40), (50, 55), (10, 55)],
+                                [(10, 60), (60, 60), (60, 80), (10, 80)]],
+                               confidences=[0.9, 0.8, 0.95, 0.7], lines=[0, 0, 1, 2], blocks=[0, 0, 0, 1])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_replay(self):
+        """
+        Test recorded results are replayed unchanged, in the same order and
+        with repeated words
+        """
+        backend = ReplayBackend(self.folder)
+        backend.record(b'image', self.texts)
+        backend.record(b'blank', OcrResult())
+
+        texts = backend.annotate(b'image')
+        self.assertEqual(texts, self.texts)
+        self.assertEqual(list(texts), ["heinz", "beanz", "415g", "heinz"])
+        self.assertEqual(len(backend.annotate(b'blank')), 0)
+        self.assertTrue(os.path.exists(backend.get_path(b'image')))
+
+    def test_replay_missing(self):
+        """
+        Test images without a recorded result raise an error
+        """
+        backend = ReplayBackend(self.folder)
+
+        with self.assertRaises(FileNotFoundError):
+            backend.annotate(b'other image')
+
+    def test_replay_batch_missing(self):
+        """
+        Test an image without a recorded result only fails its own item of a
+        batch
+        """
+        backend = ReplayBackend(self.folder)
+        backend.record(b'image', self.texts)
+
+        results = backend.annotate_batch([b'image', b'other image'])
+        self.assertEqual(results[0], self.texts)
+        self.assertIsInstance(results[1], FileNotFoundError)
+
+    def test_text_detector_batches(self):
+        """
+        Test the text detector returns the result of each image from the
+        chosen backend, over several batches
+        """
+        text_detector = TextDetector("replay", folder=self.folder)
+        contents = [bytes([index]) for index in range(40)]
+
+        for index, content in enumerate(contents):
+            text_detector.backend.record(content, self.texts.select([index % len(self.texts)]))
+
+        results = text_detector.get_texts(contents)
+        self.assertEqual([texts.tokens for texts in results], [[self.texts.tokens[index % 4]] for index in range(40)])
+        self.assertEqual(text_detector.get_text(contents[3]), self.texts.select([3]))
+
+    def test_unknown_backend(self):
+        """
+        Test unknown backends are rejected
+        """
+        with self.assertRaises(ValueError):
+            TextDetector("unknown")
+
+    @unittest.skipUnless(HAS_TESSERACT, "Tesseract is not installed")
+    def test_tesseract(self):
+        """
+        Test a printed word is read by Tesseract, with its bounding box
+        """
+        texts = TesseractBackend().annotate(make_label("BEANZ"))
+
+        self.assertIn("beanz", texts.tokens)
+        (x1, y1), _, (x2, y2), _ = texts.boxes[texts.tokens.index("beanz")]
+        self.assertLess(x1, x2)
+        self.assertLess(y1, y2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,100 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from detectors.ocrInput import OcrInput
+from detectors.ocrResult import OcrResult
+
+
+def make_photo(width, height, seed=0):
+    """
+    Creates a noisy image that compresses like a photo
+
+    Args:
+        width (int): Width of the image
+        height (int): Height of the image
+        seed (int): Random seed
+
+    Returns:
+        tuple: The image and its bytes encoded as a high quality JPEG
+    """
+    rng = np.random.default_rng(seed)
+    image = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (5, 5), 0)
+    return image, cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 98])[1].tobytes()
+
+
+class TestOcrInput(unittest.TestCase):
+
+    def setUp(self):
+        self.image, self.content = make_photo(4000, 3000)
+
+    def test_downscale(self):
+        """
+        Test large images are downscaled to the maximum side and sent smaller
+        """
+        ocr_input = OcrInput.reduce(self.image, self.content, max_side=1000)
+        sent = cv2.imdecode(np.frombuffer(ocr_input.content, np.uint8), cv2.IMREAD_COLOR)
+
+        self.assertEqual(sent.shape[:2], (750, 1000))
+        self.assertLess(len(ocr_input.content), len(self.content))
+        self.assertEqual(ocr_input.get_stats()["saved_bytes"], len(self.content) - len(ocr_input.content))
+
+    def test_crop(self):
+        """
+        Test the crop covers every box and the margin around them
+        """
+        boxes = [[1000, 500, 1500, 1500], [1800, 800, 2000, 1200]]
+        ocr_input = OcrInput.reduce(self.image, self.content, boxes, max_side=4000, margin=0.1)
+        sent = cv2.imdecode(np.frombuffer(ocr_input.content, np.uint8), cv2.IMREAD_COLOR)
+
+        self.assertEqual(ocr_input.offset, (900, 400))
+        self.assertEqual(sent.shape[:2], (1200, 1200))
+        self.assertEqual(ocr_input.scale, 1)
+
+    def test_map_back(self):
+        """
+        Test word boxes in the sent image are mapped to the uploaded image
+        """
+        ocr_input = OcrInput.reduce(self.image, self.content, [[1000, 1000, 3000, 2000]], max_side=500, margin=0)
+        texts = OcrResult(["best", "before"], [[(0, 0), (50, 0), (50, 10), (0, 10)],
+                                               [(100, 100), (150, 100), (150, 110), (100, 110)]],
+                          confidences=[0.9, 0.8], lines=[0, 0], blocks=[0, 0])
+
+        mapped = ocr_input.map_back(texts)
+        self.assertEqual(mapped.tokens, ["best", "before"])
+        np.testing.assert_allclose(mapped.boxes[0], [(1000, 1000), (1200, 1000), (1200, 1040), (1000, 1040)])
+        np.testing.assert_allclose(mapped.boxes[1, 0], (1400, 1400))
+        np.testing.assert_allclose(mapped.confidences, texts.confidences)
+
+    def test_small_image_unchanged(self):
+        """
+        Test images that are neither cropped nor downscaled are sent as uploaded
+        """
+        image, content = make_photo(400, 300)
+        ocr_input = OcrInput.reduce(image, content)
+
+        self.assertIs(ocr_input.content, content)
+        texts = OcrResult(["milk"], [[(0, 0), (5, 0), (5, 5), (0, 5)]])
+        self.assertIs(ocr_input.map_back(texts), texts)
+
+    def test_boxes_off_image(self):
+        """
+        Test boxes outside the image fall back to sending the whole image
+        """
+        image, content = make_photo(400, 300)
+        ocr_input = OcrInput.reduce(image, content, [[500, 500, 600, 600]])
+
+        self.assertIs(ocr_input.content, content)
+        self.assertEqual(ocr_input.offset, (0, 0))
+
+    def test_undecodable(self):
+        """
+        Test images that could not be decoded are sent as uploaded
+        """
+        ocr_input = OcrInput.reduce(None, b'not an image')
+        self.assertEqual(ocr_input.content, b'not an image')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
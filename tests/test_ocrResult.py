@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+
+from detectors.ocrResult import OcrResult
+
+
+class TestOcrResult(unittest.TestCase):
+
+    def setUp(self):
+        self.texts = OcrResult.from_words([
+            ("best", [(10, 10), (40, 10), (40, 20), (10, 20)]),
+            ("before", [(50, 10), (90, 10), (90, 20), (50, 20)]),
+            ("12.08.20", [(10, 30), (70, 30), (70, 50), (10, 50)]),
+            ("best", [(10, 60), (40, 60), (40, 70), (10, 70)])
+        ])
+
+    def test_keeps_repeated_words(self):
+        """
+        Test repeated words keep their own boxes, in reading order
+        """
+        self.assertEqual(list(self.texts), ["best", "before", "12.08.20", "best"])
+        self.assertEqual(self.texts.boxes.shape, (4, 4, 2))
+        np.testing.assert_array_equal(self.texts.boxes[3, 0], [10, 60])
+
+    def test_geometry(self):
+        """
+        Test the centres and heights of the word boxes, including a rotated box
+        """
+        np.testing.assert_allclose(self.texts.get_centres()[2], [40, 40])
+        np.testing.assert_allclose(self.texts.get_heights(), [10, 10, 20, 10])
+
+        rotated = OcrResult(["milk"], [[(10, 0), (20, 10), (10, 20), (0, 10)]])
+        np.testing.assert_allclose(rotated.get_heights(), [np.sqrt(200)])
+
+    def test_select(self):
+        """
+        Test selecting words by mask keeps every column aligned
+        """
+        texts = OcrResult(self.texts.tokens, self.texts.boxes, confidences=[0.9, 0.8, 0.7, 0.6],
+                          lines=[0, 0, 1, 2], blocks=[0, 0, 0, 1])
+        selected = texts.select(texts.get_heights() > 15)
+
+        self.assertEqual(selected.tokens, ["12.08.20"])
+        np.testing.assert_array_equal(selected.boxes, texts.boxes[2:3])
+        np.testing.assert_allclose(selected.confidences, [0.7])
+        self.assertEqual(selected.lines.tolist(), [1])
+
+    def test_columns(self):
+        """
+        Test results convert to plain columns and back, including missing confidences
+        """
+        columns = self.texts.to_columns()
+
+        self.assertEqual(columns["confidences"], [None] * 4)
+        self.assertEqual(OcrResult.from_columns(columns), self.texts)
+
+    def test_empty(self):
+        """
+        Test a result without words
+        """
+        texts = OcrResult()
+
+        self.assertEqual(len(texts), 0)
+        self.assertEqual(texts.boxes.shape, (0, 4, 2))
+        self.assertEqual(OcrResult.from_words([]), texts)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
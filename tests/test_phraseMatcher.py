@@ -0,0 +1,193 @@
+import json
+import random
+import unittest
+
+from Levenshtein import distance
+
+from recognition.keywordIndex import KeywordIndex
+from recognition.phraseMatcher import PhraseMatcher, match_keywords
+from tests.test_keywordIndex import add_typo
+
+
+DICTIONARY_FILE = "resources/keywords.json"
+
+# Phrases added to the dictionary for the tests, as it holds none of its own
+PHRASES = {
+    "cereal": ["all bran", "special k", "corn flakes", "rice krispies"],
+    "milk": ["semi skimmed", "whole milk"],
+    "baked beans": ["baked beans", "heinz beanz", "tomato sauce"],
+    "tinned tomatoes": ["chopped tomatoes", "plum tomatoes"]
+}
+
+
+def load_keywords():
+    """
+    Returns:
+        dict: The keyword dictionary with the test phrases added
+    """
+    with open(DICTIONARY_FILE) as file:
+        keywords = json.load(file)
+
+    for category, phrases in PHRASES.items():
+        keywords[category] = keywords[category] + phrases
+    return keywords
+
+
+def is_close(phrase_word, word):
+    """
+    Args:
+        phrase_word (str): A word of a phrase
+        word (str): A cleaned word
+
+    Returns:
+        bool: Whether the word matches the phrase word, words of one character
+              only matching exactly
+    """
+    if len(phrase_word) == 1 or len(word) == 1:
+        return phrase_word == word
+    return distance(phrase_word, word) <= 1
+
+
+def match_windows(words, keywords):
+    """
+    Reference implementation comparing every window of words with every phrase
+
+    Args:
+        words (list): A list of cleaned words
+        keywords (dict): Keyword dictionary in the format {"class": ["word1", "two words"]}
+
+    Returns:
+        dict: The matched phrases of each category
+    """
+    matches = {}
+
+    for end in range(len(words)):
+        occurrences = []
+        for category_position, (category, items) in enumerate(keywords.items()):
+            for item_position, item in enumerate(items):
+                phrase = item.split()
+                window = words[end + 1 - len(phrase):end + 1]
+
+                if len(phrase) > 1 and len(window) == len(phrase) and \
+                        all(is_close(a, b) for a, b in zip(phrase, window)):
+                    occurrences.append((category_position, item_position, category, item))
+
+        # Phrases listed more than once are matched once per listing
+        for _, _, category, item in sorted(occurrences):
+            matches.setdefault(category, []).append(item)
+
+    return matches
+
+
+class TestPhraseMatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.keywords = load_keywords()
+        self.matcher = PhraseMatcher(self.keywords)
+
+    def test_matches_windows(self):
+        """
+        Test matches equal those of comparing every window of words, on streams
+        mixing phrases, misspelt phrases and other keywords
+        """
+        rng = random.Random(0)
+        items = [item for values in self.keywords.values() for item in values]
+
+        for _ in range(100):
+            words = []
+            for item in rng.sample(items, 15):
+                for word in item.split():
+                    words.append(add_typo(word, rng) if rng.random() < 0.3 else word)
+
+            self.assertEqual(self.matcher.match(words), match_windows(words, self.keywords))
+
+    def test_misspelt_phrase(self):
+        """
+        Test each word of a phrase may be a single character off
+        """
+        matches = self.matcher.match(["heinz", "bakd", "beams", "in", "tomato", "sauce"])
+        self.assertEqual(matches, {"baked beans": ["baked beans", "tomato sauce"]})
+
+        # "bean" is as close to "beans" as to "bran" and "beanz"
+        self.assertEqual(self.matcher.match(["baked", "bean"]), {"baked beans": ["baked beans"]})
+        self.assertEqual(self.matcher.match(["heinz", "bean"]), {"baked beans": ["heinz beanz"]})
+
+    def test_single_character_words(self):
+        """
+        Test words of one character are only matched exactly
+        """
+        self.assertEqual(self.matcher.match(["special", "k"]), {"cereal": ["special k"]})
+        self.assertEqual(self.matcher.match(["special", "x"]), {})
+        self.assertEqual(self.matcher.match(["special", "kk"]), {})
+
+    def test_words_in_between(self):
+        """
+        Test phrases are only matched when their words are next to each other
+        """
+        self.assertEqual(self.matcher.match(["baked", "milk", "beans"]), {})
+        self.assertEqual(self.matcher.match(["baked", "415g", "beans"]), {})
+
+    def test_overlapping_phrases(self):
+        """
+        Test overlapping phrases and phrases ending in another phrase are all matched
+        """
+        keywords = {
+            "sauce": ["red hot chilli", "hot chilli", "chilli sauce"],
+            "milk": ["semi skimmed", "skimmed milk"]
+        }
+        matcher = PhraseMatcher(keywords)
+
+        self.assertEqual(matcher.match(["red", "hot", "chilli", "sauce"]),
+                         {"sauce": ["red hot chilli", "hot chilli", "chilli sauce"]})
+        self.assertEqual(matcher.match(["semi", "skimmed", "milk"]), {"milk": ["semi skimmed", "skimmed milk"]})
+        self.assertEqual(matcher.match(["red", "red", "hot", "chilli"]), {"sauce": ["red hot chilli", "hot chilli"]})
+
+    def test_no_phrases(self):
+        """
+        Test a dictionary without multi-word keywords matches nothing
+        """
+        matcher = PhraseMatcher({"milk": ["milk", "semi"]})
+
+        self.assertEqual(matcher.match(["semi", "milk"]), {})
+        self.assertEqual(matcher.get_stats(), {"phrases": 0, "words": 0, "states": 1})
+
+    def test_find_positions(self):
+        """
+        Test each phrase found gives the words it was matched on
+        """
+        words = ["heinz", "baked", "beans", "in", "tomato", "sauce"]
+        found = self.matcher.find(words)
+
+        self.assertEqual(found, [(1, 3, "baked beans", "baked beans"), (4, 6, "baked beans", "tomato sauce")])
+
+
+class TestMatchKeywords(unittest.TestCase):
+
+    def setUp(self):
+        self.keywords = load_keywords()
+        self.keyword_index = KeywordIndex(self.keywords)
+        self.matcher = PhraseMatcher(self.keywords)
+
+    def test_phrase_in_place_of_words(self):
+        """
+        Test a phrase is counted instead of the single keywords of its words,
+        while the other words keep theirs
+        """
+        words = ["heinz", "baked", "beans", "in", "tomato", "sauce"]
+        matches = match_keywords(words, self.keyword_index, self.matcher)
+
+        expected = self.keyword_index.match(["heinz", "in"])
+        expected.setdefault("baked beans", []).extend(["baked beans", "tomato sauce"])
+        self.assertEqual(matches, expected)
+        self.assertNotIn("condiment", {category for category, keywords in matches.items() if "sauce" in keywords})
+
+    def test_without_phrases(self):
+        """
+        Test words outside any phrase are matched as single keywords
+        """
+        words = ["beans", "milk", "heinz"]
+        self.assertEqual(match_keywords(words, self.keyword_index, self.matcher), self.keyword_index.match(words))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,127 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from serving.resultCache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.version_file = os.path.join(self.directory, 'keywords.json')
+        self.db_path = os.path.join(self.directory, 'cache.db')
+
+        with open(self.version_file, 'w') as file:
+            file.write('{"milk": ["milk"]}')
+
+        self.cache = ResultCache([self.version_file], max_entries=2, ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key_depends_on_content_and_endpoint(self):
+        """
+        Test keys change with the image content and the endpoint only
+        """
+        key = self.cache.make_key(b'image', 'detection')
+
+        self.assertEqual(key, self.cache.make_key(b'image', 'detection'))
+        self.assertNotEqual(key, self.cache.make_key(b'other', 'detection'))
+        self.assertNotEqual(key, self.cache.make_key(b'image', 'object-detection'))
+
+    def test_hit_and_miss(self):
+        """
+        Test hit and miss counters
+        """
+        key = self.cache.make_key(b'image', 'detection')
+
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, {'expiry_date': None})
+        self.assertEqual(self.cache.get(key), {'expiry_date': None})
+
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_lru_eviction(self):
+        """
+        Test the least recently used result is evicted once the cache is full
+        """
+        keys = [self.cache.make_key(x, 'detection') for x in [b'a', b'b', b'c']]
+
+        self.cache.set(keys[0], 'a')
+        self.cache.set(keys[1], 'b')
+        self.cache.get(keys[0])
+        self.cache.set(keys[2], 'c')
+
+        self.assertEqual(self.cache.get(keys[0]), 'a')
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertEqual(self.cache.get_stats()['evictions'], 1)
+
+    def test_ttl(self):
+        """
+        Test results expire after the TTL
+        """
+        cache = ResultCache([self.version_file], ttl=0.01)
+        key = cache.make_key(b'image', 'detection')
+
+        cache.set(key, 'result')
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get(key))
+
+    def test_disk_tier(self):
+        """
+        Test results persist in SQLite between cache instances
+        """
+        cache = ResultCache([self.version_file], db_path=self.db_path)
+        key = cache.make_key(b'image', 'detection')
+        cache.set(key, [{'object_class': 'milk'}])
+
+        cache = ResultCache([self.version_file], db_path=self.db_path)
+
+        self.assertEqual(cache.get(key), [{'object_class': 'milk'}])
+        self.assertEqual(cache.get_stats()['disk_hits'], 1)
+
+    def test_expired_rows_deleted(self):
+        """
+        Test expired results are deleted from SQLite every purge_interval
+        writes and when the database is opened, without a model change
+        """
+        cache = ResultCache([self.version_file], ttl=0.01, db_path=self.db_path, purge_interval=3)
+        cache.set(cache.make_key(b'first', 'detection'), 'result')
+        cache.set(cache.make_key(b'second', 'detection'), 'result')
+        time.sleep(0.02)
+
+        cache.set(cache.make_key(b'third', 'detection'), 'result')
+        self.assertEqual(cache.get_stats()['disk_entries'], 1)
+        self.assertEqual(cache.get_stats()['expired'], 2)
+
+        time.sleep(0.02)
+        cache = ResultCache([self.version_file], db_path=self.db_path)
+        self.assertEqual(cache.get_stats()['disk_entries'], 0)
+
+    def test_invalidated_on_file_change(self):
+        """
+        Test results are dropped when a version file changes
+        """
+        cache = ResultCache([self.version_file], db_path=self.db_path)
+        key = cache.make_key(b'image', 'detection')
+        cache.set(key, 'result')
+
+        with open(self.version_file, 'w') as file:
+            file.write('{"milk": ["milk", "semi"]}')
+
+        new_key = cache.make_key(b'image', 'detection')
+
+        self.assertNotEqual(key, new_key)
+        self.assertIsNone(cache.get(new_key))
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.get_stats()['disk_entries'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,66 @@
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from serving.singleFlight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = SingleFlight()
+
+    def test_concurrent_calls_coalesced(self):
+        """
+        Test identical concurrent calls share a single execution
+        """
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(1)
+            return {'predicted_class': 'milk'}
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            leader = executor.submit(self.flights.do, 'image', work)
+            started.wait(1)
+            followers = [executor.submit(self.flights.do, 'image', work) for _ in range(2)]
+
+            # Wait for the followers to join before releasing the leader
+            while self.flights.get_stats()['coalesced'] < 2:
+                time.sleep(0.001)
+            release.set()
+
+            self.assertEqual(leader.result(), ({'predicted_class': 'milk'}, False))
+            for follower in followers:
+                self.assertEqual(follower.result(), ({'predicted_class': 'milk'}, True))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.flights.get_stats(), {'executed': 1, 'coalesced': 2, 'in_flight': 0})
+
+    def test_sequential_calls_not_coalesced(self):
+        """
+        Test calls made after a previous one finished are executed again
+        """
+        self.assertEqual(self.flights.do('image', lambda: 1), (1, False))
+        self.assertEqual(self.flights.do('image', lambda: 2), (2, False))
+
+    def test_exception_shared(self):
+        """
+        Test an exception is raised and the key is released
+        """
+        def fail():
+            raise ValueError('inference failed')
+
+        with self.assertRaises(ValueError):
+            self.flights.do('image', fail)
+
+        self.assertEqual(self.flights.get_stats()['in_flight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,202 @@
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from detectors.ocrBackends import OcrBackend, OcrError, ClientPool, GoogleVisionBackend
+from detectors.ocrResult import OcrResult
+from detectors.textDetect import TextDetector, OcrUnavailable
+from serving.deadline import Deadline
+
+try:
+    from google.api_core import exceptions
+    HAS_API_CORE = True
+except ImportError:
+    HAS_API_CORE = False
+
+
+class RecordingBackend(OcrBackend):
+    batches_requests = True
+
+    def __init__(self, fail=False, transient_failures=0):
+        self.batches = []
+        self.fail = fail
+        self.transient_failures = transient_failures
+        self.timeouts = []
+
+    def annotate(self, content, timeout=None):
+        return self.annotate_batch([content])[0]
+
+    def annotate_batch(self, contents, timeout=None):
+        self.batches.append(list(contents))
+        self.timeouts.append(timeout)
+        if self.fail:
+            raise RuntimeError('OCR request failed')
+        if len(self.batches) <= self.transient_failures:
+            raise OcrError('Service unavailable', transient=True)
+        return [OcrError('Bad image data.') if content == b"corrupt" else
+                OcrResult([content.decode()], [[(0, 0), (1, 0), (1, 1), (0, 1)]]) for content in contents]
+
+
+class TestTextDetector(unittest.TestCase):
+
+    def test_concurrent_images_batched(self):
+        """
+        Test images from concurrent callers share a request and each caller
+        gets the result of its own image
+        """
+        backend = RecordingBackend()
+        text_detector = TextDetector(backend, batch_wait=0.5)
+        contents = [f"image{index}".encode() for index in range(8)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(text_detector.get_text, contents))
+
+        self.assertEqual([texts.tokens for texts in results], [[f"image{index}"] for index in range(8)])
+        self.assertEqual(len(backend.batches), 1)
+        self.assertEqual(text_detector.get_stats()["scheduler"]["batch_sizes"], {8: 1})
+
+    def test_failed_image(self):
+        """
+        Test an image the backend could not read only fails its own caller,
+        not the other images in its batch
+        """
+        backend = RecordingBackend()
+        text_detector = TextDetector(backend, batch_wait=0.5)
+        contents = [b"milk", b"corrupt", b"bread"]
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(text_detector.get_text, content) for content in contents]
+
+        self.assertEqual(len(backend.batches), 1)
+        self.assertEqual(futures[0].result().tokens, ["milk"])
+        self.assertEqual(futures[2].result().tokens, ["bread"])
+        with self.assertRaisesRegex(OcrError, "Bad image data"):
+            futures[1].result()
+
+    def test_failed_image_in_batch_request(self):
+        """
+        Test an image the backend could not read in a batch request only
+        fails its own item, and an image failing with a transient error is
+        reported as unavailable
+        """
+        class PartlyUnavailableBackend(RecordingBackend):
+            def annotate_batch(self, contents, timeout=None):
+                results = super().annotate_batch(contents, timeout)
+                return [OcrError('Service unavailable', transient=True) if content == b"busy" else result
+                        for content, result in zip(contents, results)]
+
+        text_detector = TextDetector(PartlyUnavailableBackend(), batch_wait=0)
+        results = text_detector.get_texts([b"good1", b"corrupt", b"busy", b"good2"])
+
+        self.assertEqual(results[0].tokens, ["good1"])
+        self.assertEqual(results[3].tokens, ["good2"])
+        self.assertIsInstance(results[1], OcrError)
+        self.assertIsInstance(results[2], OcrUnavailable)
+
+    def test_window(self):
+        """
+        Test an image on its own is sent once the batching window has passed
+        """
+        backend = RecordingBackend()
+        text_detector = TextDetector(backend, batch_wait=0.05)
+
+        t_start = time.perf_counter()
+        texts = text_detector.get_text(b"alone")
+
+        self.assertEqual(texts.tokens, ["alone"])
+        self.assertGreaterEqual(time.perf_counter() - t_start, 0.04)
+        self.assertEqual(backend.batches, [[b"alone"]])
+
+    def test_failed_request(self):
+        """
+        Test a failed request raises in every caller of the batch
+        """
+        text_detector = TextDetector(RecordingBackend(fail=True), batch_wait=0.1)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(text_detector.get_text, content) for content in (b"a", b"b")]
+
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result()
+
+    def test_batching_off(self):
+        """
+        Test each image is sent on its own without a batching window
+        """
+        backend = RecordingBackend()
+        text_detector = TextDetector(backend, batch_wait=0)
+
+        self.assertIsNone(text_detector.batch_scheduler)
+        self.assertEqual(text_detector.get_text(b"milk").tokens, ["milk"])
+        self.assertEqual(backend.batches, [[b"milk"]])
+
+    def test_transient_error_retried(self):
+        """
+        Test an image is sent again after a transient error
+        """
+        backend = RecordingBackend(transient_failures=1)
+        text_detector = TextDetector(backend, batch_wait=0)
+
+        self.assertEqual(text_detector.get_text(b"milk").tokens, ["milk"])
+        self.assertEqual(backend.batches, [[b"milk"], [b"milk"]])
+        self.assertEqual(text_detector.get_stats()["hedging"]["image"]["retried"], 1)
+
+    def test_deadline_reaches_batched_call(self):
+        """
+        Test the time left to the request is passed on to the OCR call when
+        images are batched
+        """
+        backend = RecordingBackend()
+        text_detector = TextDetector(backend, batch_wait=0.01)
+
+        text_detector.get_text(b"milk", Deadline(2))
+        self.assertLessEqual(backend.timeouts[0], 2)
+
+    @unittest.skipUnless(HAS_API_CORE, "google-api-core is not installed")
+    def test_timeouts_exhausted(self):
+        """
+        Test Vision calls timing out on every attempt raise OcrUnavailable
+        """
+        class StalledVisionBackend(GoogleVisionBackend):
+            def annotate_batch(self, contents, timeout=None):
+                raise exceptions.DeadlineExceeded("Deadline Exceeded")
+
+        text_detector = TextDetector(StalledVisionBackend(ClientPool(object)), batch_wait=0.01)
+
+        with self.assertRaises(OcrUnavailable):
+            text_detector.get_text(b"milk", Deadline(5))
+        self.assertEqual(text_detector.get_stats()["hedging"]["image"]["retried"], 1)
+
+
+class TestClientPool(unittest.TestCase):
+
+    def test_shared_clients(self):
+        """
+        Test clients are created once and handed out in turn to every caller
+        """
+        pool = ClientPool(object, size=2)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            clients = list(executor.map(lambda _: pool.get(), range(8)))
+
+        self.assertEqual(len(set(map(id, clients))), 2)
+        self.assertEqual(pool.created, 2)
+
+    def test_new_process(self):
+        """
+        Test a forked process gets its own clients
+        """
+        pool = ClientPool(threading.Lock)
+        client = pool.get()
+
+        # As seen by a process forked after the clients were created
+        pool.pid = -1
+
+        self.assertIsNot(pool.get(), client)
+        self.assertEqual(pool.created, 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,82 @@
+import re
+import unittest
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from serving import tracing
+from serving.metrics import StageTimer
+from serving.tracing import Trace
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.trace = Trace('/detection')
+
+    def tearDown(self):
+        self.trace.detach()
+
+    def test_nested_spans(self):
+        """
+        Test spans opened inside one another form a tree
+        """
+        with tracing.span('object_inference'):
+            with StageTimer('detectron2_forward'):
+                pass
+            with StageTimer('analyse_text'):
+                pass
+        with tracing.span('expiry_inference'):
+            with tracing.span('find_month'):
+                pass
+
+        paths = [path for path, duration in self.trace.root.flatten()]
+        expected = ['object_inference',
+                    'object_inference.detectron2_forward',
+                    'object_inference.analyse_text',
+                    'expiry_inference',
+                    'expiry_inference.find_month']
+        self.assertEqual(paths, expected)
+
+    def test_spans_from_other_threads(self):
+        """
+        Test spans opened in a thread given a copy of the context join the trace
+        """
+        def ocr():
+            with StageTimer('ocr_call'):
+                pass
+
+        with tracing.span('object_inference'):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(contextvars.copy_context().run, ocr).result()
+
+        paths = [path for path, duration in self.trace.root.flatten()]
+        self.assertEqual(paths, ['object_inference', 'object_inference.ocr_call'])
+
+    def test_server_timing(self):
+        """
+        Test the Server-Timing header lists every span and the total
+        """
+        with tracing.span('object_inference'):
+            tracing.record_span('batch_forward', 0, 0.25)
+        self.trace.root.finish()
+
+        header = self.trace.server_timing()
+        entries = header.split(', ')
+
+        self.assertEqual(len(entries), 3)
+        self.assertRegex(entries[0], r'^object_inference;dur=\d+\.\d{2}$')
+        self.assertEqual(entries[1], 'object_inference.batch_forward;dur=250.00')
+        self.assertTrue(re.match(r'^total;dur=\d+\.\d{2}$', entries[2]))
+
+    def test_no_trace(self):
+        """
+        Test spans are ignored outside of a trace
+        """
+        self.trace.detach()
+
+        with tracing.span('object_inference') as span:
+            self.assertIsNone(span)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)